@@ -1,24 +1,39 @@
-import base64
 import logging
+import multiprocessing
 import os
 import sys
-import uuid
+import threading
+import urllib.parse
 from logging.handlers import RotatingFileHandler
 import requests
 from dotenv import load_dotenv
 from flask import Flask, abort, render_template, request, send_from_directory, jsonify, Response, send_file
+from werkzeug.http import parse_date, unquote_etag
 from flask_cors import CORS
-from collections import defaultdict
 import psycopg2
 from linebot.exceptions import InvalidSignatureError
 from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
-from rec_veg.rec_veg import VegetablePredictor
+from rec_veg.rec_veg import get_default_predictor
+from rec_veg.model_registry import get_class_names, get_model_stats
+from webhook_queue import WebhookQueue
+from db_pool import DatabaseUnavailableError, db_connection
+import recipe_repo
+import json_api
+from price_store import PRICE_WINDOWS, get_price_store
 from nutri_rec.nutri_rec import (
+    get_seasonal_vegetables,
     get_top_vegetables_by_nutrient,
     get_vegetables_by_name_or_alias,
+    parse_nutrient_criteria,
+    parse_nutrient_query,
+    rank_vegetables_by_nutrients,
+    sort_in_season_first,
 )
-import io
-import boto3
+from nutri_rec.seasonal import current_month, get_seasonal_index, month_bit, parse_season_query
+from nutri_rec.catalog import get_catalog
+import image_variants
+import object_store
+from object_cache import get_object_cache
 from linebot.v3.messaging.models import (
     CameraAction,
     CameraRollAction,
@@ -50,6 +65,10 @@ from linebot.v3.webhooks.models import PostbackEvent  # 匯入 PostbackEvent
 import json # 新增 json 模組
 
 
+# 推論子行程（INFER_PROCESSES）以 spawn 啟動時會重新 import 本檔，
+# 此時不可啟動 webhook 佇列或再次暖機模型
+IS_SPAWNED_CHILD = multiprocessing.parent_process() is not None
+
 # 新增日誌以確認 rec_veg 模組載入
 app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
@@ -75,9 +94,9 @@ app.logger.addHandler(handler)
 
 
 app.logger.info("Attempting to import rec_veg...")
-from rec_veg.rec_veg import rec_veg
+from rec_veg.rec_veg import recognize
+from rec_veg.result import InvalidImageError, RecognitionError
 app.logger.info("rec_veg imported successfully.")
-import pandas as pd
 
 NUTRIENT_DISPLAY_MAPPING = {
     "calories_kcal": "熱量",
@@ -108,86 +127,48 @@ UNIT_ABBREVIATION_TO_CHINESE = {
     "ug": "微克",
 }
 
-# === 新增：資料庫連線函式 ===
-def get_db_connection():
-    """建立並回傳 PostgreSQL 資料庫連線"""
-    try:
-        DATABASE_URL = os.getenv("DATABASE_URL")
-        app.logger.info(f"Connecting to database at {DATABASE_URL}")
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
-    except Exception as e:
-        app.logger.error(f"Database connection failed: {e}")
-        return None
-
 # 新增 API 端點來獲取所有蔬菜清單
 @app.route('/api/vegetables', methods=['GET'])
 def get_vegetables():
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({'error': '無法連接資料庫'}), 500
-
     try:
-        cur = conn.cursor()
-        # 從 basic_vege 表格中查詢 id 和 vege_name
-        cur.execute("SELECT id, vege_name FROM basic_vege ORDER BY id;")
-        vegetables = cur.fetchall()
+        with db_connection() as conn, conn.cursor() as cur:
+            # 從 basic_vege 表格中查詢 id 和 vege_name
+            cur.execute("SELECT id, vege_name FROM basic_vege ORDER BY id;")
+            vegetables = cur.fetchall()
 
         # 將查詢結果格式化為 JSON
         veg_list = [{'id': veg[0], 'name': veg[1]} for veg in vegetables]
         return jsonify(veg_list)
 
+    except DatabaseUnavailableError as e:
+        app.logger.error(f"Database connection failed: {e}")
+        return jsonify({'error': '無法連接資料庫'}), 500
     except Exception as e:
         app.logger.error(f"Error fetching vegetables: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 # ...
 def get_recipes_by_vege_id(vege_id):
-    """根據 vege_id 查詢食譜及其步驟"""
-    conn = get_db_connection()
-    if not conn:
-        return []
-    
-    recipes_data = []
+    """根據 vege_id 查詢食譜及其步驟（單一查詢），整理成 Flex Carousel 需要的格式"""
     try:
-        cur = conn.cursor()
-        
-        # 1. 查詢 main_recipe 資料表
-        cur.execute("SELECT id, recipe FROM main_recipe WHERE vege_id = %s LIMIT 10", (vege_id,))
-        main_recipes = cur.fetchall()
-        
-        # 定義一個預設圖片網址
-        default_image_url = "https://i.imgur.com/your-default-image.png"
-        
-        for recipe_id, recipe_name in main_recipes:
-            # 2. 針對每個食譜，查詢 recipe_steps
-            cur.execute("SELECT description FROM recipe_steps WHERE recipe_id = %s ORDER BY step_no ASC", (recipe_id,))
-            all_steps = cur.fetchall()
-            
-            steps_list = [step[0] for step in all_steps]
-            
-            recipe_description = steps_list[0] if steps_list else ""
-            
-            recipes_data.append({
-                "id": recipe_id,
-                "name": recipe_name,
-                "description": recipe_description,
-                "image_url": default_image_url, # 使用預設圖片網址
-                "steps": steps_list
-            })
-            
+        recipes = recipe_repo.get_recipes_by_vege_id(vege_id, limit=10)
     except (Exception, psycopg2.DatabaseError) as error:
         app.logger.error(f"Database query failed: {error}")
         return []
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
-            
+
+    # 定義一個預設圖片網址
+    default_image_url = "https://i.imgur.com/your-default-image.png"
+
+    recipes_data = []
+    for recipe in recipes:
+        steps_list = [step["description"] for step in recipe["steps"]]
+        recipes_data.append({
+            "id": recipe["recipe_id"],
+            "name": recipe["recipe_name"],
+            "description": steps_list[0] if steps_list else "",
+            "image_url": default_image_url, # 使用預設圖片網址
+            "steps": steps_list
+        })
     return recipes_data
 
 def create_recipe_flex_carousel(recipes_data):
@@ -241,96 +222,107 @@ def create_recipe_flex_carousel(recipes_data):
     )
 
 
-def _create_vegetable_flex_message(
-    veg_data_list, alt_text_prefix, is_nutrient_search=False
-):
-    bubbles = []
-    for veg_data in veg_data_list:
-        aliases_text = (
-            "別名：" + ", ".join(veg_data["aliases"])
-            if veg_data["aliases"]
-            else "無別名"
+def _is_missing(value):
+    """None 或 NaN（float / Decimal）視為缺值，取代 pd.isna 以免為此載入 pandas"""
+    if value is None:
+        return True
+    try:
+        return value != value  # 只有 NaN 不等於自己
+    except TypeError:
+        return False
+
+
+# Flex hero 使用的圖片寬度；LINE 的 Flex 圖片只支援 JPEG / PNG
+FLEX_HERO_WIDTH = int(os.getenv("FLEX_HERO_WIDTH", 720))
+
+
+def _hero_image_urls(filename):
+    """
+    回傳 (hero 圖片網址, 點擊後開啟的大圖網址)。
+    有 build_image_variants.py 產生的版本時使用 1.5:1 的縮圖，否則使用原圖。
+    """
+    base = f"{os.getenv('url_9000')}/{object_store.get_bucket()}/"
+    original = base + urllib.parse.quote(f"images/{filename}")
+    hero = image_variants.choose_variant(filename, width=FLEX_HERO_WIDTH)
+    if hero is None:
+        return original, original
+    largest = image_variants.choose_variant(filename)
+    return base + urllib.parse.quote(hero["key"]), base + urllib.parse.quote(largest["key"])
+
+
+def _build_vegetable_bubble_parts(veg_data):
+    """建立一種蔬菜的 Flex 元件（與查詢無關的部分），可重複使用於每次回覆"""
+    aliases_text = (
+        "別名：" + ", ".join(veg_data["aliases"])
+        if veg_data["aliases"]
+        else "無別名"
+    )
+    all_nutrients_detail = []
+    for i, (nutrient_key, nutrient_value) in enumerate(
+        veg_data["all_nutrients"].items()
+    ):
+        if i < 2:
+            continue
+        if i >= 7:
+            break
+        display_name = NUTRIENT_DISPLAY_MAPPING.get(nutrient_key, "")
+        if not display_name:
+            display_name = nutrient_key.split("_")[0].capitalize()
+
+        current_unit_abbreviation = (
+            nutrient_key.split("_")[-1] if "_" in nutrient_key else ""
+        )
+        current_unit = UNIT_ABBREVIATION_TO_CHINESE.get(
+            current_unit_abbreviation, ""
         )
-        all_nutrients_detail = []
-        for i, (nutrient_key, nutrient_value) in enumerate(
-            veg_data["all_nutrients"].items()
-        ):
-            if i < 2:
-                continue
-            if i >= 7:
-                break
-            display_name = NUTRIENT_DISPLAY_MAPPING.get(nutrient_key, "")
-            if not display_name:
-                display_name = nutrient_key.split("_")[0].capitalize()
-
-            current_unit_abbreviation = (
-                nutrient_key.split("_")[-1] if "_" in nutrient_key else ""
-            )
-            current_unit = UNIT_ABBREVIATION_TO_CHINESE.get(
-                current_unit_abbreviation, ""
-            )
 
-            if pd.isna(nutrient_value):
-                nutrient_value_display = "N/A"
-            else:
-                nutrient_value_display = (
-                    f"{nutrient_value:.1f}"
-                    if isinstance(nutrient_value, (int, float))
-                    else str(nutrient_value)
-                )
-            all_nutrients_detail.append(
-                f"{display_name}：{nutrient_value_display}{current_unit}"
+        if _is_missing(nutrient_value):
+            nutrient_value_display = "N/A"
+        else:
+            nutrient_value_display = (
+                f"{nutrient_value:.1f}"
+                if isinstance(nutrient_value, (int, float))
+                else str(nutrient_value)
             )
+        all_nutrients_detail.append(
+            f"{display_name}：{nutrient_value_display}{current_unit}"
+        )
 
-        all_nutrients_text = "營養資訊(每100 克可食部分)：\n" + "\n".join(
-            all_nutrients_detail
+    all_nutrients_text = "營養資訊(每100 克可食部分)：\n" + "\n".join(
+        all_nutrients_detail
+    )
+    name_text = FlexText(text=veg_data["chinese_name"], weight="bold", size="xl")
+    season_label = get_seasonal_index().label(veg_data["id"]) if "id" in veg_data else None
+    body_texts = [
+        FlexText(
+            text=aliases_text, size="sm", color="#aaaaaa", wrap=True, margin="sm"
+        ),
+    ]
+    if season_label:
+        body_texts.append(
+            FlexText(text=f"產季：{season_label}", size="sm", color="#aaaaaa", margin="sm")
         )
-        bubble_body_contents = [
-            FlexText(text=veg_data["chinese_name"], weight="bold", size="xl"),
-            FlexText(
-                text=aliases_text, size="sm", color="#aaaaaa", wrap=True, margin="sm"
-            ),
-            FlexText(
-                text=all_nutrients_text,
-                size="sm",
-                color="#555555",
-                wrap=True,
-                margin="md",
-            ),
-        ]
-        if (
-            is_nutrient_search
-            and "nutrient_name" in veg_data
-            and "nutrient_value" in veg_data
-            and "unit" in veg_data
-        ):
-            bubble_body_contents.insert(
-                1,
-                FlexText(
-                    text=f"查詢成分：{veg_data['nutrient_name']} {veg_data['nutrient_value']}{veg_data['unit']}",
-                    size="md",
-                    margin="md",
-                ),
-            )
+    body_texts += [
+        FlexText(
+            text=all_nutrients_text,
+            size="sm",
+            color="#555555",
+            wrap=True,
+            margin="md",
+        ),
+    ]
 
-        import urllib.parse
-        flex_image_url = os.getenv("url_9000")
-        web_url = os.getenv("url_5000")
-        veg_name = veg_data["chinese_name"]
-        image_filename = urllib.parse.quote(f"{veg_name}.jpg")
-        image_url = f"{flex_image_url}/veg-data-bucket/images/{image_filename}"
+    web_url = os.getenv("url_5000")
+    hero_url, full_url = _hero_image_urls(f"{veg_data['chinese_name']}.jpg")
 
-        bubble = FlexBubble(
-    direction="ltr",
-    hero=FlexImage(
-        url=image_url,
+    hero = FlexImage(
+        url=hero_url,
         size="full",
         aspect_ratio="1.5:1",
         aspect_mode="cover",
-        action=URIAction(uri=image_url, label="查看圖片"),
-    ),
-    body=FlexBox(layout="vertical", contents=bubble_body_contents),
-    footer=FlexBox(
+        action=URIAction(uri=full_url, label="查看圖片"),
+    )
+    footer = FlexBox(
         layout="vertical",
         spacing="sm",
         contents=[
@@ -352,8 +344,83 @@ def _create_vegetable_flex_message(
                 ),
             ) if 'id' in veg_data else None,
         ],
-    ),
-)
+    )
+    return {
+        "name_text": name_text,
+        "body_texts": body_texts,
+        "hero": hero,
+        "footer": footer,
+        # 沒有「查詢成分」時可直接使用的完整 bubble
+        "bubble": FlexBubble(
+            direction="ltr",
+            hero=hero,
+            body=FlexBox(layout="vertical", contents=[name_text] + body_texts),
+            footer=footer,
+        ),
+    }
+
+
+# 以 (vege_id, 目錄版本, 圖片 manifest 版本) 為鍵快取每種蔬菜的 Flex 元件；
+# 目錄或 manifest 更新後舊版本整批丟棄（hero 圖片網址取決於 manifest）
+_bubble_cache = {}
+_bubble_cache_version = None
+_bubble_cache_lock = threading.Lock()
+_bubble_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _get_vegetable_bubble_parts(veg_data):
+    if "id" not in veg_data:
+        return _build_vegetable_bubble_parts(veg_data)
+
+    global _bubble_cache_version
+    version = (get_catalog().version, image_variants.manifest_version())
+    key = veg_data["id"]
+    with _bubble_cache_lock:
+        if version != _bubble_cache_version:
+            _bubble_cache.clear()
+            _bubble_cache_version = version
+        parts = _bubble_cache.get(key)
+        if parts is not None:
+            _bubble_cache_stats["hits"] += 1
+            return parts
+        _bubble_cache_stats["misses"] += 1
+
+    parts = _build_vegetable_bubble_parts(veg_data)
+    with _bubble_cache_lock:
+        if version == _bubble_cache_version:
+            _bubble_cache[key] = parts
+    return parts
+
+
+def _create_vegetable_flex_message(
+    veg_data_list, alt_text_prefix, is_nutrient_search=False
+):
+    bubbles = []
+    for veg_data in veg_data_list:
+        parts = _get_vegetable_bubble_parts(veg_data)
+        if (
+            is_nutrient_search
+            and "nutrient_name" in veg_data
+            and "nutrient_value" in veg_data
+            and "unit" in veg_data
+        ):
+            # 只有「查詢成分」這一行會隨查詢變動，其餘元件直接沿用快取
+            header_text = FlexText(
+                text=f"查詢成分：{veg_data['nutrient_name']} {veg_data['nutrient_value']}{veg_data['unit']}",
+                size="md",
+                margin="md",
+            )
+            bubble = FlexBubble(
+                direction="ltr",
+                hero=parts["hero"],
+                body=FlexBox(
+                    layout="vertical",
+                    contents=[parts["name_text"], header_text] + parts["body_texts"],
+                ),
+                footer=parts["footer"],
+            )
+        else:
+            bubble = parts["bubble"]
         bubbles.append(bubble)
     if not bubbles:
         return TextMessage(
@@ -381,12 +448,59 @@ api_client = ApiClient(configuration)
 messaging_api = MessagingApi(api_client)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
+# WEBHOOK_ASYNC=0 時維持原本在請求內同步處理的行為
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "1") != "0"
+webhook_queue = WebhookQueue(handler.handle)
+if WEBHOOK_ASYNC and not IS_SPAWNED_CHILD:
+    webhook_queue.start()
+
+# 沒有指定產季的營養素查詢，本月當季蔬菜的分數加上此值（z-score 單位）；設為 0 時停用
+NUTRIENT_SEASON_BOOST = float(os.getenv("NUTRIENT_SEASON_BOOST", 0.5))
+
+
+def _season_boost_args():
+    """營養素排名的產季加權參數；停用時不篩選也不加權。"""
+    if NUTRIENT_SEASON_BOOST <= 0:
+        return {}
+    return {"season_month": current_month(), "season_boost": NUTRIENT_SEASON_BOOST}
+
+
+def _seasonal_recommendation(month, query):
+    """
+    產季查詢：沒有其他條件時列出當季蔬菜，否則在當季蔬菜中依營養素排名。
+    :return: (推薦結果, alt text)；其餘文字不是營養素查詢時推薦結果為 None。
+    """
+    month_text = f"{month}月" if month else "本月"
+    if not query:
+        return get_seasonal_vegetables(month), f"為您推薦{month_text}當季"
+    criteria = parse_nutrient_criteria(query)
+    if not criteria:
+        return None, None
+    label = f"{month_text}當季" + "".join(("高" if d > 0 else "低") + name for name, _, d in criteria)
+    return (
+        rank_vegetables_by_nutrients(criteria, label=label, season_month=month or current_month()),
+        f"為您推薦{month_text}當季 {query} 的蔬菜",
+    )
+
+
+# 產季索引很小，啟動時就載入，第一個產季查詢不必等待讀檔
+get_seasonal_index()
+
+
 @app.route("/callback", methods=["POST"])
 def callback():
     signature = request.headers["X-Line-Signature"]
     body = request.get_data(as_text=True)
     app.logger.info("Request body: " + body)
     app.logger.info("Request signature: " + signature)
+    if WEBHOOK_ASYNC:
+        # 只在請求內驗證簽章，事件交給背景工作執行緒處理後立即回應
+        if not handler.parser.signature_validator.validate(body, signature):
+            app.logger.error("Invalid signature. Request body: " + body)
+            abort(400)
+        if not webhook_queue.submit(body, signature):
+            abort(503)
+        return "OK"
     try:
         handler.handle(body, signature)
     except InvalidSignatureError:
@@ -440,41 +554,44 @@ def handle_postback(event):
                 )
             )
 
+IMAGE_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+IMAGE_DOWNLOAD_TIMEOUT = (3, 10)
+
+
+def download_message_content(message_id):
+    """以串流方式將 LINE 訊息內容下載到記憶體，回傳原始位元組（不寫入暫存檔）。"""
+    headers = {"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"}
+    url = f"https://api-data.line.me/v2/bot/message/{message_id}/content"
+    with requests.get(
+        url, headers=headers, stream=True, timeout=IMAGE_DOWNLOAD_TIMEOUT
+    ) as response:
+        if response.status_code != 200:
+            raise Exception(f"圖片下載失敗，狀態碼：{response.status_code}")
+        chunks = [
+            chunk
+            for chunk in response.iter_content(chunk_size=IMAGE_DOWNLOAD_CHUNK_SIZE)
+            if chunk
+        ]
+    return b"".join(chunks)
+
+
+# 信心度不夠高時，機率至少這麼高的候選類別才會列入「是 A 還是 B？」
+AMBIGUOUS_MIN_PROBABILITY = 0.1
+
+
 @handler.add(MessageEvent, message=ImageMessageContent)
 def handle_image_message(event):
     app.logger.info("進入 handle_image_message 函數 ")
-    image_filename = f"temp_image_{uuid.uuid4()}.jpg"
     try:
-        # ... (下載圖片和辨識的程式碼不變)
-        headers = {"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"}
-        url = f"https://api-data.line.me/v2/bot/message/{event.message.id}/content"
-        response = requests.get(url, headers=headers, stream=True)
-        if response.status_code != 200:
-            raise Exception(f"圖片下載失敗，狀態碼：{response.status_code}")
-        with open(image_filename, "wb") as f:
-            for chunk in response.iter_content():
-                f.write(chunk)
-        with open(image_filename, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-        recognition_result = rec_veg(encoded_string)
-        veg_name = "未知蔬菜"
-        confidence = 0.0
+        image_bytes = download_message_content(event.message.id)
+        result = None
         try:
-            lines = recognition_result.split("\n")
-            if len(lines) >= 2:
-                if "預測類別：" in lines[0]:
-                    veg_name = lines[0].replace("預測類別：", "").strip()
-                if "信心度：" in lines[1]:
-                    confidence_str = (
-                        lines[1].replace("信心度：", "").replace("%", "").strip()
-                    )
-                    confidence = float(confidence_str) / 100.0
-        except Exception as e:
-            app.logger.error(f"解析 recognition_result 失敗: {e}")
-            import traceback
-            app.logger.error(traceback.format_exc())
-            veg_name = "未知蔬菜"
-            confidence = 0.0
+            result = recognize(image_bytes)
+        except RecognitionError as e:
+            # 辨識失敗時與低信心度相同，請使用者換一張圖片
+            app.logger.error(f"圖片辨識失敗: {e}")
+        veg_name = result.label if result else "未知蔬菜"
+        confidence = result.probability if result else 0.0
         prefix_message_text = ""
         if confidence >= 0.8:
             prefix_message_text = f'哼哼 根據我的判斷 它就是"{veg_name}"!!'
@@ -487,10 +604,25 @@ def handle_image_message(event):
         if confidence >= 0.5:
             prefix_message_text += f"\n我有{confidence*100:.0f}%的信心"
 
+        # 信心度介於 0.5～0.8 時，以快速回覆讓使用者從前幾名候選中選擇
+        quick_reply = None
+        if 0.5 <= confidence < 0.8:
+            choices = [result.label] + [
+                c.label for c in result.alternatives(AMBIGUOUS_MIN_PROBABILITY)
+            ]
+            if len(choices) > 1:
+                prefix_message_text += "\n是" + "還是".join(f'"{c}"' for c in choices) + "？"
+                quick_reply = QuickReply(
+                    items=[
+                        QuickReplyItem(action=MessageAction(label=c[:20], text=c))
+                        for c in choices
+                    ]
+                )
+
         # 這裡的調用已移除 MinIO 檔案名稱參數
         vegetable_details = get_vegetables_by_name_or_alias(veg_name)
         
-        messages_to_reply = [TextMessage(text=prefix_message_text)]
+        messages_to_reply = [TextMessage(text=prefix_message_text, quick_reply=quick_reply)]
         if (
             confidence >= 0.5
             and vegetable_details
@@ -522,9 +654,6 @@ def handle_image_message(event):
                 ],
             )
         )
-    finally:
-        if os.path.exists(image_filename):
-            os.remove(image_filename)
 
 @handler.add(MessageEvent, message=TextMessageContent)
 def handle_text_message(event):
@@ -551,8 +680,21 @@ def handle_text_message(event):
             nutrient_input = text
             print(f"DEBUG: Processing nutrient input: '{nutrient_input}'")
 
-            # 這裡的調用已移除 MinIO 檔案名稱參數
-            recommendation_result = get_top_vegetables_by_nutrient(nutrient_input)
+            is_nutrient_search = True
+            # 「當季蔬菜」、「本月高鐵」這類產季查詢只在當季蔬菜中推薦
+            season_query = parse_season_query(nutrient_input)
+            # 「高鐵低鈉」這類組合查詢改用多營養素加權排名
+            nutrient_criteria = parse_nutrient_query(nutrient_input)
+            if season_query:
+                recommendation_result, recommendation_alt_text = _seasonal_recommendation(*season_query)
+                is_nutrient_search = bool(season_query[1])
+            elif nutrient_criteria:
+                # 沒有指定產季時不排除非當季蔬菜，只讓當季的排名稍微往前
+                recommendation_result = rank_vegetables_by_nutrients(nutrient_criteria, **_season_boost_args())
+                recommendation_alt_text = f"為您推薦 {nutrient_input} 的蔬菜"
+            else:
+                recommendation_result = get_top_vegetables_by_nutrient(nutrient_input, **_season_boost_args())
+                recommendation_alt_text = f"為您推薦 {nutrient_input} 含量最高的蔬菜"
             print(f"DEBUG: Recommendation result for '{nutrient_input}': {recommendation_result}")
             
             if recommendation_result and isinstance(recommendation_result, list):
@@ -567,8 +709,8 @@ def handle_text_message(event):
                 if valid_vegetables:
                     reply_message = _create_vegetable_flex_message(
                         valid_vegetables,
-                        f"為您推薦 {nutrient_input} 含量最高的蔬菜",
-                        is_nutrient_search=True,
+                        recommendation_alt_text,
+                        is_nutrient_search=is_nutrient_search,
                     )
                 else:
                     print(f"DEBUG: No valid data found for '{nutrient_input}' after filtering.")
@@ -579,7 +721,8 @@ def handle_text_message(event):
                 print(f"DEBUG: Vegetable search result for '{nutrient_input}': {vegetable_search_result}")
 
                 if vegetable_search_result and isinstance(vegetable_search_result, list):
-                    limited_vegetable_search_result = vegetable_search_result[:12]
+                    # 名稱相符的蔬菜中，當季的排在前面
+                    limited_vegetable_search_result = sort_in_season_first(vegetable_search_result)[:12]
                     valid_vegetables = []
                     for veg in limited_vegetable_search_result:
                         if veg and (veg.get('id') or veg.get('vege_id')) and veg.get('chinese_name') and veg.get('all_nutrients'):
@@ -610,122 +753,444 @@ def handle_text_message(event):
 
 
 
-@app.route("/api/image/<filename>")
-def get_image(filename):
-    # ... (MinIO 函式不變)
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=os.getenv("MINIO_ENDPOINT"),
-        aws_access_key_id=os.getenv("MINIO_ACCESS_KEY"),
-        aws_secret_access_key=os.getenv("MINIO_SECRET_KEY"),
-        config=boto3.session.Config(signature_version="s3v4"),
-    )
-    bucket = os.getenv("MINIO_BUCKET_NAME", "veg-data-bucket")
-    key = f"images/{filename}"
+# 瀏覽器與 LINE 取圖時可快取的秒數；之後以 ETag / Last-Modified 重新驗證
+OBJECT_CACHE_MAX_AGE = int(os.getenv("OBJECT_CACHE_MAX_AGE", 3600))
+# 本機的記憶體 / 磁碟快取；OBJECT_CACHE_ENABLED=0 時每次都向 MinIO 取檔
+OBJECT_CACHE_ENABLED = os.getenv("OBJECT_CACHE_ENABLED", "1") != "0"
+
+
+def _object_response(key, default_mimetype, mimetype_prefix, extra_headers=None):
+    """
+    回傳 MinIO 物件：先查本機快取，物件太大或停用快取時才直接從 MinIO 串流。
+    """
+    if OBJECT_CACHE_ENABLED:
+        try:
+            cached, file = get_object_cache().open(key)
+        except object_store.ObjectNotFoundError:
+            return "Not found", 404
+        except object_store.ObjectStoreError as e:
+            app.logger.error(f"MinIO 取檔失敗 key={key}: {e}")
+            return "Object storage unavailable", 502
+        if cached is not None:
+            return _cached_object_response(cached, file, default_mimetype, mimetype_prefix, extra_headers)
+    return _streamed_object_response(key, default_mimetype, mimetype_prefix, extra_headers)
+
+
+def _cached_object_response(cached, file, default_mimetype, mimetype_prefix, extra_headers=None):
+    """
+    以快取內容回應，If-None-Match、If-Modified-Since 與 Range 在本機處理。
+    磁碟上的物件以已開啟的 file 回應，檔案之後被淘汰也不影響這次回應。
+    """
+    content_type = cached.content_type
+    if not content_type or not content_type.startswith(mimetype_prefix):
+        content_type = default_mimetype
+    if cached.data is not None:
+        response = Response(cached.data, mimetype=content_type)
+    else:
+        response = send_file(file, mimetype=content_type, conditional=False, etag=False)
+        response.content_length = cached.size
+    if cached.etag:
+        response.set_etag(*unquote_etag(cached.etag))
+    if cached.last_modified:
+        response.last_modified = parse_date(cached.last_modified)
+    response.headers["Cache-Control"] = f"public, max-age={OBJECT_CACHE_MAX_AGE}"
+    response.headers.update(extra_headers or {})
+    return response.make_conditional(request, accept_ranges=True, complete_length=cached.size)
+
+
+def _streamed_object_response(key, default_mimetype, mimetype_prefix, extra_headers=None):
+    """
+    從 MinIO 串流回傳物件：Range、If-None-Match、If-Modified-Since 會轉給 MinIO，
+    並回傳 ETag、Last-Modified、Content-Range，讓瀏覽器與 LINE 重複使用快取。
+    """
     try:
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        return Response(obj["Body"].read(), mimetype="image/jpeg")
-    except Exception as e:
+        obj = object_store.get_object(key, request.headers)
+    except object_store.ObjectNotFoundError:
         return "Not found", 404
+    except object_store.ObjectPreconditionFailedError:
+        return "Precondition failed", 412
+    except object_store.ObjectRangeNotSatisfiableError:
+        return "Requested range not satisfiable", 416
+    except object_store.ObjectStoreError as e:
+        app.logger.error(f"MinIO 取檔失敗 key={key}: {e}")
+        return "Object storage unavailable", 502
+
+    headers = dict(obj["headers"])
+    headers["Cache-Control"] = f"public, max-age={OBJECT_CACHE_MAX_AGE}"
+    headers.update(extra_headers or {})
+    if obj["status"] == 304:
+        headers.pop("Content-Length", None)
+        return Response(status=304, headers=headers)
+
+    content_type = obj["content_type"]
+    if not content_type or not content_type.startswith(mimetype_prefix):
+        content_type = default_mimetype
+    response = Response(
+        object_store.iter_body(obj["body"]),
+        status=obj["status"],
+        headers=headers,
+        mimetype=content_type,
+        direct_passthrough=True,
+    )
+    # HEAD 請求或用戶端中斷時不會讀完 body，仍需關閉以歸還連線
+    response.call_on_close(obj["body"].close)
+    return response
+
+
+@app.route("/api/image/<filename>")
+def get_image(filename):
+    """
+    回傳蔬菜圖片。帶 ?w=寬度 時改回傳預先產生的 1.5:1 縮圖
+    （瀏覽器接受 WebP 時優先使用 WebP），沒有縮圖時退回原圖。
+    """
+    width = request.args.get("w", type=int)
+    if width:
+        accepts_webp = "image/webp" in request.headers.get("Accept", "")
+        variant = image_variants.choose_variant(
+            filename, width=width, formats=("webp", "jpeg") if accepts_webp else ("jpeg",)
+        )
+        if variant is not None:
+            return _object_response(
+                variant["key"], variant["content_type"], "image/", {"Vary": "Accept"}
+            )
+    return _object_response(f"images/{filename}", "image/jpeg", "image/")
 
 @app.route("/api/csv/<filename>")
 def get_csv(filename):
-    # ... (MinIO 函式不變)
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=os.getenv("MINIO_ENDPOINT"),
-        aws_access_key_id=os.getenv("MINIO_ACCESS_KEY"),
-        aws_secret_access_key=os.getenv("MINIO_SECRET_KEY"),
-        config=boto3.session.Config(signature_version="s3v4"),
-    )
-    bucket = os.getenv("MINIO_BUCKET_NAME", "veg-data-bucket")
-    key = filename
-    app.logger.info(f"嘗試從 MinIO 取得 bucket={bucket} key={key}")
-    try:
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        return Response(obj["Body"].read(), mimetype="text/csv")
-    except Exception as e:
-        print(f"MinIO 取檔失敗: {e}")
-        app.logger.error(f"MinIO 取檔失敗: {e}")
-        return "Not found", 404
+    app.logger.info(f"嘗試從 MinIO 取得 bucket={object_store.get_bucket()} key={filename}")
+    return _object_response(filename, "text/csv", "text/")
 
+# 與 rec_veg() 共用同一個預測器：同一份模型、同一個批次推論佇列
 try:
-    predictor = VegetablePredictor(
-        model_path="rec_veg/model_mnV2(best).keras", classes_path="rec_veg/classes.csv"
-    )
+    predictor = get_default_predictor()
 except Exception as e:
     print(f"無法啟動應用程式: {e}")
     predictor = None
 
+# 模型載入時機（MODEL_LOAD_MODE）：
+# - eager：啟動時載入 TensorFlow 與模型，完成後才開始服務
+# - background：立即開始服務，同時在背景執行緒暖機（預設）
+# - lazy：第一個圖片請求才載入，適合只處理文字與食譜的 worker
+MODEL_LOAD_MODES = ("eager", "background", "lazy")
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background").strip().lower()
+if MODEL_LOAD_MODE not in MODEL_LOAD_MODES:
+    app.logger.warning(f"未知的 MODEL_LOAD_MODE={MODEL_LOAD_MODE}，改用 background")
+    MODEL_LOAD_MODE = "background"
+
+if predictor and not IS_SPAWNED_CHILD:
+    if MODEL_LOAD_MODE == "eager":
+        try:
+            predictor.warm_up()
+        except Exception as e:
+            app.logger.error(f"模型載入失敗: {e}")
+    elif MODEL_LOAD_MODE == "background":
+        predictor.warm_up_async()
+app.logger.info(f"MODEL_LOAD_MODE={MODEL_LOAD_MODE}")
+
 @app.route("/predict", methods=["POST"])
 def handle_prediction():
     if not predictor:
         return jsonify({"error": "伺服器初始化失敗，模型未載入。"}), 500
     try:
+        # 也接受直接上傳的圖片位元組（Content-Type: image/*），省去 base64
+        if request.mimetype and request.mimetype.startswith("image/"):
+            prediction_result = predictor.predict_bytes(request.get_data())
+            return jsonify(prediction_result)
         data = request.get_json()
         if not data or "image" not in data:
             return jsonify({"error": "請求格式錯誤，未包含 'image' 欄位"}), 400
         base64_image = data["image"]
         prediction_result = predictor.predict(base64_image)
         return jsonify(prediction_result)
+    except InvalidImageError as e:
+        return jsonify({"error": f"無法辨識的圖片格式：{e}"}), 400
     except Exception as e:
         print(f"API 處理時發生錯誤: {e}")
         return jsonify({"error": "伺服器內部錯誤，無法辨識圖片"}), 500
 
 
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    就緒檢查：模型已暖機時回傳 200，否則 503。
+    lazy 模式的 worker 不需要先載入模型即可服務文字查詢，因此一律視為就緒。
+    """
+    model_status = predictor.warm_status() if predictor else {"state": "failed"}
+    model_ready = model_status["state"] == "ready"
+    ready = model_ready or (MODEL_LOAD_MODE == "lazy" and predictor is not None)
+    return jsonify({
+        "ready": ready,
+        "model_ready": model_ready,
+        "mode": MODEL_LOAD_MODE,
+        "model": model_status,
+    }), (200 if ready else 503)
+
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """回傳模型載入、批次推論佇列與 webhook 佇列等執行資訊"""
+    return jsonify({
+        "model": dict(get_model_stats(), warm=predictor.warm_status() if predictor else None),
+        "inference": predictor.batcher.stats() if predictor else None,
+        "inference_pool": predictor.pool_stats() if predictor else None,
+        "recognition_cache": predictor.cache_stats() if predictor else None,
+        "tta": predictor.tta_stats() if predictor else None,
+        "webhook": webhook_queue.stats(),
+        "catalog": get_catalog().stats(),
+        "object_cache": get_object_cache().stats() if OBJECT_CACHE_ENABLED else None,
+        "flex_cache": dict(_bubble_cache_stats, size=len(_bubble_cache), version=_bubble_cache_version),
+        "json_api": json_api.stats(),
+        "seasonal": get_seasonal_index().stats(),
+        "prices": _price_store_stats(),
+    })
+
+
+@app.route("/api/catalog/refresh", methods=["POST"])
+def refresh_catalog():
+    """重新載入記憶體中的蔬菜目錄；需在 X-Admin-Token 標頭帶入 ADMIN_TOKEN"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or request.headers.get("X-Admin-Token") != admin_token:
+        abort(403)
+    catalog = get_catalog()
+    if request.args.get("lazy") == "1":
+        # 只標記過期，下一次查詢時才重新載入
+        catalog.invalidate()
+        return jsonify({"invalidated": True, "version": catalog.version})
+    try:
+        catalog.refresh()
+    except Exception as e:
+        app.logger.error(f"Catalog refresh failed: {e}")
+        return jsonify({"error": str(e), "version": catalog.version}), 500
+    return jsonify(catalog.stats())
+
+
 @app.route('/api/recipes/<int:veg_id>', methods=['GET'])
 def get_recipes(veg_id):
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({'error': '無法連接資料庫'}), 500
-
     try:
-        cur = conn.cursor()
-        # 使用 JOIN 語法從 main_recipe 和 recipe_steps 兩個表格中獲取資料
-        # 注意：這裡的欄位名稱已經根據你提供的資訊進行了更新
-        cur.execute("""
-            SELECT
-                mr.id,
-                mr.recipe,
-                mr.vege_id,
-                rs.step_no,
-                rs.description
-            FROM main_recipe AS mr
-            JOIN recipe_steps AS rs ON mr.id = rs.recipe_id
-            WHERE mr.vege_id = %s
-            ORDER BY mr.id, rs.step_no;
-        """, (veg_id,))
-        rows = cur.fetchall()
-
-        if not rows:
+        # 與 LINE 查看食譜共用同一個查詢；只回傳有步驟的食譜
+        recipes = [
+            recipe for recipe in recipe_repo.get_recipes_by_vege_id(veg_id)
+            if recipe['steps']
+        ]
+
+        if not recipes:
             return jsonify({'message': '查無此蔬菜的食譜'}), 404
 
-        # 將資料處理成一個適合前端使用的 JSON 格式
-        recipes = defaultdict(lambda: {
-            'recipe_id': None,
-            'recipe_name': '',
-            'vege_id': None,
-            'steps': []
-        })
+        return jsonify(recipes)
+
+    except DatabaseUnavailableError as e:
+        app.logger.error(f"Database connection failed: {e}")
+        return jsonify({'error': '無法連接資料庫'}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# --- 網頁前端用的 JSON API ---
+# 支援 page / per_page 分頁、fields 欄位選擇；ETag 與 gzip / brotli 壓縮由 json_api 處理。
 
-        for row in rows:
-            recipe_id = row[0]
-            recipes[recipe_id]['recipe_id'] = row[0]
-            recipes[recipe_id]['recipe_name'] = row[1]
-            recipes[recipe_id]['vege_id'] = row[2]
-            recipes[recipe_id]['steps'].append({
-                'step_no': row[3],
-                'description': row[4]
-            })
+VEGETABLE_NAME_FIELDS = ("name", "english_name", "class_index")
+VEGETABLE_FIELDS = ("id", "name", "english_name", "aliases", "recognizable", "nutrients", "season", "months")
+RECIPE_FIELDS = ("id", "name", "url", "preview", "ingredients", "steps")
 
-        return jsonify(list(recipes.values()))
 
+@app.errorhandler(json_api.QueryError)
+def handle_query_error(e):
+    return jsonify({'error': str(e)}), 400
+
+
+def _vegetable_names():
+    """classes.csv 的中英文名稱；同一個中文名稱只保留第一筆"""
+    names = {}
+    for class_index, (english, chinese) in enumerate(get_class_names()):
+        names.setdefault(chinese, {"name": chinese, "english_name": english, "class_index": class_index})
+    return list(names.values())
+
+
+@app.route('/api/v1/vegetable-names', methods=['GET'])
+def api_vegetable_names():
+    """可辨識蔬菜的中英文名稱對照，取代瀏覽器下載 veg_name.csv"""
+    page, per_page = json_api.parse_pagination(request.args)
+    fields = json_api.parse_fields(request.args, VEGETABLE_NAME_FIELDS)
+    q = request.args.get("q", "").strip().lower()
+
+    def build():
+        items = _vegetable_names()
+        if q:
+            items = [i for i in items if q in i["name"].lower() or q in i["english_name"].lower()]
+        return json_api.paginate(items, page, per_page, fields)
+
+    # 類別檔只在部署時變更，直接以類別清單本身當作版本
+    return json_api.json_response(tuple(get_class_names()), build, max_age=3600)
+
+
+def _web_vegetable(veg, english_names, seasonal):
+    nutrients = {}
+    for column in NUTRIENT_DISPLAY_MAPPING:
+        value = veg["all_nutrients"].get(column)
+        if not _is_missing(value):
+            nutrients[column] = float(value)
+    return {
+        "id": veg["id"],
+        "name": veg["chinese_name"],
+        "english_name": english_names.get(veg["chinese_name"]),
+        "aliases": veg["aliases"],
+        "recognizable": veg["chinese_name"] in english_names,
+        "nutrients": nutrients,
+        "season": seasonal.label(veg["id"]),
+        "months": seasonal.months(veg["id"]),
+    }
+
+
+@app.route('/api/v1/vegetables', methods=['GET'])
+def api_vegetables():
+    """
+    記憶體中蔬菜目錄的分頁清單。
+    q：名稱或別名包含此字串；recognizable=1：只列出辨識模型認得的蔬菜；
+    month=1~12：只列出該月份當季的蔬菜；in_season=1：只列出本月當季的蔬菜。
+    """
+    page, per_page = json_api.parse_pagination(request.args)
+    fields = json_api.parse_fields(request.args, VEGETABLE_FIELDS)
+    q = request.args.get("q", "").strip()
+    recognizable = request.args.get("recognizable") == "1"
+    month = request.args.get("month", "").strip()
+    if month:
+        # 不使用 type=int：轉換失敗時 Flask 會默默忽略參數，改成回傳 400
+        if not month.isdigit() or not 1 <= int(month) <= 12:
+            raise json_api.QueryError("month 必須是 1 到 12 的整數")
+        month = int(month)
+    elif request.args.get("in_season") == "1":
+        month = current_month()
+    else:
+        month = None
+    seasonal = get_seasonal_index()
+    catalog = get_catalog()
+    try:
+        version = catalog.current_version()
+    except DatabaseUnavailableError as e:
+        app.logger.error(f"Database connection failed: {e}")
+        return jsonify({'error': '無法連接資料庫'}), 500
     except Exception as e:
+        app.logger.error(f"Catalog load failed: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
 
+    def build():
+        english_names = {i["name"]: i["english_name"] for i in _vegetable_names()}
+        items = [
+            _web_vegetable(veg, english_names, seasonal)
+            for veg in (catalog.search(q) if q else catalog.all())
+        ]
+        if recognizable:
+            items = [i for i in items if i["recognizable"]]
+        if month is not None:
+            items = [i for i in items if seasonal.mask(i["id"]) & month_bit(month)]
+        return json_api.paginate(items, page, per_page, fields)
+
+    # in_season=1 的結果隨月份改變，月份也列入版本
+    return json_api.json_response((version, month), build)
+
+
+def _recipe_snapshot():
+    try:
+        return recipe_repo.get_recipe_index().snapshot(), None
+    except object_store.ObjectNotFoundError:
+        return None, (jsonify({'error': '找不到食譜資料'}), 404)
+    except object_store.ObjectStoreError as e:
+        app.logger.error(f"Recipe CSV fetch failed: {e}")
+        return None, (jsonify({'error': '無法取得食譜資料'}), 502)
+
+
+@app.route('/api/v1/recipes', methods=['GET'])
+def api_recipes():
+    """
+    伺服器端解析後的食譜分頁清單，取代瀏覽器下載整份食譜 CSV。
+    q：食譜名稱或食材包含此字串；ingredient：食材名稱包含此字串。
+    """
+    page, per_page = json_api.parse_pagination(request.args)
+    fields = json_api.parse_fields(request.args, RECIPE_FIELDS)
+    q = request.args.get("q", "").strip().lower()
+    ingredient = request.args.get("ingredient", "").strip().lower()
+    snapshot, error = _recipe_snapshot()
+    if error:
+        return error
+    version, recipes = snapshot
+
+    def build():
+        items = recipes
+        if q:
+            items = [
+                r for r in items
+                if q in r["name"].lower() or any(q in i["name"].lower() for i in r["ingredients"])
+            ]
+        if ingredient:
+            items = [r for r in items if any(ingredient in i["name"].lower() for i in r["ingredients"])]
+        return json_api.paginate(items, page, per_page, fields)
+
+    return json_api.json_response(version, build)
+
+
+@app.route('/api/v1/recipes/<int:recipe_id>', methods=['GET'])
+def api_recipe(recipe_id):
+    """單一食譜；網頁在開啟食譜頁時才以 fields=steps 取得步驟"""
+    fields = json_api.parse_fields(request.args, RECIPE_FIELDS)
+    snapshot, error = _recipe_snapshot()
+    if error:
+        return error
+    version, recipes = snapshot
+    recipe = next((r for r in recipes if r["id"] == recipe_id), None)
+    if recipe is None:
+        return jsonify({'message': '查無此食譜'}), 404
+    return json_api.json_response(version, lambda: json_api.select_fields(recipe, fields))
+
+
+# --- 批發價格 ---
+
+def _price_store_stats():
+    store = get_price_store()
+    return store.stats() if store else None
+
+
+def _price_window_days():
+    days = request.args.get("days", 30, type=int)
+    if days not in PRICE_WINDOWS:
+        raise json_api.QueryError(f"days 必須是 {'、'.join(map(str, PRICE_WINDOWS))} 之一")
+    return days
+
+
+@app.route('/api/prices', methods=['GET'])
+def get_price_summaries():
+    """所有蔬菜最近 days（7、14、30）天的價格統計：平均、最高、最低、漲跌幅與最新價格"""
+    days = _price_window_days()
+    store = get_price_store()
+    if store is None:
+        return jsonify({'error': '尚無價格資料'}), 503
+
+    def build():
+        summaries = store.summaries(days)
+        return {"days": days, "unit": store.unit, "items": [summaries[i] for i in sorted(summaries)]}
+
+    return json_api.json_response(store.version, build)
+
+
+@app.route('/api/prices/<int:veg_id>', methods=['GET'])
+def get_prices(veg_id):
+    """單一蔬菜最近 days 天的價格統計與每日價格（只讀取該區間）"""
+    days = _price_window_days()
+    store = get_price_store()
+    if store is None:
+        return jsonify({'error': '尚無價格資料'}), 503
+    if not store.has(veg_id):
+        return jsonify({'message': '查無此蔬菜的價格資料'}), 404
+
+    def build():
+        return {
+            "vege_id": veg_id,
+            "days": days,
+            "unit": store.unit,
+            "summary": store.summary(veg_id, days),
+            "series": store.series(veg_id, days),
+        }
+
+    return json_api.json_response(store.version, build)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+量測 worker 啟動時的 import 時間與記憶體（每次都在新的子行程中 import）。
+
+預設比較：
+- import pandas（移除前每個 worker 都要付出的成本）
+- import nutri_rec.nutri_rec
+- import app
+並確認 import app 之後 sys.modules 中沒有 pandas。
+
+用法（於專案根目錄）：
+    python benchmarks/bench_import_time.py [--repeat 5] [--baseline-rev HEAD~1]
+--baseline-rev 會以 git worktree 取出指定版本，在相同條件下量測 import app 作為對照。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只為了讓 app 可以 import，不會真的連到 LINE / 資料庫
+DUMMY_ENV = {
+    "LINE_CHANNEL_ACCESS_TOKEN": "dummy",
+    "LINE_CHANNEL_SECRET": "dummy",
+    "WEBHOOK_ASYNC": "0",
+    "PYTHONDONTWRITEBYTECODE": "1",
+}
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "pandas_loaded": "pandas" in sys.modules,
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def measure(module, cwd, repeat):
+    env = dict(os.environ, **DUMMY_ENV)
+    env["PYTHONPATH"] = cwd
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", CHILD.format(module=module)],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} 失敗：\n{proc.stderr[-2000:]}")
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(r["seconds"] for r in runs),
+        "max_rss_mb": statistics.median(r["max_rss_mb"] for r in runs),
+        "pandas_loaded": any(r["pandas_loaded"] for r in runs),
+        "modules": runs[-1]["modules"],
+    }
+
+
+def _print_row(label, result):
+    print(
+        f"{label:<28}{result['seconds'] * 1000:>10.0f}ms{result['max_rss_mb']:>10.1f}MB"
+        f"{result['modules']:>10}{'是' if result['pandas_loaded'] else '否':>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline-rev", help="對照用的 git 版本（例如 HEAD~1）")
+    args = parser.parse_args()
+
+    print(f"{'項目':<28}{'import 時間':>12}{'max RSS':>12}{'模組數':>10}{'pandas':>8}")
+    _print_row("python（空白）", measure("sys", ROOT, args.repeat))
+    _print_row("pandas", measure("pandas", ROOT, args.repeat))
+    _print_row("nutri_rec.nutri_rec", measure("nutri_rec.nutri_rec", ROOT, args.repeat))
+    current = measure("app", ROOT, args.repeat)
+    _print_row("app", current)
+
+    if args.baseline_rev:
+        worktree = tempfile.mkdtemp(prefix="bench_import_")
+        try:
+            subprocess.run(
+                ["git", "worktree", "add", "--detach", worktree, args.baseline_rev],
+                cwd=ROOT, check=True, capture_output=True,
+            )
+            baseline = measure("app", worktree, args.repeat)
+            _print_row(f"app @ {args.baseline_rev}", baseline)
+            print(
+                f"\n啟動時間減少 {(baseline['seconds'] - current['seconds']) * 1000:.0f}ms，"
+                f"記憶體減少 {baseline['max_rss_mb'] - current['max_rss_mb']:.1f}MB"
+            )
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree],
+                cwd=ROOT, capture_output=True,
+            )
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    if current["pandas_loaded"]:
+        print("\n警告：import app 之後仍載入了 pandas")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+比較兩種前處理路徑在 veg_data/images 上的耗時與記憶體：
+- keras：load_img(target_size=(128, 128)) + img_to_array / 255.0（原本的做法）
+- fast：rec_veg.preprocess.load_image_array（JPEG draft 解碼 + 預先配置的 float32 緩衝區）
+
+每條路徑在獨立子行程中執行，以便分別量測峰值 RSS。
+
+用法（於專案根目錄）：
+    python benchmarks/bench_preprocess.py [--repeat 20] [--upscale 4]
+--upscale 會先把每張圖放大成暫存 JPEG，模擬手機拍攝的大尺寸照片。
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _load_payloads(paths):
+    payloads = []
+    for p in paths:
+        with open(p, "rb") as f:
+            payloads.append(f.read())
+    return payloads
+
+
+def run_path(name, paths, repeat):
+    """在目前行程中執行單一路徑，回傳統計結果。"""
+    from io import BytesIO
+
+    import numpy as np
+
+    if name == "keras":
+        from tensorflow.keras.utils import img_to_array, load_img
+
+        def preprocess(buf):
+            return img_to_array(load_img(BytesIO(buf), target_size=(128, 128))) / 255.0
+    else:
+        from rec_veg.preprocess import load_image_array
+
+        def preprocess(buf):
+            return load_image_array(BytesIO(buf))
+
+    payloads = _load_payloads(paths)
+    outputs = [preprocess(buf) for buf in payloads]  # 暖機
+    timings = []
+    for _ in range(repeat):
+        for buf in payloads:
+            start = time.perf_counter()
+            preprocess(buf)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "path": name,
+        "images": len(payloads),
+        "shape": list(outputs[0].shape),
+        "dtype": str(outputs[0].dtype),
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "total_ms": sum(timings),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "checksum": float(np.mean([o.mean() for o in outputs])),
+    }
+
+
+def make_upscaled(paths, factor, out_dir):
+    from PIL import Image
+
+    upscaled = []
+    for i, p in enumerate(paths):
+        img = Image.open(p).convert("RGB")
+        img = img.resize((img.width * factor, img.height * factor), Image.BILINEAR)
+        target = os.path.join(out_dir, f"{i}.jpg")
+        img.save(target, "JPEG", quality=90)
+        upscaled.append(target)
+    return upscaled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", default=os.path.join(ROOT, "veg_data", "images"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--upscale", type=int, default=1)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--paths-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.paths_file, "r", encoding="utf-8") as f:
+            paths = json.load(f)
+        print(json.dumps(run_path(args.child, paths, args.repeat)))
+        return
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.upscale > 1:
+            paths = make_upscaled(paths, args.upscale, tmp)
+        paths_file = os.path.join(tmp, "paths.json")
+        with open(paths_file, "w", encoding="utf-8") as f:
+            json.dump(paths, f)
+
+        results = []
+        for name in ("keras", "fast"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", name, "--paths-file", paths_file,
+                 "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True, cwd=ROOT,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for r in results:
+        print(
+            f"{r['path']:>6}: {r['images']} 張  shape={r['shape']} {r['dtype']}  "
+            f"p50 {r['p50_ms']:.2f}ms  p95 {r['p95_ms']:.2f}ms  "
+            f"峰值 RSS {r['max_rss_mb']:.1f}MB"
+        )
+    keras, fast = results
+    print(f"加速比 (p50)：{keras['p50_ms'] / fast['p50_ms']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+比較各推論後端在 veg_data/images 上的 top-1 類別、信心度與延遲。
+
+用法（於專案根目錄）：
+    python benchmarks/compare_backends.py [--backends keras,function,tflite] [--repeat 5]
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tensorflow.keras.utils import img_to_array, load_img  # noqa: E402
+
+from rec_veg.backends import BACKENDS, create_backend  # noqa: E402
+from rec_veg.model_registry import DEFAULT_MODEL_PATH, get_classes  # noqa: E402
+
+
+def load_images(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    arrays = [img_to_array(load_img(p, target_size=(128, 128))) / 255.0 for p in paths]
+    return paths, arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--images", default=os.path.join(ROOT, "veg_data", "images"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    classes = get_classes()
+    paths, arrays = load_images(args.images)
+    print(f"共 {len(paths)} 張圖片")
+
+    results = {}
+    for name in args.backends.split(","):
+        start = time.perf_counter()
+        backend = create_backend(name, DEFAULT_MODEL_PATH)
+        init_seconds = time.perf_counter() - start
+
+        preds = [backend(np.expand_dims(a, axis=0))[0] for a in arrays]  # 暖機兼取結果
+        latencies = []
+        for _ in range(args.repeat):
+            for a in arrays:
+                t0 = time.perf_counter()
+                backend(np.expand_dims(a, axis=0))
+                latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        results[name] = preds
+        print(
+            f"{name:>8}: 初始化 {init_seconds:.2f}s  "
+            f"p50 {statistics.median(latencies):.2f}ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}ms"
+        )
+
+    reference_name = next(iter(results))
+    reference = results[reference_name]
+    for name, preds in results.items():
+        if name == reference_name:
+            continue
+        same_top1 = 0
+        max_conf_diff = 0.0
+        for ref, pred in zip(reference, preds):
+            if np.argmax(ref) == np.argmax(pred):
+                same_top1 += 1
+            max_conf_diff = max(max_conf_diff, abs(float(np.max(ref)) - float(np.max(pred))))
+        print(
+            f"{name} vs {reference_name}: top-1 一致 {same_top1}/{len(paths)}，"
+            f"信心度最大差異 {max_conf_diff * 100:.4f}%"
+        )
+        for path, ref, pred in zip(paths, reference, preds):
+            if np.argmax(ref) != np.argmax(pred):
+                print(
+                    f"  不一致：{os.path.basename(path)} "
+                    f"{classes[int(np.argmax(ref))]} vs {classes[int(np.argmax(pred))]}"
+                )
+
+
+if __name__ == "__main__":
+    main()
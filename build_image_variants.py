@@ -0,0 +1,159 @@
+"""
+離線產生 Flex hero 與網頁用的圖片尺寸版本。
+
+對 veg_data/images 中的每張原圖：
+- 以中央裁切成 1.5:1（與 Flex hero 的 aspect_ratio 相同）
+- 依 --widths 縮成數種寬度（不放大；原圖不夠寬時只產生原圖寬度的版本）
+- 各輸出漸進式 JPEG 與 WebP
+並寫出 manifest.json 記錄每個版本的檔名、尺寸與大小。
+
+用法（於專案根目錄）：
+    python build_image_variants.py [--widths 240,480,720,1040] [--upload]
+--upload 會把所有版本與 manifest 上傳到 MinIO 的 images/variants/。
+"""
+import argparse
+import json
+import os
+import time
+
+from PIL import Image, ImageOps
+
+from image_variants import MANIFEST_NAME, VARIANT_PREFIX
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ASPECT_RATIO = 1.5
+FORMATS = {
+    # 格式: (副檔名, Content-Type, PIL 儲存參數)
+    "jpeg": (".jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+    "webp": (".webp", "image/webp", {"quality": 78, "method": 6}),
+}
+
+
+def crop_to_aspect(img, ratio=ASPECT_RATIO):
+    """中央裁切成 寬:高 = ratio，對應 Flex 的 aspect_mode="cover"。"""
+    width, height = img.size
+    if width / height > ratio:
+        new_width = round(height * ratio)
+        left = (width - new_width) // 2
+        return img.crop((left, 0, left + new_width, height))
+    new_height = round(width / ratio)
+    top = (height - new_height) // 2
+    return img.crop((0, top, width, top + new_height))
+
+
+def build_variants(source_path, output_dir, widths):
+    """產生一張原圖的所有版本，回傳 manifest 中該圖的項目。"""
+    filename = os.path.basename(source_path)
+    stem = os.path.splitext(filename)[0]
+    with Image.open(source_path) as img:
+        # 手機照片常以 EXIF 記錄旋轉方向，先轉正再裁切
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        cropped = crop_to_aspect(img)
+
+    # 不放大：只保留不超過裁切後寬度的尺寸，至少保留一個
+    usable = [w for w in widths if w <= cropped.width] or [cropped.width]
+    variants = []
+    for width in usable:
+        height = round(width / ASPECT_RATIO)
+        resized = cropped.resize((width, height), Image.LANCZOS)
+        for fmt, (ext, content_type, options) in FORMATS.items():
+            name = f"{stem}_{width}{ext}"
+            path = os.path.join(output_dir, name)
+            resized.save(path, fmt.upper(), **options)
+            variants.append({
+                "key": VARIANT_PREFIX + name,
+                "width": width,
+                "height": height,
+                "format": fmt,
+                "content_type": content_type,
+                "bytes": os.path.getsize(path),
+            })
+    return {
+        "source_bytes": os.path.getsize(source_path),
+        "source_size": list(img.size),
+        "variants": variants,
+    }
+
+
+def upload(output_dir, manifest):
+    from object_store import get_bucket, get_client
+
+    client = get_client()
+    bucket = get_bucket()
+    count = 0
+    for entry in manifest["images"].values():
+        for variant in entry["variants"]:
+            name = variant["key"][len(VARIANT_PREFIX):]
+            client.upload_file(
+                os.path.join(output_dir, name),
+                bucket,
+                variant["key"],
+                ExtraArgs={
+                    "ContentType": variant["content_type"],
+                    # 檔名含寬度，內容變更時重新產生即可，可長期快取
+                    "CacheControl": "public, max-age=604800",
+                },
+            )
+            count += 1
+    client.upload_file(
+        os.path.join(output_dir, MANIFEST_NAME),
+        bucket,
+        VARIANT_PREFIX + MANIFEST_NAME,
+        ExtraArgs={"ContentType": "application/json"},
+    )
+    print(f"已上傳 {count} 個版本與 manifest 到 {bucket}/{VARIANT_PREFIX}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=os.path.join(ROOT, "veg_data", "images"))
+    parser.add_argument("--output", default=os.path.join(ROOT, "veg_data", "image_variants"))
+    parser.add_argument("--widths", default="240,480,720,1040")
+    parser.add_argument("--upload", action="store_true", help="上傳到 MinIO")
+    args = parser.parse_args()
+
+    widths = sorted({int(w) for w in args.widths.split(",") if w.strip()})
+    os.makedirs(args.output, exist_ok=True)
+    manifest = {
+        "version": 1,
+        "generated_at": int(time.time()),
+        "aspect_ratio": "1.5:1",
+        "widths": widths,
+        "images": {},
+    }
+
+    total_source = total_hero = 0
+    for filename in sorted(os.listdir(args.source)):
+        if not filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        try:
+            entry = build_variants(os.path.join(args.source, filename), args.output, widths)
+        except OSError as e:
+            print(f"略過 {filename}：{e}")
+            continue
+        manifest["images"][filename] = entry
+        jpeg_sizes = {v["width"]: v["bytes"] for v in entry["variants"] if v["format"] == "jpeg"}
+        hero_width = min((w for w in jpeg_sizes if w >= 720), default=max(jpeg_sizes))
+        total_source += entry["source_bytes"]
+        total_hero += jpeg_sizes[hero_width]
+        print(
+            f"{filename}: {entry['source_bytes'] / 1024:.0f}KB -> "
+            + ", ".join(
+                f"{v['width']}{'w' if v['format'] == 'jpeg' else 'w.webp'} {v['bytes'] / 1024:.0f}KB"
+                for v in entry["variants"]
+            )
+        )
+
+    with open(os.path.join(args.output, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    print(
+        f"\n共 {len(manifest['images'])} 張；原圖合計 {total_source / 1024 / 1024:.1f}MB，"
+        f"720w JPEG 合計 {total_hero / 1024 / 1024:.1f}MB"
+    )
+
+    if args.upload:
+        upload(args.output, manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_last_used = {}
+
+
+class DatabaseUnavailableError(Exception):
+    """無法從連線池取得可用的資料庫連線。"""
+
+
+def _settings():
+    return {
+        "minconn": int(os.getenv("DB_POOL_MIN", 1)),
+        "maxconn": int(os.getenv("DB_POOL_MAX", 10)),
+        # 等待空閒連線的秒數
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", 5)),
+        # 連線閒置超過此秒數，借出前先以 SELECT 1 確認仍可使用
+        "check_idle": float(os.getenv("DB_POOL_CHECK_IDLE", 30)),
+    }
+
+
+def get_pool():
+    """取得行程內共用的 ThreadedConnectionPool，第一次呼叫時才建立。"""
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = _settings()
+                try:
+                    _pool = pool.ThreadedConnectionPool(
+                        settings["minconn"],
+                        settings["maxconn"],
+                        dsn=os.getenv("DATABASE_URL"),
+                    )
+                except psycopg2.Error as e:
+                    raise DatabaseUnavailableError(f"Database connection failed: {e}") from e
+                _slots = threading.BoundedSemaphore(settings["maxconn"])
+                logger.info(
+                    "Database pool created (min=%s, max=%s)",
+                    settings["minconn"], settings["maxconn"],
+                )
+    return _pool
+
+
+def _is_healthy(conn, check_idle):
+    if conn.closed:
+        return False
+    if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_used = _last_used.get(id(conn))
+    # 剛建立的連線或最近才用過的連線不必再多一次來回
+    if last_used is None or time.monotonic() - last_used < check_idle:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def db_connection():
+    """
+    從連線池借出一條連線，離開 with 區塊時自動歸還。
+    成功時 commit，發生例外時 rollback；壞掉的連線會被關閉並從池中移除。
+    """
+    db_pool = get_pool()
+    settings = _settings()
+    if not _slots.acquire(timeout=settings["timeout"]):
+        raise DatabaseUnavailableError("Database pool exhausted")
+    conn = None
+    try:
+        # 借出前做健康檢查，壞掉的連線丟棄後再借一次
+        for _ in range(2):
+            try:
+                conn = db_pool.getconn()
+            except psycopg2.Error as e:
+                raise DatabaseUnavailableError(f"Database connection failed: {e}") from e
+            if _is_healthy(conn, settings["check_idle"]):
+                break
+            db_pool.putconn(conn, close=True)
+            _last_used.pop(id(conn), None)
+            conn = None
+        if conn is None:
+            raise DatabaseUnavailableError("No healthy database connection available")
+
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+    finally:
+        if conn is not None:
+            _last_used[id(conn)] = time.monotonic()
+            broken = bool(conn.closed)
+            if broken:
+                _last_used.pop(id(conn), None)
+            db_pool.putconn(conn, close=broken)
+        _slots.release()
+
+
+def close_pool():
+    """關閉所有連線（例如測試或行程結束時）。"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# build_image_variants.py 的輸出位置：本機資料夾與 MinIO 上的前綴相同
+VARIANT_PREFIX = "images/variants/"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_MANIFEST_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "veg_data", "image_variants", MANIFEST_NAME
+)
+
+_EMPTY_MANIFEST = {"images": {}}
+
+# (版本, manifest)：版本為 ("file", mtime)、("minio", ETag)，沒有 manifest 時為 None；更新時整個 tuple 一次替換
+_state = None
+_next_check = 0.0
+_manifest_lock = threading.Lock()
+
+
+def _check_interval():
+    return float(os.getenv("IMAGE_MANIFEST_CHECK_INTERVAL", 60))
+
+
+def _retry_interval():
+    """manifest 不存在或讀取失敗時，較快重試（例如啟動時 MinIO 短暫無法連線）。"""
+    return float(os.getenv("IMAGE_MANIFEST_RETRY_INTERVAL", 10))
+
+
+def _load_manifest(current):
+    """
+    先讀本機的 manifest，沒有時再從 MinIO 讀取（以 If-None-Match 確認是否更新）。
+    :param current: 目前的 (版本, manifest)，沒有時為 None。
+    :return: ((版本, manifest), 下次檢查前等待的秒數)；讀取失敗時保留 current，沒有 current 時為空的 manifest。
+    """
+    fallback = current or (None, _EMPTY_MANIFEST)
+    version = current[0] if current else None
+    path = os.getenv("IMAGE_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if mtime is not None:
+        if version == ("file", mtime):
+            return current, _check_interval()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return (("file", mtime), json.load(f)), _check_interval()
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot read image manifest %s: %s", path, e)
+            return fallback, _retry_interval()
+
+    import object_store
+
+    try:
+        etag = version[1] if version and version[0] == "minio" else None
+        obj = object_store.get_object(VARIANT_PREFIX + MANIFEST_NAME, {"If-None-Match": etag} if etag else None)
+        if obj["status"] == 304:
+            return current, _check_interval()
+        body = obj["body"]
+        try:
+            manifest = json.loads(body.read())
+        finally:
+            body.close()
+        return (("minio", obj["headers"].get("ETag")), manifest), _check_interval()
+    except object_store.ObjectNotFoundError:
+        logger.info("No image variant manifest available, serving originals")
+        return (None, _EMPTY_MANIFEST), _retry_interval()
+    except Exception as e:
+        logger.warning("Cannot load image variant manifest: %s", e)
+        return fallback, _retry_interval()
+
+
+def _refresh(force=False):
+    # 呼叫端須持有 _manifest_lock
+    global _state, _next_check
+    state, wait = _load_manifest(None if force else _state)
+    if state is not _state and state[0] is not None:
+        logger.info("Image variant manifest loaded (%s): %d images", state[0], len(state[1].get("images", {})))
+    _state = state
+    _next_check = time.time() + wait
+
+
+def _refresh_in_background():
+    try:
+        _refresh()
+    finally:
+        _manifest_lock.release()
+
+
+def _current_state():
+    """
+    取得行程內共用的 (版本, manifest)，第一次呼叫時才載入。
+    之後每 IMAGE_MANIFEST_CHECK_INTERVAL 秒（失敗時 IMAGE_MANIFEST_RETRY_INTERVAL 秒）
+    在背景執行緒重新檢查，檢查期間仍回傳目前的 manifest，請求不必等待 MinIO。
+    """
+    if _state is None:
+        with _manifest_lock:
+            if _state is None:
+                _refresh()
+    elif time.time() >= _next_check and _manifest_lock.acquire(blocking=False):
+        if time.time() >= _next_check:
+            threading.Thread(
+                target=_refresh_in_background, name="image-manifest-refresh", daemon=True
+            ).start()
+        else:
+            _manifest_lock.release()
+    return _state
+
+
+def get_manifest():
+    return _current_state()[1]
+
+
+def manifest_version():
+    """目前 manifest 的版本，manifest 更新時改變；可作為快取鍵的一部分。"""
+    return _current_state()[0]
+
+
+def reload_manifest():
+    """立即重新載入 manifest（不使用條件式請求）。"""
+    with _manifest_lock:
+        _refresh(force=True)
+    return _state[1]
+
+
+def choose_variant(filename, width=None, formats=("jpeg",)):
+    """
+    為原始圖檔挑選最適合的尺寸版本。
+    :param filename: 原始檔名，例如 "紅蔥頭.jpg"。
+    :param width: 需要的顯示寬度（像素）；挑寬度不小於此值的最小版本，None 時取最大版本。
+    :param formats: 可接受的格式，依偏好排序，例如 ("webp", "jpeg")。
+    :return: 版本資訊 dict（key、width、height、format、bytes），沒有可用版本時回傳 None。
+    """
+    entry = get_manifest().get("images", {}).get(filename)
+    if not entry:
+        return None
+    for fmt in formats:
+        variants = sorted(
+            (v for v in entry["variants"] if v["format"] == fmt), key=lambda v: v["width"]
+        )
+        if not variants:
+            continue
+        if width is None:
+            return variants[-1]
+        for variant in variants:
+            if variant["width"] >= width:
+                return variant
+        return variants[-1]
+    return None
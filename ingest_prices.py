@@ -0,0 +1,198 @@
+"""
+將每日批發價格 CSV 匯入 PriceStore（veg_data/prices/prices.npz）。
+
+每個 CSV 一列一筆交易行情，預設欄位與農產品批發市場交易行情相同：
+    交易日期（113.07.21、2024-07-21 或 20240721）、作物名稱、平均價、交易量
+同一種蔬菜同一天在多個市場的行情，以交易量加權平均成當日價格（沒有交易量時取簡單平均）。
+作物名稱以蔬菜目錄（資料庫）的名稱與別名對應到 vege_id；無法連接資料庫時改用 fresh_month.csv 的名稱。
+「甘藍-初秋」這類名稱找不到時，再以「-」前的品名比對。CSV 已有 vege_id 欄位時可用 --id-column 直接指定。
+
+用法（於專案根目錄）：
+    python ingest_prices.py prices/*.csv [--merge] [--upload]
+--merge 會保留既有 prices.npz 的資料，只覆寫這次匯入的日期；--upload 會把結果上傳到 MinIO。
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import date
+
+import numpy as np
+
+from price_store import DEFAULT_PRICE_STORE_PATH, PRICE_STORE_KEY, PriceStore, day_number
+
+
+def parse_trade_date(text):
+    """解析民國或西元日期，回傳自 1970-01-01 起的天數；無法解析時回傳 None。"""
+    text = text.strip()
+    try:
+        if text.isdigit() and len(text) in (7, 8):
+            # 1130721（民國）或 20240721（西元）
+            year, month, day = int(text[:-4]), int(text[-4:-2]), int(text[-2:])
+        else:
+            year, month, day = (int(p) for p in text.replace("/", "-").replace(".", "-").split("-"))
+        if year < 1911:
+            year += 1911
+        return day_number(date(year, month, day))
+    except ValueError:
+        return None
+
+
+def parse_number(text):
+    try:
+        return float(text.replace(",", "").strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def load_name_mapping():
+    """作物名稱 -> vege_id；優先使用資料庫中的名稱與別名。"""
+    try:
+        from nutri_rec.catalog import get_catalog
+
+        mapping = {}
+        for veg in get_catalog().all():
+            for name in [veg["chinese_name"]] + veg["aliases"]:
+                if name:
+                    mapping.setdefault(name.strip(), veg["id"])
+        return mapping
+    except Exception as e:
+        print(f"無法載入蔬菜目錄（{e}），改用 fresh_month.csv 的名稱對應")
+        from nutri_rec.seasonal import SeasonalIndex
+
+        return {name: vege_id for vege_id, name in SeasonalIndex().names.items() if name}
+
+
+def resolve_vege_id(name, mapping):
+    name = name.strip()
+    if name in mapping:
+        return mapping[name]
+    base = name.split("-")[0].strip()
+    return mapping.get(base)
+
+
+def read_price_rows(paths, args, mapping):
+    """
+    讀取所有 CSV，依 (vege_id, 日期) 累計。
+    :return: ({(vege_id, day): [Σ價格×交易量, Σ交易量, Σ價格, 筆數]}, 無法對應的作物名稱計數)
+    """
+    totals = defaultdict(lambda: [0.0, 0.0, 0.0, 0])
+    unmapped = Counter()
+    for path in paths:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                day = parse_trade_date(row.get(args.date_column) or "")
+                price = parse_number(row.get(args.price_column))
+                if day is None or price is None or price <= 0:
+                    continue
+                if args.id_column:
+                    try:
+                        vege_id = int(row[args.id_column])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                else:
+                    name = row.get(args.name_column) or ""
+                    vege_id = resolve_vege_id(name, mapping)
+                    if vege_id is None:
+                        unmapped[name.strip()] += 1
+                        continue
+                volume = parse_number(row.get(args.volume_column)) if args.volume_column else None
+                total = totals[(vege_id, day)]
+                if volume and volume > 0:
+                    total[0] += price * volume
+                    total[1] += volume
+                total[2] += price
+                total[3] += 1
+    return totals, unmapped
+
+
+def build_store(totals, unit, base=None):
+    """把累計結果排成連續日曆的 (蔬菜數, 天數) 陣列；base 為既有資料時先放入舊值再覆寫。"""
+    days = {day for _, day in totals}
+    vege_ids = {vege_id for vege_id, _ in totals}
+    if base is not None and base.days:
+        days.update((base.start_day, base.end_day))
+        vege_ids.update(int(v) for v in base.vege_ids)
+    start_day, end_day = min(days), max(days)
+    vege_ids = sorted(vege_ids)
+    rows = {vege_id: i for i, vege_id in enumerate(vege_ids)}
+
+    shape = (len(vege_ids), end_day - start_day + 1)
+    prices = np.full(shape, np.nan, dtype=np.float32)
+    volumes = np.full(shape, np.nan, dtype=np.float32)
+    if base is not None and base.days:
+        target = [rows[int(v)] for v in base.vege_ids]
+        offset = base.start_day - start_day
+        prices[target, offset:offset + base.days] = base.prices
+        volumes[target, offset:offset + base.days] = base.volumes
+
+    for (vege_id, day), (weighted, volume, price_sum, count) in totals.items():
+        row, col = rows[vege_id], day - start_day
+        prices[row, col] = weighted / volume if volume > 0 else price_sum / count
+        volumes[row, col] = volume if volume > 0 else np.nan
+
+    meta = {"unit": unit, "generated_at": int(time.time())}
+    return PriceStore(start_day, vege_ids, prices, volumes, meta)
+
+
+def expand_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.csv"))))
+        else:
+            paths.extend(sorted(glob.glob(item)) or [item])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="CSV 檔案、萬用字元或資料夾")
+    parser.add_argument("--output", default=os.getenv("PRICE_STORE_PATH", DEFAULT_PRICE_STORE_PATH))
+    parser.add_argument("--merge", action="store_true", help="與既有的 prices.npz 合併")
+    parser.add_argument("--date-column", default="交易日期")
+    parser.add_argument("--name-column", default="作物名稱")
+    parser.add_argument("--id-column", default=None, help="CSV 已有 vege_id 時的欄位名稱")
+    parser.add_argument("--price-column", default="平均價")
+    parser.add_argument("--volume-column", default="交易量", help="設為空字串時不加權")
+    parser.add_argument("--unit", default="元/公斤")
+    parser.add_argument("--upload", action="store_true", help="上傳到 MinIO")
+    args = parser.parse_args()
+
+    paths = expand_inputs(args.inputs)
+    mapping = {} if args.id_column else load_name_mapping()
+    totals, unmapped = read_price_rows(paths, args, mapping)
+    if not totals:
+        parser.error("沒有讀到任何有效的價格資料")
+
+    base = None
+    if args.merge and os.path.exists(args.output):
+        base = PriceStore.load(args.output)
+    store = build_store(totals, args.unit, base)
+    store.save(args.output)
+
+    stats = store.stats()
+    print(
+        f"已從 {len(paths)} 個檔案匯入 {len(totals)} 筆（蔬菜 × 日）價格："
+        f"{stats['vegetables']} 種蔬菜，{stats['start']} ~ {stats['end']}，"
+        f"{os.path.getsize(args.output) / 1024:.0f}KB -> {args.output}"
+    )
+    if unmapped:
+        print("無法對應的作物名稱（前 20 個）：" + "、".join(
+            f"{name}({count})" for name, count in unmapped.most_common(20)
+        ))
+
+    if args.upload:
+        from object_store import get_bucket, get_client
+
+        get_client().upload_file(
+            args.output, get_bucket(), PRICE_STORE_KEY,
+            ExtraArgs={"ContentType": "application/octet-stream"},
+        )
+        print(f"已上傳到 {get_bucket()}/{PRICE_STORE_KEY}")
+
+
+if __name__ == "__main__":
+    main()
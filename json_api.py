@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件，沒有安裝時只提供 gzip
+    brotli = None
+
+DEFAULT_PER_PAGE = int(os.getenv("JSON_API_DEFAULT_PER_PAGE", 50))
+MAX_PER_PAGE = int(os.getenv("JSON_API_MAX_PER_PAGE", 200))
+MAX_AGE = int(os.getenv("JSON_API_MAX_AGE", 60))
+# 小於此大小的回應不壓縮，壓縮後反而可能變大
+MIN_COMPRESS_BYTES = int(os.getenv("JSON_API_MIN_COMPRESS_BYTES", 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class QueryError(ValueError):
+    """查詢參數不合法，回傳 400。"""
+
+
+def parse_pagination(args):
+    """
+    讀取 page（從 1 開始）與 per_page 參數。
+    :raises QueryError: 參數不是正整數或 per_page 超過 MAX_PER_PAGE。
+    """
+    page = _positive_int(args, "page", 1)
+    per_page = _positive_int(args, "per_page", DEFAULT_PER_PAGE)
+    if per_page > MAX_PER_PAGE:
+        raise QueryError(f"per_page 不可超過 {MAX_PER_PAGE}")
+    return page, per_page
+
+
+def _positive_int(args, name, default):
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise QueryError(f"{name} 必須是正整數") from None
+    if number < 1:
+        raise QueryError(f"{name} 必須是正整數")
+    return number
+
+
+def parse_fields(args, allowed):
+    """
+    讀取 fields=a,b,c 欄位選擇參數；沒有指定時回傳 None（回傳全部欄位）。
+    :raises QueryError: 含有不存在的欄位。
+    """
+    value = args.get("fields")
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise QueryError(f"未知的欄位：{', '.join(unknown)}（可用欄位：{', '.join(allowed)}）")
+    return fields or None
+
+
+def select_fields(item, fields):
+    if fields is None:
+        return item
+    return {f: item[f] for f in fields if f in item}
+
+
+def paginate(items, page, per_page, fields=None):
+    """把清單切成一頁，並套用欄位選擇；超過最後一頁時回傳空的 items。"""
+    total = len(items)
+    start = (page - 1) * per_page
+    return {
+        "items": [select_fields(item, fields) for item in items[start:start + per_page]],
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page,
+    }
+
+
+# --- 回應編碼與快取 ---
+
+class _EncodedBodies:
+    """依 (ETag, 編碼) 保存序列化與壓縮後的回應內容，相同查詢不必重新序列化與壓縮。"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_bodies = _EncodedBodies(int(os.getenv("JSON_API_CACHE_SIZE", 256)))
+_not_modified = 0
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality("br") > 0:
+        return "br"
+    if accept.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def json_response(version, build, max_age=None):
+    """
+    回傳可快取的 JSON 回應。
+    ETag 由資料版本與正規化後的查詢參數算出，不必產生內容就能回答 If-None-Match（304）；
+    內容依 Accept-Encoding 以 brotli 或 gzip 壓縮，並保留在記憶體中供相同查詢重複使用。
+    :param version: 資料來源的版本（例如目錄版本號、CSV 的 ETag），資料變更時必須改變。
+    :param build: 無參數函式，回傳要序列化的內容；只有在快取沒有時才呼叫。
+    """
+    global _not_modified
+    query = sorted(request.args.items(multi=True))
+    etag = hashlib.sha1(repr((request.path, query, version)).encode("utf-8")).hexdigest()
+    max_age = MAX_AGE if max_age is None else max_age
+
+    if request.if_none_match.contains_weak(etag):
+        _not_modified += 1
+        response = Response(status=304)
+    else:
+        body = _bodies.get((etag, None))
+        if body is None:
+            body = _dumps(build())
+            _bodies.put((etag, None), body)
+
+        encoding = _choose_encoding() if len(body) >= MIN_COMPRESS_BYTES else None
+        if encoding:
+            compressed = _bodies.get((etag, encoding))
+            if compressed is None:
+                compressed = _compress(body, encoding)
+                _bodies.put((etag, encoding), compressed)
+            body = compressed
+
+        response = Response(body, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+
+    # 不同編碼的內容共用同一個弱 ETag
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def stats():
+    return {
+        "brotli": brotli is not None,
+        "cached_bodies": len(_bodies._entries),
+        "body_hits": _bodies.hits,
+        "body_misses": _bodies.misses,
+        "not_modified": _not_modified,
+    }
@@ -0,0 +1,262 @@
+import os
+import threading
+import time
+
+from db_pool import db_connection
+
+# 這兩種別名只用於搜尋比對，不顯示在回覆中
+HIDDEN_ALIAS_TYPES = ("羅馬拼音", "錯字")
+
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class _Snapshot:
+    """某一個版本的蔬菜資料與索引；建立後不再修改，更新時整份替換。"""
+
+    def __init__(self, vegetables, entries, unigram_index, bigram_index, version):
+        self.vegetables = vegetables
+        self.entries = entries
+        self.unigram_index = unigram_index
+        self.bigram_index = bigram_index
+        self.version = version
+        self.loaded_at = time.time()
+
+
+class VegetableCatalog:
+    """
+    將 basic_vege、vege_alias、vege_nutrition 一次載入記憶體，
+    並以名稱/別名的 1-gram、2-gram 索引回答子字串搜尋（等同 ILIKE '%term%'）。
+    - refresh()：立即從資料庫重新載入，成功後版本號加一。
+    - invalidate()：標記為過期，下一次查詢時重新載入。
+    - 設定 CATALOG_TTL（秒）時，資料超過此時間也會在下一次查詢時重新載入。
+    - 查詢時自動重新載入失敗的話，繼續使用舊資料，並在 CATALOG_RETRY_INTERVAL 秒後再試
+      （連續失敗時間隔加倍，最多 10 倍）；只有從未載入成功時才拋出例外。
+    """
+
+    def __init__(self, loader=None, ttl=None):
+        self._loader = loader or load_catalog_rows
+        self.ttl = float(ttl if ttl is not None else os.getenv("CATALOG_TTL", 0))
+        self._snapshot = None
+        self._stale = False
+        self.retry_interval = float(os.getenv("CATALOG_RETRY_INTERVAL", 30))
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    # --- 載入與版本 ---
+
+    def _needs_reload(self, snapshot):
+        if snapshot is None:
+            return True
+        if time.time() < self._retry_at:
+            return False
+        return self._stale or (self.ttl > 0 and time.time() - snapshot.loaded_at > self.ttl)
+
+    def _current(self):
+        snapshot = self._snapshot
+        if not self._needs_reload(snapshot):
+            return snapshot
+        with self._lock:
+            # 其他執行緒可能已經重新載入過
+            if self._needs_reload(self._snapshot):
+                if self._snapshot is None:
+                    self._reload()
+                else:
+                    try:
+                        self._reload()
+                    except Exception as e:
+                        # 已有舊資料時繼續使用，稍後再試，不讓每個查詢都等資料庫
+                        self._failures += 1
+                        delay = self.retry_interval * min(2 ** (self._failures - 1), 10)
+                        self._retry_at = time.time() + delay
+                        print(f"VegetableCatalog 重新載入失敗，繼續使用版本 {self._snapshot.version}，{delay:.0f} 秒後再試：{e}")
+            return self._snapshot
+
+    def refresh(self):
+        """從資料庫重新載入並重建索引；載入失敗時保留舊資料並拋出例外。"""
+        with self._lock:
+            return self._reload()
+
+    def _reload(self):
+        # 呼叫端須持有 self._lock
+        basic_rows, alias_rows, nutrition_cols, nutrition_rows = self._loader()
+        previous = self._snapshot.version if self._snapshot else 0
+        self._snapshot = self._build(
+            basic_rows, alias_rows, nutrition_cols, nutrition_rows, previous + 1
+        )
+        self._stale = False
+        self._failures = 0
+        self._retry_at = 0.0
+        print(
+            f"VegetableCatalog 已載入 {len(self._snapshot.vegetables)} 種蔬菜、"
+            f"{len(self._snapshot.entries)} 個名稱/別名（版本 {self._snapshot.version}）"
+        )
+        return self._snapshot
+
+    def invalidate(self):
+        """標記資料過期，下一次查詢時重新載入。"""
+        self._stale = True
+
+    @property
+    def version(self):
+        """目前資料的版本號；尚未載入時為 0。"""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot else 0
+
+    def current_version(self):
+        """必要時先（重新）載入，再回傳版本號。"""
+        return self._current().version
+
+    @staticmethod
+    def _build(basic_rows, alias_rows, nutrition_cols, nutrition_rows, version):
+        vegetables = {}
+        for vege_id, vege_name in basic_rows:
+            vegetables[vege_id] = {
+                "id": vege_id,
+                "chinese_name": vege_name,
+                "aliases": [],
+                "hidden_aliases": [],
+                "all_nutrients": {},
+            }
+
+        for vege_id, alias, alias_type in alias_rows:
+            veg = vegetables.get(vege_id)
+            if veg is None:
+                continue
+            if alias_type in HIDDEN_ALIAS_TYPES:
+                veg["hidden_aliases"].append(alias)
+            else:
+                veg["aliases"].append(alias)
+
+        vege_id_pos = nutrition_cols.index("vege_id")
+        for row in nutrition_rows:
+            veg = vegetables.get(row[vege_id_pos])
+            # 與原本 fetchone() 相同，每種蔬菜只取第一列營養資料
+            if veg is None or veg["all_nutrients"]:
+                continue
+            veg["all_nutrients"] = {
+                k: v for k, v in zip(nutrition_cols, row) if k != "vege_id"
+            }
+
+        # 每個可搜尋字串一筆 entry：(vege_id, 小寫文字, 類型, 是否為隱藏別名)
+        entries = []
+        for veg in vegetables.values():
+            entries.append((veg["id"], (veg["chinese_name"] or "").lower(), "name", False))
+        for vege_id, alias, alias_type in alias_rows:
+            if vege_id in vegetables and alias:
+                entries.append(
+                    (vege_id, alias.lower(), alias_type, alias_type in HIDDEN_ALIAS_TYPES)
+                )
+
+        unigram_index = {}
+        bigram_index = {}
+        for pos, (_, text, _, _) in enumerate(entries):
+            for gram in _ngrams(text, 1):
+                unigram_index.setdefault(gram, set()).add(pos)
+            for gram in _ngrams(text, 2):
+                bigram_index.setdefault(gram, set()).add(pos)
+
+        return _Snapshot(vegetables, entries, unigram_index, bigram_index, version)
+
+    # --- 查詢 ---
+
+    def _candidates(self, snapshot, term):
+        if len(term) == 1:
+            return snapshot.unigram_index.get(term, set())
+        postings = []
+        for gram in _ngrams(term, 2):
+            posting = snapshot.bigram_index.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+    def match_ids(self, search_term):
+        """回傳名稱或任一別名（含羅馬拼音/錯字）包含 search_term 的 vege_id，依 id 排序。"""
+        return self._match_ids(self._current(), search_term)
+
+    def _match_ids(self, snapshot, search_term):
+        term = search_term.strip().lower()
+        if not term:
+            return sorted(snapshot.vegetables)
+        matched = set()
+        for pos in self._candidates(snapshot, term):
+            vege_id, text, _, _ = snapshot.entries[pos]
+            # n-gram 只是候選，最後仍以子字串確認
+            if term in text:
+                matched.add(vege_id)
+        return sorted(matched)
+
+    def get(self, vege_id):
+        """取得單一蔬菜的結果字典（與 get_vegetables_by_name_or_alias 相同格式），不存在時回傳 None。"""
+        veg = self._current().vegetables.get(vege_id)
+        return self._to_result(veg) if veg else None
+
+    def all(self):
+        """依 id 排序回傳所有蔬菜的結果字典。"""
+        snapshot = self._current()
+        return [self._to_result(snapshot.vegetables[i]) for i in sorted(snapshot.vegetables)]
+
+    def search(self, search_term):
+        """等同 get_vegetables_by_name_or_alias 的結果，但完全在記憶體中完成。"""
+        snapshot = self._current()
+        return [
+            self._to_result(snapshot.vegetables[i])
+            for i in self._match_ids(snapshot, search_term)
+        ]
+
+    @staticmethod
+    def _to_result(veg):
+        # 回傳新的 dict/list，呼叫端修改時不會影響快取
+        return {
+            "id": veg["id"],
+            "chinese_name": veg["chinese_name"],
+            "aliases": list(veg["aliases"]),
+            "all_nutrients": dict(veg["all_nutrients"]),
+            "nutrient_name": "總覽",
+            "nutrient_value": None,
+            "unit": "",
+        }
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"version": 0, "loaded": False}
+        return {
+            "version": snapshot.version,
+            "loaded": True,
+            "stale": self._stale,
+            "loaded_at": snapshot.loaded_at,
+            "vegetables": len(snapshot.vegetables),
+            "entries": len(snapshot.entries),
+        }
+
+
+def load_catalog_rows():
+    """從資料庫讀取建立目錄所需的三個資料表。"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id, vege_name FROM basic_vege ORDER BY id;")
+        basic_rows = cursor.fetchall()
+        cursor.execute("SELECT vege_id, alias, type FROM vege_alias ORDER BY id;")
+        alias_rows = cursor.fetchall()
+        cursor.execute("SELECT * FROM vege_nutrition ORDER BY id;")
+        nutrition_cols = [desc[0] for desc in cursor.description]
+        nutrition_rows = cursor.fetchall()
+    return basic_rows, alias_rows, nutrition_cols, nutrition_rows
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """取得行程內共用的 VegetableCatalog。"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = VegetableCatalog()
+    return _catalog
@@ -1,8 +1,11 @@
-import pandas as pd
 import os
 import re
 import psycopg2 # 新增
 from dotenv import load_dotenv
+from db_pool import DatabaseUnavailableError, db_connection
+from nutri_rec.catalog import get_catalog
+from nutri_rec.nutrient_index import get_nutrient_index
+from nutri_rec.seasonal import current_month, get_seasonal_index
 
 load_dotenv()
 
@@ -29,174 +32,311 @@ NUTRIENT_MAPPING = {
     "葉酸": "folic_acid_ug",
 }
 
+# 使用者常用的營養素說法，對應到 NUTRIENT_MAPPING 的鍵
+NUTRIENT_SYNONYMS = {
+    "鐵質": "鐵",
+    "鈣質": "鈣",
+    "纖維": "膳食纖維",
+    "蛋白": "蛋白質",
+    "卡路里": "熱量",
+    "醣": "糖",
+    "碳水": "碳水化合物",
+    "維他命A": "維生素A",
+    "維他命C": "維生素C",
+    "維他命E": "維生素E",
+    "維他命B1": "維生素B1",
+}
 
-def get_db_connection():
-    """建立並回傳 PostgreSQL 資料庫連線"""
-    try:
-        DATABASE_URL = os.getenv("DATABASE_URL")
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
-    except Exception as e:
-        print(f"Database connection failed: {e}")
+# 方向詞：1 代表越高越好、-1 代表越低越好
+DIRECTION_WORDS = {
+    "富含": 1,
+    "高": 1,
+    "多": 1,
+    "低": -1,
+    "少": -1,
+}
+
+_NUTRIENT_TERMS = sorted(
+    list(NUTRIENT_MAPPING) + list(NUTRIENT_SYNONYMS), key=len, reverse=True
+)
+_NUTRIENT_QUERY_PATTERN = re.compile(
+    r"\s*(?P<direction>" + "|".join(map(re.escape, DIRECTION_WORDS)) + r")?"
+    r"(?P<nutrient>" + "|".join(map(re.escape, _NUTRIENT_TERMS)) + r")"
+    r"\s*(?:[、,，和與及且又跟+/]\s*)?",
+    re.IGNORECASE,
+)
+
+
+def parse_nutrient_query(text: str):
+    """
+    解析「高鐵低鈉」、「高蛋白 低熱量」這類組合查詢。
+    整段文字都必須由（方向詞 + 營養素）組成，且至少有一個方向詞或兩個營養素，
+    否則回傳 None（交給單一營養素或蔬菜名稱查詢處理）。
+    :return: [(營養素中文名稱, 權重, 方向)] 或 None
+    """
+    text = text.strip()
+    criteria = []
+    has_direction = False
+    pos = 0
+    while pos < len(text):
+        match = _NUTRIENT_QUERY_PATTERN.match(text, pos)
+        if not match or match.end() == pos:
+            return None
+        nutrient = match.group("nutrient")
+        for term in NUTRIENT_SYNONYMS:
+            if term.lower() == nutrient.lower():
+                nutrient = NUTRIENT_SYNONYMS[term]
+                break
+        else:
+            nutrient = next(k for k in NUTRIENT_MAPPING if k.lower() == nutrient.lower())
+        direction = DIRECTION_WORDS.get(match.group("direction"), 1)
+        has_direction = has_direction or match.group("direction") is not None
+        criteria.append((nutrient, 1.0, direction))
+        pos = match.end()
+
+    if not criteria or (not has_direction and len(criteria) < 2):
         return None
+    return criteria
 
-def get_top_vegetables_by_nutrient(nutrient_name: str, **kwargs):
+
+def parse_nutrient_criteria(text: str):
     """
-    根據指定的營養成分名稱，從資料庫中找出含量最高的五項蔬菜。
+    與 parse_nutrient_query 相同，但也接受單一營養素（例如「鐵質」），視為越高越好。
+    :return: [(營養素中文名稱, 權重, 方向)] 或 None
     """
-    conn = get_db_connection()
-    if conn is None:
-        return "錯誤：無法連接資料庫。"
+    criteria = parse_nutrient_query(text)
+    if criteria:
+        return criteria
+    nutrient = NUTRIENT_SYNONYMS.get(text.strip(), text.strip())
+    if resolve_nutrient_column(nutrient) is None:
+        return None
+    return [(nutrient, 1.0, 1)]
 
-    try:
-        cursor = conn.cursor()
 
-        # 嘗試透過映射字典獲取對應的英文欄位名稱
-        actual_nutrient_column = NUTRIENT_MAPPING.get(nutrient_name)
-        input_nutrient_lower = nutrient_name.lower().strip()
+def resolve_nutrient_column(nutrient_name: str):
+    """將中文營養成分名稱或英文欄位名稱轉成 vege_nutrition 的欄位名稱，找不到時回傳 None。"""
+    # 嘗試透過映射字典獲取對應的英文欄位名稱
+    actual_nutrient_column = NUTRIENT_MAPPING.get(nutrient_name)
+    input_nutrient_lower = nutrient_name.lower().strip()
 
-        # 確定實際使用的營養成分欄位名稱
-        if actual_nutrient_column:
-            pass
-        elif input_nutrient_lower in NUTRIENT_MAPPING.values():
-            actual_nutrient_column = input_nutrient_lower
+    # 確定實際使用的營養成分欄位名稱
+    if actual_nutrient_column:
+        return actual_nutrient_column
+    if input_nutrient_lower in NUTRIENT_MAPPING.values():
+        return input_nutrient_lower
+    return None
+
+
+def get_top_vegetables_by_nutrient(
+    nutrient_name: str, k: int = 5, ascending: bool = False, season_month: int = None,
+    season_boost: float = None, **kwargs
+):
+    """
+    根據指定的營養成分名稱，找出含量最高（ascending=True 時為最低）的 k 項蔬菜。
+    排名由 NutrientIndex 預先計算，查詢時不需要資料庫。
+    :param season_month: 指定時只列出該月份當季的蔬菜；另外指定 season_boost 時改為
+                         以 z-score 排名並讓當季蔬菜加上 season_boost，非當季的仍可入選。
+    """
+    actual_nutrient_column = resolve_nutrient_column(nutrient_name)
+    if actual_nutrient_column is None:
+        return f"錯誤：找不到營養成分 '{nutrient_name}' 的數據。請檢查輸入是否正確或檔案中是否存在該營養成分。"
+
+    try:
+        index = get_nutrient_index(NUTRIENT_MAPPING.values())
+        if season_month and season_boost is not None:
+            ranked = index.rank(
+                [(actual_nutrient_column, 1.0, -1 if ascending else 1)],
+                k=k,
+                month=season_month,
+                season_boost=season_boost,
+            )
+            top = [(veg, veg["all_nutrients"].get(actual_nutrient_column)) for veg, _ in ranked]
         else:
+            top = index.top(actual_nutrient_column, k=k, ascending=ascending, month=season_month)
+    except DatabaseUnavailableError as e:
+        print(f"Database connection failed: {e}")
+        return "錯誤：無法連接資料庫。"
+    except Exception as e:
+        print(f"Database query failed: {e}")
+        return f"資料庫查詢失敗: {e}"
+
+    if not top:
+        return f"找不到 '{nutrient_name}' 的有效數值數據。"
+
+    unit = actual_nutrient_column.split('_')[-1] if '_' in actual_nutrient_column else ''
+    results_list = []
+    for veg, nutrient_value in top:
+        results_list.append({
+            "id": veg["id"],
+            "chinese_name": veg["chinese_name"],
+            "nutrient_name": nutrient_name,
+            "nutrient_value": nutrient_value,
+            "unit": unit,
+            "aliases": list(veg["aliases"]),
+            "all_nutrients": dict(veg["all_nutrients"]),
+        })
+    return results_list
+
+def rank_vegetables_by_nutrients(
+    criteria, k: int = 5, label: str = None, season_month: int = None, season_boost: float = None
+):
+    """
+    依多個營養素加權排名（例如高鐵低鈉），在標準化後的營養矩陣上一次向量化計算。
+    :param criteria: [(營養素名稱, 權重, 方向)]，方向 1 為越高越好、-1 為越低越好；
+                     營養素名稱可為中文或英文欄位名稱。
+    :param label: 顯示在「查詢成分」中的查詢名稱，預設由 criteria 組合而成。
+    :param season_month: 指定月份時只列出當季蔬菜；另外指定 season_boost 時改為
+                         當季蔬菜的分數加上 season_boost，非當季的仍可入選。
+    :return: 與 get_top_vegetables_by_nutrient 相同格式的結果清單，另含 score。
+    """
+    resolved = []
+    for nutrient_name, weight, direction in criteria:
+        column = resolve_nutrient_column(nutrient_name)
+        if column is None:
             return f"錯誤：找不到營養成分 '{nutrient_name}' 的數據。請檢查輸入是否正確或檔案中是否存在該營養成分。"
+        resolved.append((nutrient_name, column, float(weight), 1 if direction >= 0 else -1))
 
-        # 1. 查詢 vege_nutrition，找出該營養成分含量最高的五項
-        query_nutrition = f"""
-            SELECT vege_id, {actual_nutrient_column}, *
-            FROM vege_nutrition
-            ORDER BY {actual_nutrient_column} DESC
-            LIMIT 5;
-        """
-        cursor.execute(query_nutrition)
-        nutrition_rows = cursor.fetchall()
-
-        if not nutrition_rows:
-            return f"找不到 '{nutrient_name}' 的有效數值數據。"
-
-        # 取得所有欄位名稱
-        col_names = [desc[0] for desc in cursor.description]
-
-        # 2. 獲取所有相關 vege_id 的中文名稱和別名
-        vege_ids = [row[col_names.index('vege_id')] for row in nutrition_rows]
-        
-        query_basic = "SELECT id, vege_name FROM basic_vege WHERE id = ANY(%s);"
-        cursor.execute(query_basic, (vege_ids,))
-        basic_vege_rows = cursor.fetchall()
-        vege_id_to_name = {row[0]: row[1] for row in basic_vege_rows}
-
-        query_alias = "SELECT vege_id, alias FROM vege_alias WHERE vege_id = ANY(%s) AND type NOT IN ('羅馬拼音', '錯字');"
-        cursor.execute(query_alias, (vege_ids,))
-        alias_rows = cursor.fetchall()
-        vege_id_to_aliases = {}
-        for row in alias_rows:
-            vege_id, alias = row
-            if vege_id not in vege_id_to_aliases:
-                vege_id_to_aliases[vege_id] = []
-            vege_id_to_aliases[vege_id].append(alias)
-
-        # 3. 格式化結果
-        results_list = []
-        for row in nutrition_rows:
-            row_dict = dict(zip(col_names, row))
-            veg_id = row_dict['vege_id']
-            chinese_name = vege_id_to_name.get(veg_id, f"未知蔬菜 (ID: {veg_id})")
-            aliases = vege_id_to_aliases.get(veg_id, [])
-            nutrient_value = row_dict.get(actual_nutrient_column)
-            unit = actual_nutrient_column.split('_')[-1] if '_' in actual_nutrient_column else ''
-
-            all_nutrients_data = {k: v for k, v in row_dict.items() if k != 'vege_id'}
-
-            results_list.append({
-                "id": veg_id,
-                "chinese_name": chinese_name,
-                "nutrient_name": nutrient_name,
-                "nutrient_value": nutrient_value,
-                "unit": unit,
-                "aliases": aliases,
-                "all_nutrients": all_nutrients_data
-            })
+    if label is None:
+        label = "".join(("高" if d > 0 else "低") + name for name, _, _, d in resolved)
 
-        return results_list
+    try:
+        ranked = get_nutrient_index(NUTRIENT_MAPPING.values()).rank(
+            [(column, weight, direction) for _, column, weight, direction in resolved],
+            k=k,
+            month=season_month,
+            season_boost=season_boost,
+        )
+    except DatabaseUnavailableError as e:
+        print(f"Database connection failed: {e}")
+        return "錯誤：無法連接資料庫。"
     except Exception as e:
         print(f"Database query failed: {e}")
         return f"資料庫查詢失敗: {e}"
-    finally:
-        if conn:
-            conn.close()
+
+    if not ranked:
+        return f"找不到 '{label}' 的有效數值數據。"
+
+    results_list = []
+    for veg, score in ranked:
+        values_text = "／".join(
+            f"{name} {veg['all_nutrients'].get(column)}{column.split('_')[-1]}"
+            for name, column, _, _ in resolved
+        )
+        results_list.append({
+            "id": veg["id"],
+            "chinese_name": veg["chinese_name"],
+            "nutrient_name": label,
+            "nutrient_value": values_text,
+            "unit": "",
+            "score": score,
+            "aliases": list(veg["aliases"]),
+            "all_nutrients": dict(veg["all_nutrients"]),
+        })
+    return results_list
+
+
+# 一次查詢完成：比對名稱/別名、取回基本資料、營養成分（每種蔬菜取一列）與別名陣列
+QUERY_VEGETABLES_BY_NAME_OR_ALIAS = """
+    WITH matched AS (
+        SELECT id FROM basic_vege WHERE vege_name ILIKE %(term)s
+        UNION
+        SELECT vege_id FROM vege_alias WHERE alias ILIKE %(term)s
+    )
+    SELECT
+        b.id,
+        b.vege_name,
+        COALESCE(
+            (SELECT array_agg(a.alias ORDER BY a.id)
+             FROM vege_alias AS a
+             WHERE a.vege_id = b.id AND a.type NOT IN ('羅馬拼音', '錯字')),
+            '{}'
+        ) AS aliases,
+        n.vege_id IS NOT NULL AS has_nutrition,
+        n.*
+    FROM matched AS m
+    JOIN basic_vege AS b ON b.id = m.id
+    LEFT JOIN LATERAL (
+        SELECT * FROM vege_nutrition WHERE vege_id = b.id ORDER BY id LIMIT 1
+    ) AS n ON TRUE;
+"""
+
+
+def query_vegetables_by_name_or_alias(cursor, search_term):
+    """
+    以單一查詢取得名稱或別名包含 search_term 的蔬菜，
+    回傳格式與 _create_vegetable_flex_message 使用的字典相同。
+    """
+    cursor.execute(
+        QUERY_VEGETABLES_BY_NAME_OR_ALIAS, {"term": f"%{search_term.strip()}%"}
+    )
+    rows = cursor.fetchall()
+    # 前四欄為 id, vege_name, aliases, has_nutrition，其後為 vege_nutrition 的所有欄位
+    nutrition_cols = [desc[0] for desc in cursor.description][4:]
+
+    results_list = []
+    for row in rows:
+        vege_id, chinese_name, aliases, has_nutrition = row[:4]
+        # 合併營養數據，並去除重複的 vege_id 欄位
+        all_nutrients = (
+            {k: v for k, v in zip(nutrition_cols, row[4:]) if k != 'vege_id'}
+            if has_nutrition
+            else {}
+        )
+        results_list.append({
+            'id': vege_id,
+            'chinese_name': chinese_name,
+            'aliases': list(aliases),
+            'all_nutrients': all_nutrients,
+            'nutrient_name': "總覽",
+            'nutrient_value': None,
+            'unit': ""
+        })
+    return results_list
+
 
 def get_vegetables_by_name_or_alias(search_term: str, **kwargs):
-    conn = get_db_connection()
-    if conn is None:
+    """
+    從記憶體中的 VegetableCatalog 搜尋名稱或別名包含 search_term 的蔬菜，
+    只有在目錄尚未載入或被 invalidate 時才會查詢資料庫。
+    """
+    try:
+        return get_catalog().search(search_term)
+    except DatabaseUnavailableError as e:
+        print(f"Database connection failed: {e}")
         return "錯誤：無法連接資料庫。"
+    except Exception as e:
+        print(f"Database query failed: {e}")
+        return f"資料庫查詢失敗: {e}"
 
+def get_seasonal_vegetables(month: int = None, k: int = 12):
+    """
+    某月份（預設本月）的當季蔬菜，季節性越強（盛產月份越少）的越前面。
+    產季與營養資料都在記憶體中，不需要查詢資料庫；只回傳有營養資料的蔬菜。
+    """
+    month = month or current_month()
     try:
-        cursor = conn.cursor()
-        search_term_lower = f"%{search_term.strip()}%"
-        
-        # 1. 聯合查詢 basic_vege 和 vege_alias，找出匹配的 vege_id
-        query_vege_ids = """
-            SELECT DISTINCT id FROM basic_vege WHERE vege_name ILIKE %s
-            UNION
-            SELECT DISTINCT vege_id FROM vege_alias WHERE alias ILIKE %s;
-        """
-        cursor.execute(query_vege_ids, (search_term_lower, search_term_lower))
-        matched_vege_ids = [row[0] for row in cursor.fetchall()]
-
-        if not matched_vege_ids:
-            return []
-
+        catalog = get_catalog()
         results_list = []
-        for vege_id in matched_vege_ids:
-            # 2. 針對每個 vege_id 獲取詳細資訊
-            query_detail = """
-                SELECT * FROM basic_vege WHERE id = %s;
-            """
-            cursor.execute(query_detail, (vege_id,))
-            basic_vege_row = cursor.fetchone()
-            if not basic_vege_row:
-                continue
-            
-            basic_vege_cols = [desc[0] for desc in cursor.description]
-            basic_vege_dict = dict(zip(basic_vege_cols, basic_vege_row))
-            chinese_name = basic_vege_dict.get('vege_name')
-
-            query_nutrition = """
-                SELECT * FROM vege_nutrition WHERE vege_id = %s;
-            """
-            cursor.execute(query_nutrition, (vege_id,))
-            nutrition_row = cursor.fetchone()
-            nutrition_cols = [desc[0] for desc in cursor.description]
-            nutrition_dict = dict(zip(nutrition_cols, nutrition_row)) if nutrition_row else {}
-
-            query_aliases = """
-                SELECT alias FROM vege_alias WHERE vege_id = %s AND type NOT IN ('羅馬拼音', '錯字');
-            """
-            cursor.execute(query_aliases, (vege_id,))
-            aliases = [row[0] for row in cursor.fetchall()]
-            
-            # 合併營養數據，並去除重複的 vege_id 欄位
-            all_nutrients = {k: v for k, v in nutrition_dict.items() if k != 'vege_id'}
-            
-            results_list.append({
-                'id': vege_id,
-                'chinese_name': chinese_name,
-                'aliases': aliases,
-                'all_nutrients': all_nutrients,
-                'nutrient_name': "總覽",
-                'nutrient_value': None,
-                'unit': ""
-            })
-        
+        for vege_id in get_seasonal_index().in_season_ids(month):
+            veg = catalog.get(vege_id)
+            if veg and veg["all_nutrients"]:
+                results_list.append(veg)
+                if len(results_list) >= k:
+                    break
         return results_list
+    except DatabaseUnavailableError as e:
+        print(f"Database connection failed: {e}")
+        return "錯誤：無法連接資料庫。"
     except Exception as e:
         print(f"Database query failed: {e}")
         return f"資料庫查詢失敗: {e}"
-    finally:
-        if conn:
-            conn.close()
+
+
+def sort_in_season_first(vegetables, month: int = None):
+    """依產季加權名稱搜尋的結果：當季蔬菜排在前面，其餘維持原本順序。"""
+    seasonal = get_seasonal_index()
+    month = month or current_month()
+    return sorted(vegetables, key=lambda veg: not seasonal.in_season(veg["id"], month))
 
 # 為了在 `app.py` 中調用時保持一致，這裡保留了原本的函數名稱。
 # 函式簽名也進行了調整，不再需要 `nutrition_obj_name` 等參數。
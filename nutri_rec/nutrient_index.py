@@ -0,0 +1,176 @@
+import threading
+
+import numpy as np
+
+from nutri_rec.catalog import get_catalog
+from nutri_rec.seasonal import get_seasonal_index, month_bit
+
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class _IndexSnapshot:
+    """某一個目錄版本的矩陣與排名；建立後不再修改，重建時整份替換。"""
+
+    def __init__(self, version, vegetables, matrix, zscores, season_masks, desc, asc):
+        self.version = version
+        self.vegetables = vegetables
+        self.matrix = matrix
+        self.zscores = zscores
+        self.season_masks = season_masks
+        self.desc = desc
+        self.asc = asc
+
+    def in_season(self, month):
+        return (self.season_masks & month_bit(month)) != 0
+
+
+class NutrientIndex:
+    """
+    以 VegetableCatalog 的營養資料建立 (蔬菜數, 營養素數) 的 NumPy 矩陣，
+    並為每個營養素預先排序好由高到低、由低到高的 vege 位置（NaN 不列入排名）。
+    查詢 top-k 只需切片，不必每次對資料庫下 ORDER BY。
+    另外保存每欄標準化 (z-score) 後的矩陣，供多營養素加權排名使用，
+    以及每種蔬菜的產季月份遮罩，供當季篩選與加權使用。
+    目錄版本變更時會自動重建，也可呼叫 rebuild() 強制重建；
+    重建時整份 _IndexSnapshot 一次替換，查詢中途不會讀到新舊混雜的矩陣與排名。
+    """
+
+    def __init__(self, columns, catalog=None, seasonal=None):
+        self.columns = list(columns)
+        self._column_pos = {c: i for i, c in enumerate(self.columns)}
+        self._catalog = catalog or get_catalog()
+        self._seasonal = seasonal or get_seasonal_index()
+        self._lock = threading.Lock()
+        self._snapshot = _IndexSnapshot(
+            None,
+            [],
+            np.empty((0, len(self.columns))),
+            np.empty((0, len(self.columns))),
+            np.empty(0, dtype=np.uint16),
+            {},
+            {},
+        )
+
+    def _current(self):
+        """回傳目前目錄版本的快照，版本不同時先重建。"""
+        version = self._catalog.current_version()
+        snapshot = self._snapshot
+        if version != snapshot.version:
+            with self._lock:
+                snapshot = self._snapshot
+                if version != snapshot.version:
+                    snapshot = self._build()
+        return snapshot
+
+    def rebuild(self):
+        """依目前的目錄資料重建矩陣與排名。"""
+        with self._lock:
+            self._build()
+
+    def _build(self):
+        # 呼叫端須持有 self._lock
+        version = self._catalog.current_version()
+        vegetables = [veg for veg in self._catalog.all() if veg["all_nutrients"]]
+        matrix = np.array(
+            [[_to_float(veg["all_nutrients"].get(c)) for c in self.columns] for veg in vegetables],
+            dtype=np.float64,
+        ).reshape(len(vegetables), len(self.columns))
+
+        desc, asc = {}, {}
+        for c, i in self._column_pos.items():
+            values = matrix[:, i]
+            valid = np.flatnonzero(~np.isnan(values))
+            # stable 排序：數值相同時維持 vege id 順序
+            desc[c] = valid[np.argsort(-values[valid], kind="stable")]
+            asc[c] = valid[np.argsort(values[valid], kind="stable")]
+
+        # z-score：每欄減去平均再除以標準差（忽略 NaN；標準差為 0 的欄位視為全 0）
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nanmean(matrix, axis=0) if len(vegetables) else np.zeros(len(self.columns))
+            std = np.nanstd(matrix, axis=0) if len(vegetables) else np.ones(len(self.columns))
+            zscores = (matrix - mean) / np.where(std > 0, std, 1.0)
+        zscores[:, ~(std > 0)] = 0.0
+        season_masks = np.array(
+            [self._seasonal.mask(veg["id"]) for veg in vegetables], dtype=np.uint16
+        )
+
+        snapshot = _IndexSnapshot(version, vegetables, matrix, zscores, season_masks, desc, asc)
+        self._snapshot = snapshot
+        return snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def top(self, column, k=5, ascending=False, month=None):
+        """
+        回傳某營養素排名前 k 的 [(蔬菜結果字典, 數值)]；NaN 不列入。
+        結果字典為索引內共用的物件，呼叫端不可直接修改。
+        :param ascending: True 時由低到高（例如最低鈉）。
+        :param month: 指定時只列出該月份當季的蔬菜。
+        """
+        if column not in self._column_pos:
+            raise KeyError(column)
+        snapshot = self._current()
+        order = (snapshot.asc if ascending else snapshot.desc)[column]
+        if month:
+            order = order[snapshot.in_season(month)[order]]
+        order = order[:k]
+        vegetables = snapshot.vegetables
+        return [(vegetables[i], vegetables[i]["all_nutrients"].get(column)) for i in order]
+
+    def rank(self, criteria, k=5, month=None, season_boost=None):
+        """
+        多營養素加權排名：score = Σ weight × direction × z-score。
+        :param criteria: [(欄位名稱, 權重, 方向)]，方向 1 代表越高越好、-1 代表越低越好。
+        :param month: 指定月份時依產季調整：season_boost 為 None 時只列出當季蔬菜，
+                      否則當季蔬菜的分數加上 season_boost（z-score 單位），非當季的仍可入選。
+        :return: [(蔬菜結果字典, 分數)]，任一指定欄位為 NaN 的蔬菜不列入。
+        """
+        if not criteria:
+            return []
+        for column, _, _ in criteria:
+            if column not in self._column_pos:
+                raise KeyError(column)
+        snapshot = self._current()
+        cols = [self._column_pos[c] for c, _, _ in criteria]
+        coef = np.array([w * d for _, w, d in criteria], dtype=np.float64)
+
+        scores = snapshot.zscores[:, cols] @ coef
+        valid = ~np.isnan(snapshot.matrix[:, cols]).any(axis=1)
+        if month:
+            in_season = snapshot.in_season(month)
+            if season_boost is None:
+                valid &= in_season
+            else:
+                scores = scores + season_boost * in_season
+        scores = np.where(valid, scores, -np.inf)
+
+        n_valid = int(valid.sum())
+        k = min(k, n_valid)
+        if k <= 0:
+            return []
+        # 先以 argpartition 取出前 k 名，再只對這 k 筆排序
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        vegetables = snapshot.vegetables
+        return [(vegetables[i], float(scores[i])) for i in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_nutrient_index(columns):
+    """取得行程內共用的 NutrientIndex；columns 只在第一次建立時使用。"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = NutrientIndex(columns)
+    return _index
@@ -0,0 +1,176 @@
+import csv
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+# 12 個月全部當季
+ALL_MONTHS = 0xFFF
+
+DEFAULT_FRESH_MONTH_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fresh_month.csv"
+)
+
+
+def month_bit(month):
+    """m 月對應的位元（第 m-1 位元）。"""
+    return 1 << (month - 1)
+
+
+def mask_to_months(mask):
+    return [m for m in range(1, 13) if mask & month_bit(m)]
+
+
+def format_months(mask):
+    """
+    將月份遮罩轉成簡短文字，例如「1-3月、11-12月」；跨年的區間寫成「11-3月」。
+    沒有任何月份時回傳 None。
+    """
+    if not mask:
+        return None
+    if mask & ALL_MONTHS == ALL_MONTHS:
+        return "全年"
+    # 從某個「前一個月不是當季」的月份開始繞一圈，跨年的區間就不會被拆成兩段
+    start = next(m for m in range(1, 13) if mask & month_bit(m) and not mask & month_bit((m - 2) % 12 + 1))
+    runs = []
+    run_start = None
+    for offset in range(12):
+        m = (start - 1 + offset) % 12 + 1
+        if mask & month_bit(m):
+            if run_start is None:
+                run_start = m
+            run_end = m
+        elif run_start is not None:
+            runs.append((run_start, run_end))
+            run_start = None
+    if run_start is not None:
+        runs.append((run_start, run_end))
+    runs.sort()
+    return "、".join(f"{a}月" if a == b else f"{a}-{b}月" for a, b in runs)
+
+
+def current_month():
+    """目前的月份；以 SEASON_TIMEZONE（預設台灣時間）計算，時區資料不存在時使用系統時間。"""
+    try:
+        from zoneinfo import ZoneInfo
+
+        return datetime.now(ZoneInfo(os.getenv("SEASON_TIMEZONE", "Asia/Taipei"))).month
+    except Exception:
+        return time.localtime().tm_mon
+
+
+class SeasonalIndex:
+    """
+    fresh_month.csv（vege_id, vege_name, fresh_month，每個盛產月份一列）的產季索引。
+    每種蔬菜壓成一個 12 位元的月份遮罩，查詢某蔬菜是否當季只需一次 dict 查詢與位元運算，
+    不必連線資料庫；每個月份的當季蔬菜清單也在載入時預先算好。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("FRESH_MONTH_PATH", DEFAULT_FRESH_MONTH_PATH)
+        self.masks, self.names = self._load(self.path)
+        # 每個月份的當季 vege_id：盛產月份越少（越有季節性）越前面，其次依 id
+        self._by_month = {
+            month: tuple(
+                sorted(
+                    (vege_id for vege_id, mask in self.masks.items() if mask & month_bit(month)),
+                    key=lambda vege_id: (bin(self.masks[vege_id]).count("1"), vege_id),
+                )
+            )
+            for month in range(1, 13)
+        }
+        print(f"SeasonalIndex 已載入 {len(self.masks)} 種蔬菜的產季（{self.path}）")
+
+    @staticmethod
+    def _load(path):
+        masks, names = {}, {}
+        try:
+            with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        vege_id = int(row["vege_id"])
+                        month = int(row["fresh_month"])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    if not 1 <= month <= 12:
+                        continue
+                    masks[vege_id] = masks.get(vege_id, 0) | month_bit(month)
+                    names.setdefault(vege_id, (row.get("vege_name") or "").strip())
+        except OSError as e:
+            print(f"無法讀取產季資料 {path}：{e}")
+        return masks, names
+
+    def mask(self, vege_id):
+        """某蔬菜的月份遮罩；沒有產季資料時為 0。"""
+        return self.masks.get(vege_id, 0)
+
+    def months(self, vege_id):
+        return mask_to_months(self.mask(vege_id))
+
+    def label(self, vege_id):
+        """產季文字，例如「1-3月、11-12月」；沒有產季資料時回傳 None。"""
+        return format_months(self.mask(vege_id))
+
+    def in_season(self, vege_id, month=None):
+        return bool(self.mask(vege_id) & month_bit(month or current_month()))
+
+    def in_season_ids(self, month=None):
+        """某月份（預設本月）當季的 vege_id。"""
+        return self._by_month[month or current_month()]
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "vegetables": len(self.masks),
+            "current_month": current_month(),
+            "in_season_now": len(self.in_season_ids()),
+        }
+
+
+_MONTH_NUMERALS = {
+    "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6,
+    "七": 7, "八": 8, "九": 9, "十": 10, "十一": 11, "十二": 12,
+}
+
+# 月份前不可緊接數字（「13月」不是 3 月）；前面的年份（「2023年」、「民國112年」）一併視為月份的一部分
+_SEASON_PATTERN = re.compile(
+    r"(?:(?<!\d)(?:(?:民國)?\d{2,4}年)?(?P<month>1[0-2]|0?[1-9]|十[一二]?|[一二三四五六七八九])月份?(?:的)?(?:當季|盛產|當令)?"
+    r"|當季|當令|時令|本月|這個月|當月)的?"
+)
+# 產季查詢中不影響排名的詞，例如「當季鐵質最高的蔬菜有哪些？」只保留「鐵質」
+_FILLER_PATTERN = re.compile(
+    r"(?:的)?(?:蔬菜|蔬果|青菜|食材)|^菜(?=(?:有哪些|有什麼|推薦|[?？!！。\s])*$)|有哪些|有什麼|推薦|含量|最高|最多|最(?=[高低多少])|[的?？!！。\s]"
+)
+
+
+def parse_season_query(text):
+    """
+    解析「當季蔬菜」、「本月高鐵」、「3月當季蔬菜」、「當季鐵質最高」這類產季查詢。
+    :return: (月份, 其餘查詢文字)；月份為 None 代表本月，其餘文字為空代表只查當季蔬菜。
+             不是產季查詢時回傳 None。
+    """
+    text = text.strip()
+    match = _SEASON_PATTERN.search(text)
+    if not match:
+        return None
+    month = None
+    if match.group("month"):
+        value = match.group("month")
+        month = _MONTH_NUMERALS[value] if value in _MONTH_NUMERALS else int(value)
+    rest = _FILLER_PATTERN.sub("", text[:match.start()] + text[match.end():])
+    return month, rest
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_seasonal_index():
+    """取得行程內共用的 SeasonalIndex，第一次呼叫時載入 fresh_month.csv。"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SeasonalIndex()
+    return _index
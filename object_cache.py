@@ -0,0 +1,371 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import object_store
+
+logger = logging.getLogger(__name__)
+
+
+class CachedObject:
+    """快取中的一個 MinIO 物件；小物件內容放在 data，大物件放在磁碟 path。"""
+
+    __slots__ = ("key", "etag", "last_modified", "content_type", "size", "data", "path", "fetched_at")
+
+    def __init__(self, key, etag, last_modified, content_type, size, data=None, path=None, fetched_at=None):
+        self.key = key
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.size = size
+        self.data = data
+        self.path = path
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    def meta(self):
+        return {
+            "key": self.key,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_type": self.content_type,
+            "size": self.size,
+            "fetched_at": self.fetched_at,
+        }
+
+
+class ObjectCache:
+    """
+    MinIO 前面的讀取快取，分兩層：
+    - 記憶體 LRU：不超過 memory_max_object 的小物件（例如 CSV），總量不超過 memory_bytes。
+    - 磁碟：較大的物件（例如圖片）存在 disk_dir 下本行程專用的 slot 資料夾，總量不超過 disk_bytes，
+      重啟後仍可使用。
+    在 ttl 秒內直接回傳快取；過期後以 If-None-Match 向 MinIO 驗證 ETag，304 時只更新時間。
+    MinIO 逾時或無法連線時，改回傳過期的快取（最多 stale_max 秒），靜態資源不會因此中斷。
+    """
+
+    def __init__(
+        self,
+        ttl=None,
+        memory_bytes=None,
+        memory_max_object=None,
+        disk_dir=None,
+        disk_bytes=None,
+        disk_max_object=None,
+        stale_max=None,
+    ):
+        self.ttl = float(ttl if ttl is not None else os.getenv("OBJECT_CACHE_TTL", 300))
+        self.memory_bytes = int(
+            memory_bytes if memory_bytes is not None else os.getenv("OBJECT_CACHE_MEMORY_BYTES", 32 * 1024 * 1024)
+        )
+        self.memory_max_object = int(
+            memory_max_object if memory_max_object is not None
+            else os.getenv("OBJECT_CACHE_MEMORY_MAX_OBJECT", 512 * 1024)
+        )
+        if disk_dir is None:
+            disk_dir = os.getenv(
+                "OBJECT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "veg_object_cache")
+            )
+        # OBJECT_CACHE_DIR 設為空字串時停用磁碟快取
+        self.disk_dir = disk_dir or None
+        self.disk_bytes = int(
+            disk_bytes if disk_bytes is not None else os.getenv("OBJECT_CACHE_DISK_BYTES", 512 * 1024 * 1024)
+        )
+        self.disk_max_object = int(
+            disk_max_object if disk_max_object is not None
+            else os.getenv("OBJECT_CACHE_DISK_MAX_OBJECT", 20 * 1024 * 1024)
+        )
+        self.stale_max = float(stale_max if stale_max is not None else os.getenv("OBJECT_CACHE_STALE_MAX", 86400))
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        # 依 key 分散到固定數量的鎖，不必為每個 key 保存一把鎖
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "refetched": 0,
+            "stale_served": 0,
+            "errors": 0,
+            "uncacheable": 0,
+            "vanished": 0,
+        }
+        self._slot_lock_file = None
+        if self.disk_dir:
+            self._load_disk_index()
+
+    # --- 公開介面 ---
+
+    def get(self, key):
+        """
+        取得物件；回傳 CachedObject，物件太大不適合快取時回傳 None（呼叫端直接串流）。
+        :raises object_store.ObjectNotFoundError: 物件不存在。
+        :raises object_store.ObjectStoreError: MinIO 失敗且沒有可用的舊快取。
+        """
+        entry, tier = self._lookup(key)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            self._count(f"{tier}_hits")
+            return entry
+
+        # 同一個 key 同時只讓一個執行緒向 MinIO 取檔，其他執行緒等待結果
+        with self._key_lock(key):
+            entry, tier = self._lookup(key)
+            if entry is not None and time.time() - entry.fetched_at < self.ttl:
+                self._count(f"{tier}_hits")
+                return entry
+            return self._fetch(key, entry)
+
+    def open(self, key):
+        """
+        取得物件並開啟磁碟上的內容：回傳 (CachedObject, 檔案物件)；記憶體中的物件檔案物件為 None。
+        檔案開啟後即使被淘汰刪除，仍可讀完。若開啟前檔案已被刪除，丟掉這筆快取並重新取檔一次；
+        仍然失敗或物件太大時回傳 (None, None)，由呼叫端直接從 MinIO 串流。
+        :raises object_store.ObjectNotFoundError: 物件不存在。
+        :raises object_store.ObjectStoreError: MinIO 失敗且沒有可用的舊快取。
+        """
+        for _ in range(2):
+            entry = self.get(key)
+            if entry is None or entry.data is not None:
+                return entry, None
+            try:
+                return entry, open(entry.path, "rb")
+            except FileNotFoundError:
+                self._count("vanished")
+                with self._lock:
+                    if self._disk.get(key) is entry:
+                        self._drop_disk(key)
+        return None, None
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop_memory(key)
+            self._drop_disk(key)
+
+    def stats(self):
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"] + self._counters["revalidated"] + self._counters["refetched"]
+            return dict(
+                self._counters,
+                hit_rate=round(hits / lookups, 3) if lookups else 0.0,
+                ttl=self.ttl,
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_used,
+                memory_limit=self.memory_bytes,
+                disk_dir=self.disk_dir,
+                disk_entries=len(self._disk),
+                disk_bytes=self._disk_used,
+                disk_limit=self.disk_bytes,
+            )
+
+    # --- 取檔與驗證 ---
+
+    def _fetch(self, key, stale):
+        headers = {"If-None-Match": stale.etag} if stale is not None and stale.etag else None
+        try:
+            obj = object_store.get_object(key, headers)
+        except object_store.ObjectNotFoundError:
+            self.invalidate(key)
+            raise
+        except object_store.ObjectStoreError as e:
+            self._count("errors")
+            if stale is not None and time.time() - stale.fetched_at < self.stale_max:
+                logger.warning("MinIO error for %s, serving stale copy: %s", key, e)
+                self._count("stale_served")
+                return stale
+            raise
+
+        if obj["status"] == 304:
+            # 內容沒有變，只延長有效時間
+            self._count("revalidated")
+            stale.fetched_at = time.time()
+            if stale.path:
+                self._write_meta(stale)
+            return stale
+
+        body = obj["body"]
+        try:
+            size = int(obj["headers"].get("Content-Length", 0))
+            if size > self._max_cacheable():
+                self._count("uncacheable")
+                return None
+            data = body.read()
+        finally:
+            body.close()
+
+        self._count("refetched" if stale is not None else "misses")
+        entry = CachedObject(
+            key,
+            etag=obj["headers"].get("ETag"),
+            last_modified=obj["headers"].get("Last-Modified"),
+            content_type=obj["content_type"],
+            size=len(data),
+        )
+        self._store(entry, data)
+        return entry
+
+    def _max_cacheable(self):
+        if self.disk_dir:
+            return max(self.memory_max_object, self.disk_max_object)
+        return self.memory_max_object
+
+    # --- 記憶體 / 磁碟兩層 ---
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, "memory"
+            entry = self._disk.get(key)
+            if entry is not None:
+                self._disk.move_to_end(key)
+                return entry, "disk"
+        return None, None
+
+    def _store(self, entry, data):
+        if entry.size <= self.memory_max_object or not self.disk_dir:
+            entry.data = data
+            with self._lock:
+                self._drop_disk(key=entry.key)
+                self._drop_memory(entry.key)
+                self._memory[entry.key] = entry
+                self._memory_used += entry.size
+                while self._memory_used > self.memory_bytes and self._memory:
+                    _, old = self._memory.popitem(last=False)
+                    self._memory_used -= old.size
+            return
+
+        path = self._disk_path(entry.key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            entry.path = path
+            self._write_meta(entry)
+        except OSError as e:
+            logger.warning("Cannot write object cache file for %s: %s", entry.key, e)
+            # 寫不進磁碟時仍以這次取得的內容回應
+            entry.data = data
+            return
+        with self._lock:
+            self._drop_memory(entry.key)
+            old = self._disk.pop(entry.key, None)
+            if old is not None:
+                self._disk_used -= old.size
+            self._disk[entry.key] = entry
+            self._disk_used += entry.size
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                old_key = next(iter(self._disk))
+                self._drop_disk(old_key)
+
+    def _drop_memory(self, key):
+        # 呼叫端須持有 self._lock
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old.size
+
+    def _drop_disk(self, key):
+        # 呼叫端須持有 self._lock
+        old = self._disk.pop(key, None)
+        if old is None:
+            return
+        self._disk_used -= old.size
+        for path in (old.path, old.path + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def _write_meta(self, entry):
+        tmp_path = f"{entry.path}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry.meta(), f, ensure_ascii=False)
+        os.replace(tmp_path, entry.path + ".json")
+
+    def _claim_disk_slot(self, base_dir):
+        """
+        在 base_dir 下取得一個沒有其他行程使用的 slot 資料夾（slot-0、slot-1…），以 flock 鎖定到行程結束。
+        多個 gunicorn worker 各自使用自己的資料夾與索引，不會刪除或淘汰其他 worker 的檔案；
+        重啟後第一個 worker 仍會拿到 slot-0，沿用既有的快取。
+        """
+        try:
+            import fcntl
+        except ImportError:
+            # 沒有 flock 的平台改用行程專用的資料夾
+            return os.path.join(base_dir, f"pid-{os.getpid()}")
+        for n in range(int(os.getenv("OBJECT_CACHE_DISK_SLOTS", 64))):
+            path = os.path.join(base_dir, f"slot-{n}")
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, ".lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self._slot_lock_file = lock_file
+            return path
+        raise OSError(f"no free cache slot under {base_dir}")
+
+    def _load_disk_index(self):
+        """啟動時取得本行程的 slot，並讀回其中既有的快取，依取得時間由舊到新排列。"""
+        try:
+            self.disk_dir = self._claim_disk_slot(self.disk_dir)
+            os.makedirs(self.disk_dir, exist_ok=True)
+            names = os.listdir(self.disk_dir)
+        except OSError as e:
+            logger.warning("Object cache dir %s unavailable, disk tier disabled: %s", self.disk_dir, e)
+            self.disk_dir = None
+            return
+        entries = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name[:-len(".json")])
+            try:
+                with open(path + ".json", "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if os.path.getsize(path) != meta["size"]:
+                    continue
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append(CachedObject(path=path, **meta))
+        for entry in sorted(entries, key=lambda e: e.fetched_at):
+            self._disk[entry.key] = entry
+            self._disk_used += entry.size
+
+    # --- 其他 ---
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_object_cache():
+    """取得行程內共用的 ObjectCache。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ObjectCache()
+    return _cache
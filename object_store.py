@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+# 這些請求標頭會原封不動轉給 MinIO，由 MinIO 判斷 304 / 206
+_CONDITIONAL_PARAMS = {
+    "Range": "Range",
+    "If-None-Match": "IfNoneMatch",
+    "If-Modified-Since": "IfModifiedSince",
+    "If-Match": "IfMatch",
+    "If-Unmodified-Since": "IfUnmodifiedSince",
+}
+
+
+class ObjectNotFoundError(Exception):
+    """物件不存在。"""
+
+
+class ObjectPreconditionFailedError(Exception):
+    """If-Match 或 If-Unmodified-Since 條件不成立（412）。"""
+
+
+class ObjectRangeNotSatisfiableError(Exception):
+    """Range 超出物件範圍（416）。"""
+
+
+class ObjectStoreError(Exception):
+    """無法連線到物件儲存或其他非預期錯誤。"""
+
+
+def get_bucket():
+    return os.getenv("MINIO_BUCKET_NAME", "veg-data-bucket")
+
+
+def get_client():
+    """
+    取得行程內共用的 S3 (MinIO) client，第一次呼叫時才建立。
+    boto3 的 client 可以跨執行緒共用；連線池大小由 MINIO_MAX_POOL_CONNECTIONS 設定。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                max_pool = int(os.getenv("MINIO_MAX_POOL_CONNECTIONS", 20))
+                # Session 不是執行緒安全的，只在建立 client 時使用
+                session = boto3.session.Session()
+                _client = session.client(
+                    "s3",
+                    endpoint_url=os.getenv("MINIO_ENDPOINT"),
+                    aws_access_key_id=os.getenv("MINIO_ACCESS_KEY"),
+                    aws_secret_access_key=os.getenv("MINIO_SECRET_KEY"),
+                    config=Config(
+                        signature_version="s3v4",
+                        max_pool_connections=max_pool,
+                        connect_timeout=float(os.getenv("MINIO_CONNECT_TIMEOUT", 5)),
+                        read_timeout=float(os.getenv("MINIO_READ_TIMEOUT", 30)),
+                        retries={"max_attempts": 3, "mode": "standard"},
+                    ),
+                )
+                logger.info("MinIO client created (max_pool_connections=%s)", max_pool)
+    return _client
+
+
+def get_object(key, request_headers=None, bucket=None):
+    """
+    以 GetObject 取得物件，不讀取內容。
+    :param request_headers: 瀏覽器送來的標頭；Range 與 If-None-Match 等條件標頭會轉給 MinIO。
+    :return: dict，包含：
+        status：200、206 或 304
+        body：botocore StreamingBody（304 時為 None），呼叫端負責 close()
+        headers：要回傳給瀏覽器的 ETag、Last-Modified、Content-Length 等
+        content_type：MinIO 記錄的 Content-Type
+    :raises ObjectNotFoundError: 物件不存在。
+    :raises ObjectPreconditionFailedError: If-Match / If-Unmodified-Since 條件不成立。
+    :raises ObjectRangeNotSatisfiableError: Range 超出物件範圍。
+    :raises ObjectStoreError: 其他錯誤（例如連線失敗）。
+    """
+    params = {"Bucket": bucket or get_bucket(), "Key": key}
+    for header, param in _CONDITIONAL_PARAMS.items():
+        value = (request_headers or {}).get(header)
+        if value:
+            params[param] = value
+
+    try:
+        obj = get_client().get_object(**params)
+    except ClientError as e:
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        code = e.response.get("Error", {}).get("Code")
+        if status == 304:
+            return {
+                "status": 304,
+                "body": None,
+                "headers": _response_headers(e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})),
+                "content_type": None,
+            }
+        if status == 404 or code in ("NoSuchKey", "NoSuchBucket", "404"):
+            raise ObjectNotFoundError(key) from e
+        if status == 412 or code == "PreconditionFailed":
+            raise ObjectPreconditionFailedError(key) from e
+        if status == 416 or code == "InvalidRange":
+            raise ObjectRangeNotSatisfiableError(key) from e
+        raise ObjectStoreError(f"{code or status}: {e}") from e
+    except Exception as e:
+        raise ObjectStoreError(str(e)) from e
+
+    raw_headers = obj.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    return {
+        "status": obj.get("ResponseMetadata", {}).get("HTTPStatusCode", 200),
+        "body": obj["Body"],
+        "headers": _response_headers(raw_headers),
+        "content_type": obj.get("ContentType"),
+    }
+
+
+def _response_headers(raw_headers):
+    """從 MinIO 的回應標頭挑出要轉給瀏覽器的快取與 Range 相關標頭（botocore 的鍵為小寫）。"""
+    names = {
+        "etag": "ETag",
+        "last-modified": "Last-Modified",
+        "content-length": "Content-Length",
+        "content-range": "Content-Range",
+        "accept-ranges": "Accept-Ranges",
+    }
+    headers = {names[k]: v for k, v in raw_headers.items() if k in names}
+    headers.setdefault("Accept-Ranges", "bytes")
+    return headers
+
+
+def iter_body(body, chunk_size=None):
+    """以固定大小的區塊讀取 StreamingBody，讀完或中斷時關閉連線並歸還連線池。"""
+    chunk_size = chunk_size or int(os.getenv("OBJECT_STREAM_CHUNK_SIZE", 64 * 1024))
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+    finally:
+        body.close()
@@ -0,0 +1,272 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# API 提供的統計區間（天）；每個區間的統計在載入時預先算好
+PRICE_WINDOWS = (7, 14, 30)
+
+# ingest_prices.py 的輸出位置：本機檔案，或 MinIO 上的 PRICE_STORE_KEY
+DEFAULT_PRICE_STORE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "veg_data", "prices", "prices.npz"
+)
+PRICE_STORE_KEY = "prices/prices.npz"
+
+_EPOCH = date(1970, 1, 1)
+
+
+def day_number(d):
+    """日期轉成自 1970-01-01 起的天數，作為欄位索引的基準。"""
+    return (d - _EPOCH).days
+
+
+def day_to_iso(day):
+    return (_EPOCH + timedelta(days=int(day))).isoformat()
+
+
+def _round(value):
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+class PriceStore:
+    """
+    每日批發價格的欄式儲存：
+    - vege_ids：(蔬菜數,) 每一列對應的 vege_id
+    - prices / volumes：(蔬菜數, 天數) float32，第 j 欄是 start_day + j 那一天；沒有交易的日子為 NaN
+    日期索引是連續的日曆，最近 N 天就是每列最後 N 欄，區間查詢只需切片，成本與區間長度成正比。
+    各 PRICE_WINDOWS 區間的平均、最高、最低與漲跌幅在建立時一次向量化算好。
+    """
+
+    def __init__(self, start_day, vege_ids, prices, volumes, meta=None):
+        self.start_day = int(start_day)
+        self.vege_ids = np.asarray(vege_ids, dtype=np.int32)
+        self.prices = np.asarray(prices, dtype=np.float32).reshape(len(self.vege_ids), -1)
+        self.volumes = np.asarray(volumes, dtype=np.float32).reshape(self.prices.shape)
+        self.meta = dict(meta or {})
+        self.unit = self.meta.get("unit", "元/公斤")
+        self._rows = {int(vege_id): row for row, vege_id in enumerate(self.vege_ids)}
+        self._summaries = {days: self._summarize(days) for days in PRICE_WINDOWS}
+
+    # --- 讀寫 ---
+
+    @classmethod
+    def load(cls, source):
+        """從 .npz 檔案路徑或檔案物件載入。"""
+        with np.load(source, allow_pickle=False) as data:
+            return cls(
+                int(data["start_day"]),
+                data["vege_ids"],
+                data["prices"],
+                data["volumes"],
+                json.loads(str(data["meta"])),
+            )
+
+    def save(self, path):
+        """寫到暫存檔後再取代，讀取中的行程不會讀到寫一半的檔案。"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                start_day=np.int32(self.start_day),
+                vege_ids=self.vege_ids,
+                prices=self.prices,
+                volumes=self.volumes,
+                meta=np.array(json.dumps(self.meta, ensure_ascii=False)),
+            )
+        os.replace(tmp_path, path)
+
+    # --- 查詢 ---
+
+    @property
+    def days(self):
+        return self.prices.shape[1]
+
+    @property
+    def end_day(self):
+        """最後一欄的日期（天數）；沒有任何資料時為 start_day - 1。"""
+        return self.start_day + self.days - 1
+
+    @property
+    def version(self):
+        """資料版本，供 API 產生 ETag。"""
+        return (self.meta.get("generated_at"), self.start_day, self.days, len(self.vege_ids))
+
+    def has(self, vege_id):
+        return vege_id in self._rows
+
+    def summary(self, vege_id, days):
+        """預先算好的區間統計；沒有這種蔬菜或區間內沒有交易時回傳 None。"""
+        return self._summaries[days].get(vege_id)
+
+    def summaries(self, days):
+        """所有在區間內有交易的蔬菜的統計，依 vege_id 排序。"""
+        return self._summaries[days]
+
+    def series(self, vege_id, days):
+        """最近 days 天的每日價格與交易量（只切出這幾欄，不掃描完整歷史）。"""
+        row = self._rows.get(vege_id)
+        if row is None:
+            return []
+        days = min(days, self.days)
+        start = self.days - days
+        prices = self.prices[row, start:]
+        volumes = self.volumes[row, start:]
+        return [
+            {
+                "date": day_to_iso(self.start_day + start + i),
+                "price": _round(prices[i]),
+                "volume": _round(volumes[i]),
+            }
+            for i in range(days)
+        ]
+
+    def _summarize(self, days):
+        days = min(days, self.days)
+        if not days or not len(self.vege_ids):
+            return {}
+        block = self.prices[:, self.days - days:].astype(np.float64)
+        volumes = self.volumes[:, self.days - days:].astype(np.float64)
+        valid = ~np.isnan(block)
+        counts = valid.sum(axis=1)
+        # 每列第一個與最後一個有交易的日子
+        first = valid.argmax(axis=1)
+        last = days - 1 - valid[:, ::-1].argmax(axis=1)
+        rows = np.arange(len(self.vege_ids))
+        first_price = block[rows, first]
+        last_price = block[rows, last]
+        filled = np.where(valid, block, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = filled.sum(axis=1) / counts
+            change = (last_price - first_price) / first_price * 100
+        low = np.where(valid, block, np.inf).min(axis=1)
+        high = np.where(valid, block, -np.inf).max(axis=1)
+        total_volume = np.nansum(volumes, axis=1)
+
+        window_start = day_to_iso(self.end_day - days + 1)
+        window_end = day_to_iso(self.end_day)
+        summaries = {}
+        for row in np.flatnonzero(counts):
+            summaries[int(self.vege_ids[row])] = {
+                "vege_id": int(self.vege_ids[row]),
+                "days": days,
+                "start": window_start,
+                "end": window_end,
+                "observations": int(counts[row]),
+                "mean": _round(mean[row]),
+                "min": _round(low[row]),
+                "max": _round(high[row]),
+                "change_pct": _round(change[row]),
+                "latest_price": _round(last_price[row]),
+                "latest_date": day_to_iso(self.end_day - days + 1 + last[row]),
+                "volume": _round(total_volume[row]),
+                "unit": self.unit,
+            }
+        return summaries
+
+    def stats(self):
+        return {
+            "vegetables": len(self.vege_ids),
+            "days": self.days,
+            "start": day_to_iso(self.start_day),
+            "end": day_to_iso(self.end_day),
+            "unit": self.unit,
+            "generated_at": self.meta.get("generated_at"),
+            "bytes": int(self.prices.nbytes + self.volumes.nbytes),
+        }
+
+
+def _load_from_object_store(etag=None):
+    """
+    從 MinIO 載入 PriceStore；帶 etag 時以 If-None-Match 條件式取得，內容沒變（304）時不必下載。
+    :return: (PriceStore 或 None, ETag)；內容沒變或 MinIO 上沒有價格資料時 PriceStore 為 None。
+    :raises object_store.ObjectStoreError: 無法連線等錯誤，由呼叫端決定何時重試。
+    """
+    import object_store
+
+    try:
+        obj = object_store.get_object(PRICE_STORE_KEY, {"If-None-Match": etag} if etag else None)
+    except object_store.ObjectNotFoundError:
+        logger.info("No price store available in object storage")
+        return None, etag
+    if obj["status"] == 304:
+        return None, etag
+    body = obj["body"]
+    try:
+        store = PriceStore.load(io.BytesIO(body.read()))
+    finally:
+        body.close()
+    return store, obj["headers"].get("ETag")
+
+
+_store = None
+# 目前資料的來源：("file", mtime) 或 ("minio", ETag)
+_store_source = None
+_next_check = 0.0
+_failures = 0
+_store_lock = threading.Lock()
+
+
+def _refresh():
+    # 呼叫端須持有 _store_lock
+    global _store, _store_source, _next_check, _failures
+    path = os.getenv("PRICE_STORE_PATH", DEFAULT_PRICE_STORE_PATH)
+    try:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime is not None:
+            if _store_source != ("file", mtime):
+                _store = PriceStore.load(path)
+                _store_source = ("file", mtime)
+                print(f"PriceStore 已載入 {path}：{_store.stats()}")
+        else:
+            etag = _store_source[1] if _store_source and _store_source[0] == "minio" else None
+            store, etag = _load_from_object_store(etag)
+            if store is not None:
+                _store, _store_source = store, ("minio", etag)
+                print(f"PriceStore 已從 MinIO 載入 {PRICE_STORE_KEY}（ETag {etag}）：{_store.stats()}")
+        _failures = 0
+        _next_check = time.time() + float(os.getenv("PRICE_STORE_CHECK_INTERVAL", 60))
+    except Exception as e:
+        # 保留目前的資料；連續失敗時重試間隔加倍（最多 10 倍）
+        _failures += 1
+        delay = float(os.getenv("PRICE_STORE_RETRY_INTERVAL", 10)) * min(2 ** (_failures - 1), 10)
+        _next_check = time.time() + delay
+        logger.warning("Cannot load price store (%d consecutive failures), retrying in %.0fs: %s",
+                       _failures, delay, e)
+
+
+def _refresh_in_background():
+    try:
+        _refresh()
+    finally:
+        _store_lock.release()
+
+
+def get_price_store():
+    """
+    取得行程內共用的 PriceStore；沒有價格資料時回傳 None。
+    優先讀本機的 PRICE_STORE_PATH，檔案更新後自動重新載入；本機沒有檔案時改從 MinIO 讀取，
+    並以 ETag 條件式請求確認 MinIO 上的檔案是否更新。
+    第一次呼叫時同步載入；之後每 PRICE_STORE_CHECK_INTERVAL 秒在背景執行緒檢查，
+    檢查期間請求繼續使用目前的資料，不必等待 MinIO。
+    """
+    if not _next_check:
+        with _store_lock:
+            if not _next_check:
+                _refresh()
+    elif time.time() >= _next_check and _store_lock.acquire(blocking=False):
+        if time.time() >= _next_check:
+            threading.Thread(target=_refresh_in_background, name="price-store-refresh", daemon=True).start()
+        else:
+            _store_lock.release()
+    return _store
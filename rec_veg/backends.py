@@ -0,0 +1,100 @@
+import os
+import threading
+
+import numpy as np
+
+from rec_veg.model_registry import get_model
+
+# 可用的推論後端：
+# - keras：原本的 model.predict（每次呼叫都會建立 tf.data 管線與 callbacks）
+# - function：預先追蹤 (trace) 好的 tf.function，直接呼叫計算圖
+# - tflite：轉成 TFLite 後以 Interpreter 執行，適合只有 CPU 的主機
+BACKENDS = ("keras", "function", "tflite")
+DEFAULT_BACKEND = "function"
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model_path, input_shape):
+        self.model_path = model_path
+
+    def __call__(self, batch):
+        return np.asarray(get_model(self.model_path).predict(batch, verbose=0))
+
+
+class FunctionBackend:
+    """以固定 input_signature 預先追蹤的 tf.function，批次大小可變動而不需重新追蹤。"""
+
+    name = "function"
+
+    def __init__(self, model_path, input_shape):
+        import tensorflow as tf
+
+        model = get_model(model_path)
+        signature = [tf.TensorSpec(shape=(None,) + tuple(input_shape), dtype=tf.float32)]
+
+        @tf.function(input_signature=signature)
+        def serve(x):
+            return model(x, training=False)
+
+        # 建構時就完成追蹤，第一個請求不必承擔追蹤成本
+        self._fn = serve.get_concrete_function()
+
+    def __call__(self, batch):
+        return self._fn(np.asarray(batch, dtype=np.float32)).numpy()
+
+
+class TFLiteBackend:
+    """
+    以 TFLite Interpreter 執行模型。轉換後的 .tflite 檔會快取在模型旁邊，
+    之後啟動時可直接載入，不必再把 Keras 模型放進記憶體。
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path, input_shape):
+        import tensorflow as tf
+
+        tflite_path = os.path.splitext(model_path)[0] + ".tflite"
+        if not os.path.exists(tflite_path):
+            converter = tf.lite.TFLiteConverter.from_keras_model(get_model(model_path))
+            with open(tflite_path, "wb") as f:
+                f.write(converter.convert())
+            print(f"已轉換 TFLite 模型：{tflite_path}")
+
+        self._interpreter = tf.lite.Interpreter(model_path=tflite_path)
+        self._input_index = self._interpreter.get_input_details()[0]["index"]
+        self._output_index = self._interpreter.get_output_details()[0]["index"]
+        self._input_shape = tuple(input_shape)
+        self._batch_size = None
+        # Interpreter 不是執行緒安全的
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(
+                    self._input_index, (batch.shape[0],) + self._input_shape
+                )
+                self._interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self._interpreter.set_tensor(self._input_index, batch)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output_index).copy()
+
+
+_BACKEND_CLASSES = {
+    "keras": KerasBackend,
+    "function": FunctionBackend,
+    "tflite": TFLiteBackend,
+}
+
+
+def create_backend(name, model_path, input_shape=(128, 128, 3)):
+    """依名稱建立推論後端；name 為 None 時讀取環境變數 INFER_BACKEND。"""
+    name = (name or os.getenv("INFER_BACKEND", DEFAULT_BACKEND)).lower()
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"未知的推論後端 '{name}'，可用選項：{', '.join(BACKENDS)}")
+    return _BACKEND_CLASSES[name](model_path, input_shape)
@@ -0,0 +1,124 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    將同時間進來的單張影像請求合併成一個批次做前向運算。
+    - 第一筆請求進來後最多等待 max_wait_ms，或湊滿 max_batch_size 張就送出。
+    - 每個呼叫者拿回自己那一列的預測機率。
+    """
+
+    def __init__(self, forward_fn, max_batch_size=None, max_wait_ms=None):
+        """
+        :param forward_fn: 接收 (N, H, W, C) 陣列並回傳 (N, 類別數) 機率的函式。
+        :param max_batch_size: 單一批次的最大張數，預設讀取 INFER_MAX_BATCH。
+        :param max_wait_ms: 湊批次的最長等待毫秒數，預設讀取 INFER_MAX_WAIT_MS。
+        """
+        self.forward_fn = forward_fn
+        self.max_batch_size = int(
+            max_batch_size if max_batch_size is not None else os.getenv("INFER_MAX_BATCH", 8)
+        )
+        self.max_wait = float(
+            max_wait_ms if max_wait_ms is not None else os.getenv("INFER_MAX_WAIT_MS", 5)
+        ) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batch_size_counts = {}
+        self._max_queue_depth = 0
+        self._last_batch_size = 0
+        self._last_batch_seconds = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="inference-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, image_array):
+        """
+        送出一張前處理後的影像 (H, W, C)，阻塞直到取得該張影像的預測機率。
+        """
+        if self.max_batch_size <= 1:
+            # 不合併批次時直接推論，省去排隊成本
+            self._record_batch(1, 0.0)
+            return self.forward_fn(np.expand_dims(image_array, axis=0))[0]
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image_array, future))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return future.result()
+
+    def _collect(self):
+        """取出一個批次：阻塞等第一筆，之後在時間窗內盡量湊滿。"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch]
+            try:
+                start = time.perf_counter()
+                inputs = np.stack([array for array, _ in batch], axis=0)
+                preds = self.forward_fn(inputs)
+                self._record_batch(len(batch), time.perf_counter() - start)
+                for i, future in enumerate(futures):
+                    future.set_result(preds[i])
+            except Exception as e:
+                print(f"批次推論失敗: {e}")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _record_batch(self, size, seconds):
+        with self._stats_lock:
+            self._requests += size
+            self._batches += 1
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._last_batch_size = size
+            self._last_batch_seconds = seconds
+
+    def stats(self):
+        """回傳佇列深度與批次填滿率等指標。"""
+        with self._stats_lock:
+            avg_batch = self._requests / self._batches if self._batches else 0.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": round(avg_batch, 2),
+                "avg_batch_fill": round(avg_batch / self.max_batch_size, 3) if self.max_batch_size else 0.0,
+                "batch_size_counts": dict(sorted(self._batch_size_counts.items())),
+                "last_batch_size": self._last_batch_size,
+                "last_batch_ms": round(self._last_batch_seconds * 1000.0, 2),
+            }
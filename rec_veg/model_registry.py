@@ -0,0 +1,102 @@
+import csv
+import os
+import resource
+import threading
+import time
+
+# 預設模型與類別檔位置（與 rec_veg.py 同一個資料夾）
+current_dir = os.path.dirname(__file__)
+DEFAULT_MODEL_PATH = os.path.join(current_dir, "model_mnV2(best).keras")
+DEFAULT_CLASSES_PATH = os.path.join(current_dir, "classes.csv")
+
+_lock = threading.Lock()
+_models = {}
+_classes = {}
+_class_names = {}
+_stats = {}
+
+
+def _current_rss_mb():
+    """回傳目前行程的常駐記憶體 (MB)，讀不到 /proc 時退回峰值 RSS。"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Linux 上 ru_maxrss 單位為 KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_model(model_path=DEFAULT_MODEL_PATH):
+    """
+    取得共用的 Keras 模型；同一個模型檔在每個行程中只會載入一次。
+    第一次呼叫時才真正載入，並記錄載入時間與記憶體增量。
+    """
+    key = os.path.abspath(model_path)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        # 取得鎖之後再檢查一次，避免多個執行緒同時載入
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        from tensorflow.keras.models import load_model
+
+        rss_before = _current_rss_mb()
+        start = time.perf_counter()
+        model = load_model(key)
+        load_seconds = time.perf_counter() - start
+        rss_after = _current_rss_mb()
+
+        _models[key] = model
+        _stats[key] = {
+            "model_path": key,
+            "load_seconds": round(load_seconds, 3),
+            "rss_before_mb": round(rss_before, 1),
+            "rss_after_mb": round(rss_after, 1),
+            "rss_delta_mb": round(rss_after - rss_before, 1),
+            "loaded_at": time.time(),
+        }
+        print(
+            f"模型已載入：{key}，耗時 {load_seconds:.2f} 秒，"
+            f"RSS {rss_before:.1f} MB -> {rss_after:.1f} MB"
+        )
+        return model
+
+
+def get_classes(csv_path=DEFAULT_CLASSES_PATH):
+    """取得共用的類別名稱清單（classes.csv 第二欄）。"""
+    key = os.path.abspath(csv_path)
+    classes = _classes.get(key)
+    if classes is None:
+        with open(key, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            classes = [row[1] for row in reader]
+        _classes[key] = classes
+    return classes
+
+
+def get_class_names(csv_path=DEFAULT_CLASSES_PATH):
+    """取得 classes.csv 每一列的 (英文名稱, 中文名稱)，順序與類別索引相同。"""
+    key = os.path.abspath(csv_path)
+    names = _class_names.get(key)
+    if names is None:
+        with open(key, "r", encoding="utf-8") as f:
+            names = [(row[0].strip(), row[1].strip()) for row in csv.reader(f) if len(row) >= 2]
+        _class_names[key] = names
+    return names
+
+
+def is_loaded(model_path=DEFAULT_MODEL_PATH):
+    return os.path.abspath(model_path) in _models
+
+
+def get_model_stats():
+    """回傳已載入模型的載入時間與記憶體資訊，以及目前的 RSS。"""
+    return {
+        "models": list(_stats.values()),
+        "rss_mb": round(_current_rss_mb(), 1),
+    }
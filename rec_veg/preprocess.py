@@ -0,0 +1,65 @@
+import numpy as np
+from PIL import Image
+
+# 模型輸入尺寸 (寬, 高)
+TARGET_SIZE = (128, 128)
+
+
+def decode_image(image_file, target_size=TARGET_SIZE):
+    """
+    解碼並縮放成 target_size 的 RGB PIL 影像。
+    JPEG 會先用 draft 模式在解碼階段就以 1/2、1/4、1/8 比例縮小（DCT 縮放），
+    手機拍的 12MP 照片不必完整解碼成全解析度再縮小。
+    """
+    img = Image.open(image_file)
+    if img.format == "JPEG":
+        # draft 會挑選「仍不小於 target_size」的最小縮放比例
+        img.draft("RGB", target_size)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != tuple(target_size):
+        # 與 keras load_img 預設相同的 nearest 插值
+        img = img.resize(target_size, Image.NEAREST)
+    return img
+
+
+def load_image_array(image_file, target_size=TARGET_SIZE, out=None):
+    """
+    將圖片解碼成模型需要的 float32 陣列 (高, 寬, 3)，數值範圍 0~1。
+    近似 img_to_array(load_img(f, target_size)) / 255.0，但只配置一次 float32 緩衝區。
+    JPEG 以 draft 模式在解碼時先做 DCT 縮小，之後的 nearest 縮放取樣自已縮小的影像，
+    像素值與完整解碼後再縮放的結果會有些微差異，並非逐位元相同。
+    :param image_file: 檔案路徑或 file-like 物件（例如 BytesIO）。
+    :param out: 可選的預先配置緩衝區，形狀須為 (高, 寬, 3)、dtype 為 float32。
+    """
+    return image_to_array(decode_image(image_file, target_size), out=out)
+
+
+def image_to_array(img, out=None):
+    """將已解碼的 RGB PIL 影像轉成 0~1 的 float32 陣列 (高, 寬, 3)。"""
+    shape = (img.size[1], img.size[0], 3)
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    elif out.shape != shape or out.dtype != np.float32:
+        raise ValueError(f"out 緩衝區形狀須為 {shape} 且為 float32")
+    # 直接把 uint8 像素除以 255 寫進 float32 緩衝區，不產生中間的 float 陣列
+    np.divide(np.asarray(img, dtype=np.uint8), np.float32(255.0), out=out)
+    return out
+
+
+
+def decode_center_crop(image_file, target_size=TARGET_SIZE, fraction=0.875):
+    """
+    取影像中央 fraction 比例的區域並縮放成 target_size，供測試時增強 (TTA) 使用。
+    draft 以「裁切後仍不小於 target_size」為準，避免裁切後再放大。
+    """
+    img = Image.open(image_file)
+    if img.format == "JPEG":
+        img.draft("RGB", (int(target_size[0] / fraction) + 1, int(target_size[1] / fraction) + 1))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    width, height = img.size
+    crop_w, crop_h = width * fraction, height * fraction
+    left, top = (width - crop_w) / 2, (height - crop_h) / 2
+    box = (round(left), round(top), round(left + crop_w), round(top + crop_h))
+    return img.resize(target_size, Image.NEAREST, box=box)
@@ -0,0 +1,402 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from rec_veg.backends import create_backend
+
+# 每個子行程兩個 slot：一個在推論、一個排隊，讓子行程不必空等
+SLOTS_PER_PROCESS = 2
+
+
+def parse_cpu_list(text):
+    """將 "0,2,4-7" 這類 CPU 清單字串轉成 [0, 2, 4, 5, 6, 7]。"""
+    cpus = []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _limit_threads(threads):
+    # 必須在 import TensorFlow 之前設定，TF 與 OpenMP 才會採用
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _worker_main(index, shm_name, slots_shape, tasks, results,
+                 factory, backend_name, model_path, input_shape, threads, cpus):
+    """推論子行程：載入一次模型，之後從共享記憶體讀取 uint8 批次並回傳機率。"""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    _limit_threads(threads)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        try:
+            backend = factory(backend_name, model_path, input_shape)
+            # 正規化用的 float32 緩衝區，每個行程只配置一次
+            scratch = np.empty(slots_shape[1:], dtype=np.float32)
+            backend(scratch[:1])
+        except Exception as e:
+            results.put(("failed", index, f"{type(e).__name__}: {e}"))
+            return
+        results.put(("ready", index, os.getpid()))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, slot, size = task
+            try:
+                batch = scratch[:size]
+                np.divide(slots[slot, :size], np.float32(255.0), out=batch)
+                preds = np.asarray(backend(batch), dtype=np.float32)
+                results.put(("result", task_id, preds))
+            except Exception as e:
+                results.put(("error", task_id, f"{type(e).__name__}: {e}"))
+    finally:
+        del slots
+        shm.close()
+
+
+class InferenceProcessPool:
+    """
+    在獨立的推論子行程中執行模型，讓 Flask 行程只負責 I/O、JSON 與 Flex。
+    - 每個子行程只載入一次模型（以 spawn 啟動，不會繼承父行程的 TensorFlow 狀態）。
+    - 前處理後的 uint8 影像寫入共享記憶體的 slot，佇列只傳 (task_id, slot, 張數)；
+      除以 255 的正規化在子行程中完成。
+    - 每個 slot 固定屬於一個子行程，任務放進該子行程自己的佇列，父行程因此知道每個任務在哪個行程；
+      slot 要等子行程回報結果（或行程結束）才歸還，呼叫者逾時放棄時子行程不會讀到被覆寫的資料。
+    - 可呼叫物件介面與 backends.py 的推論後端相同，可直接交給 MicroBatcher 使用。
+    """
+
+    name = "process-pool"
+
+    def __init__(
+        self,
+        model_path,
+        backend=None,
+        input_shape=(128, 128, 3),
+        processes=None,
+        threads=None,
+        max_batch_size=None,
+        cpus=None,
+        timeout=None,
+        factory=create_backend,
+    ):
+        """
+        :param backend: 子行程內使用的推論後端名稱（預設讀取 INFER_BACKEND）。
+        :param processes: 推論子行程數（預設讀取 INFER_PROCESSES，至少 1）。
+        :param threads: 每個子行程的 TensorFlow 運算執行緒數（預設讀取 INFER_THREADS_PER_PROCESS）。
+        :param max_batch_size: 每個 slot 可容納的張數（預設讀取 INFER_MAX_BATCH）。
+        :param cpus: 例如 "2-5"，平均分配給各子行程並綁定（預設讀取 INFER_CPUS，空白表示不綁定）。
+        :param timeout: 等待單一批次結果、以及等待子行程啟動的秒數（預設讀取 INFER_TIMEOUT）。
+        :param factory: 在子行程中建立推論後端的函式，須可被 pickle。
+        """
+        self.model_path = model_path
+        self.backend_name = backend
+        self.input_shape = tuple(input_shape)
+        self.processes = max(1, int(processes if processes is not None else os.getenv("INFER_PROCESSES", 1)))
+        self.threads = max(1, int(threads if threads is not None else os.getenv("INFER_THREADS_PER_PROCESS", 1)))
+        self.max_batch_size = max(1, int(
+            max_batch_size if max_batch_size is not None else os.getenv("INFER_MAX_BATCH", 8)
+        ))
+        self.timeout = float(timeout if timeout is not None else os.getenv("INFER_TIMEOUT", 120))
+        self._factory = factory
+        self._cpu_sets = self._split_cpus(parse_cpu_list(cpus if cpus is not None else os.getenv("INFER_CPUS", "")))
+
+        # slot i 屬於子行程 i // SLOTS_PER_PROCESS
+        self.num_slots = self.processes * SLOTS_PER_PROCESS
+        self._slots_shape = (self.num_slots, self.max_batch_size) + self.input_shape
+        self._ctx = multiprocessing.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self._slots_shape)))
+        self._slots = np.ndarray(self._slots_shape, dtype=np.uint8, buffer=self._shm.buf)
+        # 每個子行程可用的 slot；取用時挑空閒 slot 最多的子行程，避免排在忙碌的子行程後面
+        self._free_slots = [
+            list(range(index * SLOTS_PER_PROCESS, (index + 1) * SLOTS_PER_PROCESS))
+            for index in range(self.processes)
+        ]
+        self._slot_cond = threading.Condition()
+
+        self._tasks = [None] * self.processes
+        self._results = self._ctx.Queue()
+        self._pending = {}
+        # 已送出、子行程尚未回報的任務：task_id -> slot（呼叫者逾時放棄後仍保留，直到 slot 可以歸還）
+        self._task_slots = {}
+        self._pending_lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._workers = [None] * self.processes
+        self._ready = set()
+        self._failed = set()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._errors = 0
+        self._restarts = 0
+        self._total_seconds = 0.0
+
+        try:
+            for index in range(self.processes):
+                self._start_worker(index)
+            self._wait_ready()
+        except Exception:
+            self.close()
+            raise
+
+        self._listener = threading.Thread(
+            target=self._listen, name="inference-pool-results", daemon=True
+        )
+        self._listener.start()
+        atexit.register(self.close)
+        print(
+            f"推論子行程已就緒：{self.processes} 個行程 × {self.threads} 執行緒，"
+            f"{self.num_slots} 個 slot（每個 {self.max_batch_size} 張）"
+        )
+
+    def _split_cpus(self, cpus):
+        if not cpus:
+            return [None] * self.processes
+        # 依序平均切分；CPU 數比行程少時輪流共用
+        if len(cpus) < self.processes:
+            return [[cpus[i % len(cpus)]] for i in range(self.processes)]
+        per = len(cpus) // self.processes
+        return [cpus[i * per:(i + 1) * per] for i in range(self.processes)]
+
+    def _start_worker(self, index):
+        # 每次啟動都使用新的任務佇列，已結束的行程佇列裡殘留的任務不會被新行程執行
+        self._tasks[index] = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                index, self._shm.name, self._slots_shape, self._tasks[index], self._results,
+                self._factory, self.backend_name, self.model_path, self.input_shape,
+                self.threads, self._cpu_sets[index],
+            ),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[index] = process
+
+    def _wait_ready(self):
+        """阻塞直到所有子行程載入完模型；任何一個失敗或逾時就拋出例外。"""
+        deadline = time.monotonic() + self.timeout
+        while len(self._ready) < self.processes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"推論子行程 {self.timeout:.0f} 秒內未就緒")
+            try:
+                kind, index, payload = self._results.get(timeout=min(remaining, 1.0))
+            except queue.Empty:
+                for index, process in enumerate(self._workers):
+                    if not process.is_alive() and index not in self._ready:
+                        raise RuntimeError(f"推論子行程 {index} 啟動時結束（exit code {process.exitcode}）")
+                continue
+            if kind == "failed":
+                raise RuntimeError(f"推論子行程 {index} 載入模型失敗：{payload}")
+            if kind == "ready":
+                self._ready.add(index)
+
+    def _listen(self):
+        """
+        接收子行程的結果並喚醒對應的呼叫者；每一輪都檢查子行程是否意外結束，
+        結束的子行程手上的任務立即以例外結束，並重新啟動該子行程。
+        """
+        while not self._closed:
+            try:
+                kind, key, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+            if kind in ("result", "error"):
+                with self._pending_lock:
+                    future = self._pending.pop(key, None)
+                    slot = self._task_slots.pop(key, None)
+                if slot is not None:
+                    self._release_slot(slot)
+                if future is None:
+                    pass  # 呼叫者已逾時放棄
+                elif kind == "result":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload))
+            elif kind == "ready":
+                self._ready.add(key)
+                print(f"推論子行程 {key} 已重新就緒（pid {payload}）")
+            elif kind == "failed":
+                # 載入模型失敗的子行程不再自動重啟，避免無限重試
+                self._ready.discard(key)
+                self._failed.add(key)
+                print(f"推論子行程 {key} 載入模型失敗：{payload}")
+                with self._slot_cond:
+                    self._slot_cond.notify_all()
+            self._check_workers()
+
+    def _check_workers(self):
+        """讓已結束的子行程的任務立即失敗並歸還 slot，再重新啟動意外結束的子行程。"""
+        for index, process in enumerate(self._workers):
+            if self._closed or process is None or process.is_alive():
+                continue
+            # 持有 _pending_lock 時送出任務與更換佇列，不會有任務送進已結束行程的舊佇列後無人處理
+            with self._pending_lock:
+                lost = [
+                    task_id for task_id, slot in self._task_slots.items()
+                    if slot // SLOTS_PER_PROCESS == index
+                ]
+                for task_id in lost:
+                    self._release_slot(self._task_slots.pop(task_id))
+                    future = self._pending.pop(task_id, None)
+                    if future is not None and not future.done():
+                        future.set_exception(RuntimeError(
+                            f"推論子行程 {index} 處理任務時結束（exit code {process.exitcode}）"
+                        ))
+                if index in self._failed:
+                    continue
+                print(f"推論子行程 {index} 已結束（exit code {process.exitcode}），重新啟動")
+                self._ready.discard(index)
+                with self._stats_lock:
+                    self._restarts += 1
+                self._start_worker(index)
+
+    def _acquire_slot(self):
+        """取得一個 slot：優先選已就緒、空閒 slot 最多的子行程；載入模型失敗的子行程不再使用。"""
+        deadline = time.monotonic() + self.timeout
+        with self._slot_cond:
+            while True:
+                if len(self._failed) == self.processes:
+                    raise RuntimeError("所有推論子行程都無法載入模型")
+                candidates = [
+                    index for index, free in enumerate(self._free_slots)
+                    if free and index not in self._failed
+                ]
+                if candidates:
+                    index = max(candidates, key=lambda i: (i in self._ready, len(self._free_slots[i])))
+                    return self._free_slots[index].pop()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("等待推論 slot 逾時")
+                self._slot_cond.wait(remaining)
+
+    def _release_slot(self, slot):
+        with self._slot_cond:
+            self._free_slots[slot // SLOTS_PER_PROCESS].append(slot)
+            self._slot_cond.notify()
+
+    def __call__(self, batch):
+        """
+        對 (N, H, W, C) 批次做推論，回傳 (N, 類別數) 機率。
+        預期輸入為 0~255 的 uint8；float 輸入視為已正規化的 0~1 並轉回 uint8。
+        """
+        batch = np.asarray(batch)
+        if batch.dtype != np.uint8:
+            batch = np.clip(np.rint(batch * 255.0), 0, 255).astype(np.uint8)
+        if batch.shape[0] <= self.max_batch_size:
+            return self._run_chunk(batch)
+        return np.concatenate([
+            self._run_chunk(batch[i:i + self.max_batch_size])
+            for i in range(0, batch.shape[0], self.max_batch_size)
+        ])
+
+    def _run_chunk(self, chunk):
+        if self._closed:
+            raise RuntimeError("推論子行程池已關閉")
+        size = chunk.shape[0]
+        slot = self._acquire_slot()
+        task_id = next(self._task_ids)
+        future = Future()
+        start = time.perf_counter()
+        dispatched = False
+        try:
+            self._slots[slot, :size] = chunk
+            with self._pending_lock:
+                self._pending[task_id] = future
+                self._task_slots[task_id] = slot
+                self._tasks[slot // SLOTS_PER_PROCESS].put((task_id, slot, size))
+                dispatched = True
+            preds = future.result(timeout=self.timeout)
+        except Exception:
+            with self._pending_lock:
+                self._pending.pop(task_id, None)
+                if not dispatched:
+                    self._task_slots.pop(task_id, None)
+            if not dispatched:
+                self._release_slot(slot)
+            # 已送出的任務，slot 由 _listen 在子行程回報結果或結束後歸還，不能在子行程讀取中被覆寫
+            with self._stats_lock:
+                self._errors += 1
+            raise
+        with self._stats_lock:
+            self._batches += 1
+            self._images += size
+            self._total_seconds += time.perf_counter() - start
+        return preds
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "processes": self.processes,
+                "threads_per_process": self.threads,
+                "cpus": self._cpu_sets,
+                "alive": sum(1 for p in self._workers if p is not None and p.is_alive()),
+                "ready": len(self._ready),
+                "slots": self.num_slots,
+                "free_slots": sum(len(free) for free in self._free_slots),
+                "in_flight": len(self._pending),
+                "quarantined_slots": len(self._task_slots) - len(self._pending),
+                "batches": self._batches,
+                "images": self._images,
+                "errors": self._errors,
+                "restarts": self._restarts,
+                "avg_batch_ms": round(self._total_seconds / self._batches * 1000.0, 2) if self._batches else 0.0,
+            }
+
+    def close(self):
+        """通知子行程結束並釋放共享記憶體；可重複呼叫。"""
+        if self._closed:
+            return
+        self._closed = True
+        for index, process in enumerate(self._workers):
+            if process is not None and process.is_alive():
+                self._tasks[index].put(None)
+        for process in self._workers:
+            if process is None:
+                continue
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        with self._pending_lock:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("推論子行程池已關閉"))
+            self._pending.clear()
+        del self._slots
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
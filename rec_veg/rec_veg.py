@@ -1,90 +1,248 @@
 import base64
 from io import BytesIO
-from tensorflow.keras.models import load_model
-from tensorflow.keras.utils import load_img, img_to_array
-import tensorflow as tf
 import numpy as np
-import csv
 import os # 新增 os 模組
+import threading
+import time
+from rec_veg.backends import create_backend
+from rec_veg.batcher import MicroBatcher
+from rec_veg.model_registry import (
+    DEFAULT_CLASSES_PATH,
+    DEFAULT_MODEL_PATH,
+    get_classes,
+    get_model,
+)
+from rec_veg.preprocess import TARGET_SIZE, decode_center_crop, decode_image, image_to_array
+from rec_veg.result import Candidate, InvalidImageError, RecognitionError, RecognitionResult
+from rec_veg.result_cache import RecognitionCache, content_hash, dhash
 
-# 載入模型
+# 每次辨識保留的候選類別數
+TOP_K = 3
+
+# 模型改由 model_registry 延遲載入，並與 VegetablePredictor 共用同一份
 current_dir = os.path.dirname(__file__)
-model_path = os.path.join(current_dir, 'model_mnV2(best).keras')
-model = load_model(model_path)
+model_path = DEFAULT_MODEL_PATH
 
 def load_classes(csv_path='classes.csv'):
     # 使用絕對路徑載入 classes.csv
     full_csv_path = os.path.join(os.path.dirname(__file__), csv_path)
-    with open(full_csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        return [row[1] for row in reader]
+    return get_classes(full_csv_path)
 
 # 載入類別名稱
 classes = load_classes('classes.csv')
 
+def decode_base64_image(base64_string):
+    """將（可能帶有 data URL 前綴的）base64 字串解碼成圖片位元組。"""
+    if base64_string.startswith("data:image"):
+        base64_string = base64_string.split(",")[1]
+    return base64.b64decode(base64_string)
+
 def rec_veg(base64_string):
     try:
-        # 處理 base64 字串
-        if base64_string.startswith("data:image"):
-            base64_string = base64_string.split(",")[1]
-        image_bytes = base64.b64decode(base64_string)
-        image_file = BytesIO(image_bytes)
-        print(image_file)
-
-        # 載入圖片並前處理
-        img = load_img(image_file, target_size=(128, 128))
-        img_array = img_to_array(img) / 255.0
-        img_array = tf.expand_dims(img_array, axis=0)
-
-        # 預測
-        preds = model.predict(img_array)
-        pred_idx = tf.argmax(preds, axis=1).numpy()[0]
-        confidence = tf.reduce_max(preds).numpy() * 100
-
-        print(f"預測類別：{classes[pred_idx]}")
+        return rec_veg_bytes(decode_base64_image(base64_string))
+    except Exception as e:
+        print(f"rec_veg 函數中發生錯誤: {e}")
+        return f"rec_veg 函數中發生錯誤: {e}"
+
+
+def recognize(image_bytes):
+    """
+    辨識圖片的原始位元組，回傳 RecognitionResult；失敗時拋出 RecognitionError。
+    與 /predict 共用同一個預測器（同一份模型與同一個批次佇列）。
+    """
+    return get_default_predictor().recognize_bytes(image_bytes)
+
+
+def rec_veg_bytes(image_bytes):
+    """與 rec_veg() 相同，但直接接收圖片的原始位元組，省去 base64 編解碼。"""
+    try:
+        result = recognize(image_bytes)
+        pred_class = result.label
+        confidence = result.confidence
+
+        print(f"預測類別：{pred_class}")
         print(f"信心度：{confidence:.2f}%")
 
         # 修改回傳值為元組 (蔬菜名稱, 信心度)
-        return f"預測類別：{classes[pred_idx]}\n信心度：{confidence:.2f}%"
+        return f"預測類別：{pred_class}\n信心度：{confidence:.2f}%"
 
     except Exception as e:
         print(f"rec_veg 函數中發生錯誤: {e}")
         return f"rec_veg 函數中發生錯誤: {e}"
 
 
-
-
-
 class VegetablePredictor:
     """
     一個封裝了蔬菜辨識模型的類別。
-    - 初始化時載入模型和類別。
-    - 提供一個 predict 方法來進行預測。
+    - 初始化時只載入類別；模型透過 model_registry 在第一次預測時載入，
+      並與 rec_veg() 共用同一份。
+    - 提供一個 predict 方法來進行預測；同時進來的請求會經由 MicroBatcher
+      合併成一個批次推論。
     """
 
-    def __init__(self, model_path, classes_path):
+    def __init__(
+        self,
+        model_path=DEFAULT_MODEL_PATH,
+        classes_path=DEFAULT_CLASSES_PATH,
+        max_batch_size=None,
+        max_wait_ms=None,
+        backend=None,
+        processes=None,
+        cache_size=None,
+        tta=None,
+        tta_threshold=None,
+    ):
         """
         類別的建構函式，在物件被建立時執行。
         :param model_path: Keras 模型的檔案路徑。
         :param classes_path: classes.csv 的檔案路徑。
+        :param max_batch_size: 批次推論的最大張數（預設讀取 INFER_MAX_BATCH）。
+        :param max_wait_ms: 湊批次的最長等待毫秒數（預設讀取 INFER_MAX_WAIT_MS）。
+        :param backend: 推論後端 keras / function / tflite（預設讀取 INFER_BACKEND）。
+        :param processes: 推論子行程數（預設讀取 INFER_PROCESSES）；0 表示在目前行程內推論。
+        :param cache_size: 辨識結果快取的 key 數（預設讀取 RECOG_CACHE_SIZE）；0 表示停用。
+        :param tta: 是否啟用測試時增強（預設讀取 INFER_TTA，"1" 為啟用）。
+        :param tta_threshold: 第一次推論的最高機率低於此值才做 TTA（預設讀取 INFER_TTA_THRESHOLD）。
         """
         try:
-            self.model = load_model(model_path)
+            self.model_path = model_path
+            self.backend_name = backend
+            self.processes = int(processes if processes is not None else os.getenv("INFER_PROCESSES", 0))
+            self._backend = None
+            self._backend_lock = threading.Lock()
+            # 模型暖機狀態：cold / loading / ready / failed
+            self._warm_state = "cold"
+            self._warm_error = None
+            self._warm_seconds = None
+            self._warm_thread = None
             self.classes = self._load_classes(classes_path)
-            print("模型和類別已成功載入到 VegetablePredictor 中。")
+            cache_size = int(cache_size if cache_size is not None else os.getenv("RECOG_CACHE_SIZE", 1024))
+            self.cache = RecognitionCache(max_entries=cache_size) if cache_size > 0 else None
+            if tta is None:
+                # 接受 1/0、true/false、yes/no、on/off 等寫法
+                tta = os.getenv("INFER_TTA", "0").strip().lower() not in ("", "0", "false", "no", "off")
+            self.tta = bool(tta)
+            self.tta_threshold = float(
+                tta_threshold if tta_threshold is not None else os.getenv("INFER_TTA_THRESHOLD", 0.8)
+            )
+            self._tta_lock = threading.Lock()
+            self._tta_runs = 0
+            self._tta_changed = 0
+            self.batcher = MicroBatcher(
+                self._forward, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+            )
+            print("類別已成功載入到 VegetablePredictor 中，模型將於首次使用時載入。")
         except Exception as e:
             print(f"錯誤：初始化 VegetablePredictor 失敗。請檢查檔案路徑。")
             raise e
 
+    @property
+    def model(self):
+        """共用的 Keras 模型，第一次存取時才載入。"""
+        return get_model(self.model_path)
+
+    @property
+    def backend(self):
+        """推論後端，第一次存取時才建立（包含載入模型與追蹤計算圖）。"""
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._warm_state = "loading"
+                    start = time.perf_counter()
+                    try:
+                        if self.processes > 0:
+                            # 延遲 import：只有啟用子行程時才需要 multiprocessing 相關模組
+                            from rec_veg.process_pool import InferenceProcessPool
+
+                            backend = InferenceProcessPool(
+                                self.model_path,
+                                backend=self.backend_name,
+                                input_shape=self.input_shape,
+                                processes=self.processes,
+                                max_batch_size=self.batcher.max_batch_size,
+                            )
+                        else:
+                            backend = create_backend(
+                                self.backend_name,
+                                self.model_path,
+                                input_shape=self.input_shape,
+                            )
+                        # 先跑一次空白批次，讓第一個真正的請求不必承擔初始化成本
+                        backend(np.zeros((1,) + self.input_shape, dtype=self.input_dtype))
+                    except Exception as e:
+                        self._warm_state = "failed"
+                        self._warm_error = str(e)
+                        raise
+                    self._backend = backend
+                    self._warm_seconds = round(time.perf_counter() - start, 3)
+                    self._warm_state = "ready"
+                    self._warm_error = None
+                    print(
+                        f"VegetablePredictor 使用推論後端：{backend.name}，"
+                        f"暖機耗時 {self._warm_seconds} 秒"
+                    )
+        return self._backend
+
+    @property
+    def input_shape(self):
+        return (TARGET_SIZE[1], TARGET_SIZE[0], 3)
+
+    @property
+    def input_dtype(self):
+        # 子行程模式傳送 uint8，正規化在子行程中完成
+        return np.uint8 if self.processes > 0 else np.float32
+
+    def warm_up(self):
+        """預先載入模型並建立推論後端，避免第一個請求承擔載入時間。"""
+        return self.backend
+
+    def warm_up_async(self):
+        """在背景執行緒暖機，立即返回；已在暖機或已就緒時不會重複啟動。"""
+        if self._warm_state == "ready" or (
+            self._warm_thread is not None and self._warm_thread.is_alive()
+        ):
+            return self._warm_thread
+
+        def run():
+            try:
+                self.warm_up()
+            except Exception as e:
+                print(f"背景暖機失敗: {e}")
+
+        self._warm_thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+        self._warm_thread.start()
+        return self._warm_thread
+
+    def is_ready(self):
+        """模型與推論後端是否已載入完成。"""
+        return self._warm_state == "ready"
+
+    def warm_status(self):
+        """回傳暖機狀態，供 /readyz 與 /api/metrics 使用。"""
+        return {
+            "state": self._warm_state,
+            "seconds": self._warm_seconds,
+            "error": self._warm_error,
+        }
+
+    def cache_stats(self):
+        """辨識結果快取的命中率等指標；停用時回傳 None。"""
+        return self.cache.stats() if self.cache else None
+
+    def pool_stats(self):
+        """子行程模式下回傳推論子行程池的指標，否則回傳 None。"""
+        backend = self._backend
+        return backend.stats() if backend is not None and hasattr(backend, "stats") else None
+
+    def _forward(self, batch):
+        """對 (N, 128, 128, 3) 的批次做一次前向運算，回傳 (N, 類別數) 機率。"""
+        return self.backend(batch)
+
     def _load_classes(self, csv_path):
         """
         私有方法，從 CSV 檔案載入類別名稱。
         """
-        with open(csv_path, "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            # 假設 CSV 第一行是標頭 (id, name)，所以從第二行開始讀取
-            # 如果您的 CSV 沒有標頭，請將 [1:] 移除
-            return [row[1] for row in list(reader)]
+        return get_classes(csv_path)
 
     def predict(self, base64_string):
         """
@@ -92,28 +250,133 @@ class VegetablePredictor:
         :param base64_string: 圖片的 Base64 字串。
         :return: 一個包含預測結果的字典。
         """
-        # 處理 base64 字串
-        if base64_string.startswith("data:image"):
-            base64_string = base64_string.split(",")[1]
-
-        image_bytes = base64.b64decode(base64_string)
-        image_file = BytesIO(image_bytes)
-
-        # 載入圖片並前處理
-        img = load_img(image_file, target_size=(128, 128))
-        img_array = img_to_array(img) / 255.0
-        img_array = tf.expand_dims(img_array, axis=0)
-
-        # 預測
-        preds = self.model.predict(img_array)
-        pred_idx = tf.argmax(preds, axis=1).numpy()[0]
-        confidence = tf.reduce_max(preds).numpy() * 100
-
-        # 準備回傳的資料
-        result = {
-            "vegetable": self.classes[pred_idx],
-            "confidence": f"{confidence:.2f}",
-        }
+        try:
+            image_bytes = decode_base64_image(base64_string)
+        except Exception as e:
+            raise InvalidImageError(f"base64 格式錯誤：{e}") from e
+        return self.predict_bytes(image_bytes)
+
+    def predict_bytes(self, image_bytes):
+        """
+        直接對圖片的原始位元組（JPEG/PNG 等）進行預測，不經過暫存檔或 base64。
+        :param image_bytes: bytes、bytearray 或 memoryview。
+        :return: 一個包含預測結果的字典（RecognitionResult.to_dict()）。
+        """
+        return self.recognize_bytes(image_bytes).to_dict()
+
+    def recognize_bytes(self, image_bytes, top_k=TOP_K):
+        """
+        對圖片的原始位元組進行辨識。
+        :return: RecognitionResult（含前 top_k 個候選類別）。
+        :raises InvalidImageError: 資料無法解碼成圖片。
+        :raises RecognitionError: 模型載入或推論失敗。
+        """
+        # 完全相同的檔案：解碼前就能從快取取得結果
+        sha1 = content_hash(image_bytes) if self.cache else None
+        if sha1 is not None:
+            cached = self.cache.get("sha1", sha1)
+            if cached is not None:
+                return cached
+
+        # 載入圖片並縮小（JPEG draft 解碼）；BytesIO 包裝 bytes 時不會複製內容
+        try:
+            img = decode_image(BytesIO(image_bytes), target_size=TARGET_SIZE)
+        except Exception as e:
+            raise InvalidImageError(f"無法讀取圖片：{e}") from e
+
+        # 內容相同但重新壓縮過的圖片（例如轉傳）：以感知雜湊比對
+        phash = dhash(img) if self.cache else None
+        if phash is not None:
+            cached = self.cache.get("dhash", phash)
+            if cached is not None:
+                self.cache.put(cached, sha1=sha1)
+                return cached
+            self.cache.record_miss()
+
+        # 子行程模式只傳 uint8，否則直接寫入 float32 緩衝區
+        if self.processes > 0:
+            img_array = np.asarray(img, dtype=np.uint8)
+        else:
+            img_array = image_to_array(img)
+
+        # 預測（與其他同時進來的請求合併成一個批次）
+        try:
+            preds = self.batcher.submit(img_array)
+        except Exception as e:
+            raise RecognitionError(f"模型推論失敗：{e}") from e
+
+        # 只有第一次推論不夠肯定時才做 TTA，有把握的預測不增加推論成本
+        augmented = self.tta and float(np.max(preds)) < self.tta_threshold
+        if augmented:
+            preds = self._augment(image_bytes, img_array, preds)
+        result = self._to_result(preds, top_k, tta=augmented)
+
+        if self.cache:
+            self.cache.put(result, sha1=sha1, dhash=phash)
+        print(f"預測結果: {result.label} ({result.confidence:.2f}%)")
+        return result
+
+    def _augment(self, image_bytes, first_array, first_preds):
+        """
+        測試時增強：將水平翻轉、中央裁切、中央裁切的水平翻轉三張影像
+        以一次批次推論，與第一次推論的機率平均。
+        """
+        try:
+            crop = decode_center_crop(BytesIO(image_bytes), target_size=TARGET_SIZE)
+            if self.processes > 0:
+                crop_array = np.asarray(crop, dtype=np.uint8)
+            else:
+                crop_array = image_to_array(crop)
+            views = np.stack([first_array[:, ::-1], crop_array, crop_array[:, ::-1]])
+            # 直接呼叫推論後端，三張影像一定在同一個批次中
+            probs = np.asarray(self._forward(views), dtype=np.float32)
+        except Exception as e:
+            print(f"TTA 失敗，改用第一次推論結果: {e}")
+            return first_preds
+        averaged = np.vstack([np.asarray(first_preds, dtype=np.float32)[None], probs]).mean(axis=0)
+        with self._tta_lock:
+            self._tta_runs += 1
+            if int(np.argmax(averaged)) != int(np.argmax(first_preds)):
+                self._tta_changed += 1
+        return averaged
+
+    def tta_stats(self):
+        """TTA 的啟用狀態、執行次數，以及改變第一名類別的次數。"""
+        with self._tta_lock:
+            return {
+                "enabled": self.tta,
+                "threshold": self.tta_threshold,
+                "runs": self._tta_runs,
+                "changed_top1": self._tta_changed,
+            }
+
+    def _to_result(self, preds, top_k, tta=False):
+        """將一列機率轉成 RecognitionResult。"""
+        preds = np.asarray(preds, dtype=np.float32)
+        order = np.argsort(-preds, kind="stable")[:max(1, top_k)]
+        candidates = tuple(
+            Candidate(class_index=int(i), label=self.classes[i], probability=float(preds[i]))
+            for i in order
+        )
+        best = candidates[0]
+        return RecognitionResult(
+            class_index=best.class_index,
+            label=best.label,
+            probability=best.probability,
+            top_k=candidates,
+            tta=tta,
+        )
+
+
+_default_predictor = None
+_default_predictor_lock = threading.Lock()
+
 
-        print(f"預測結果: {result}")
-        return result
\ No newline at end of file
+def get_default_predictor():
+    """取得行程內共用的 VegetablePredictor，供 rec_veg() 與 /predict 使用。"""
+    global _default_predictor
+    if _default_predictor is None:
+        with _default_predictor_lock:
+            if _default_predictor is None:
+                _default_predictor = VegetablePredictor()
+    return _default_predictor
\ No newline at end of file
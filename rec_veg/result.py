@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+
+
+class RecognitionError(Exception):
+    """辨識失敗（圖片無法解碼、模型載入或推論失敗）。"""
+
+
+class InvalidImageError(RecognitionError):
+    """收到的資料不是可解碼的圖片。"""
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """一個候選類別與其機率（0~1）。"""
+
+    class_index: int
+    label: str
+    probability: float
+
+
+@dataclass(frozen=True)
+class RecognitionResult:
+    """
+    一張圖片的辨識結果。
+    :ivar class_index: 最可能類別在 classes.csv 中的索引。
+    :ivar label: 最可能類別的中文名稱。
+    :ivar probability: 最可能類別的機率（0~1）。
+    :ivar top_k: 依機率由高到低的候選類別（包含第一名）。
+    :ivar tta: 是否為測試時增強 (TTA) 平均後的結果。
+    """
+
+    class_index: int
+    label: str
+    probability: float
+    top_k: tuple = ()
+    tta: bool = False
+
+    @property
+    def confidence(self):
+        """百分比形式的信心度（0~100）。"""
+        return self.probability * 100
+
+    def alternatives(self, min_probability=0.0):
+        """第一名以外、機率不低於 min_probability 的候選類別。"""
+        return [c for c in self.top_k[1:] if c.probability >= min_probability]
+
+    def to_dict(self):
+        """/predict 回傳的 JSON；保留原本的 vegetable 與 confidence 欄位。"""
+        return {
+            "vegetable": self.label,
+            "confidence": f"{self.confidence:.2f}",
+            "class_index": self.class_index,
+            "probability": round(self.probability, 6),
+            "top_k": [
+                {
+                    "class_index": c.class_index,
+                    "label": c.label,
+                    "probability": round(c.probability, 6),
+                }
+                for c in self.top_k
+            ],
+            "tta": self.tta,
+        }
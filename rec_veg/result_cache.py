@@ -0,0 +1,106 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def content_hash(image_bytes):
+    """原始位元組的 SHA-1；同一張檔案重送時不必解碼即可命中。"""
+    return hashlib.sha1(image_bytes).hexdigest()
+
+
+def dhash(img, hash_size=8):
+    """
+    差異雜湊 (dHash)：縮成 (hash_size+1)×hash_size 的灰階圖，
+    比較每列相鄰像素的明暗得到 64 位元整數。
+    重新壓縮或縮放過的同一張照片（例如群組轉傳）通常得到相同的值。
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class RecognitionCache:
+    """
+    辨識結果的 LRU 快取，同一筆結果以兩種 key 存放：
+    - ("sha1", 內容雜湊)：完全相同的檔案，解碼前就能命中。
+    - ("dhash", 感知雜湊)：內容相同但位元組不同的圖片（重新壓縮、轉傳）。
+      只接受完全相同的雜湊值：不同蔬菜的照片 dHash 可能只差幾個位元，
+      允許近似比對會把別張照片的辨識結果當成這張的結果回傳。
+    超過 max_entries 時淘汰最久未使用的 key；超過 ttl 秒的結果視為過期。
+    """
+
+    def __init__(self, max_entries=None, ttl=None):
+        """
+        :param max_entries: 最多保存的 key 數（預設讀取 RECOG_CACHE_SIZE）。
+        :param ttl: 結果的存活秒數，0 表示不過期（預設讀取 RECOG_CACHE_TTL）。
+        """
+        self.max_entries = int(
+            max_entries if max_entries is not None else os.getenv("RECOG_CACHE_SIZE", 1024)
+        )
+        self.ttl = float(ttl if ttl is not None else os.getenv("RECOG_CACHE_TTL", 3600))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {"sha1": 0, "dhash": 0}
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, kind, key):
+        """查詢單一 key；命中時更新 LRU 順序並回傳結果，否則回傳 None（不計入 miss）。"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[(kind, key)]
+                self._expirations += 1
+                return None
+            self._entries.move_to_end((kind, key))
+            self._hits[kind] += 1
+            return value
+
+    def record_miss(self):
+        with self._lock:
+            self._misses += 1
+
+    def put(self, value, **keys):
+        """以多個 key 存放同一筆結果，例如 put(result, sha1=..., dhash=...)。"""
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            for kind, key in keys.items():
+                if key is None:
+                    continue
+                self._entries[(kind, key)] = (value, expires_at)
+                self._entries.move_to_end((kind, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self._hits.values())
+            lookups = hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": hits,
+                "hits_exact": self._hits["sha1"],
+                "hits_perceptual": self._hits["dhash"],
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
@@ -0,0 +1,172 @@
+import csv
+import io
+import os
+import threading
+
+from db_pool import db_connection
+
+# 一次查詢取回食譜與依 step_no 排序的步驟（沒有步驟的食譜回傳空陣列）
+QUERY_RECIPES_BY_VEGE_ID = """
+    SELECT
+        mr.id,
+        mr.recipe,
+        mr.vege_id,
+        COALESCE(
+            array_agg(rs.step_no ORDER BY rs.step_no) FILTER (WHERE rs.recipe_id IS NOT NULL),
+            '{}'
+        ) AS step_nos,
+        COALESCE(
+            array_agg(rs.description ORDER BY rs.step_no) FILTER (WHERE rs.recipe_id IS NOT NULL),
+            '{}'
+        ) AS descriptions
+    FROM main_recipe AS mr
+    LEFT JOIN recipe_steps AS rs ON rs.recipe_id = mr.id
+    WHERE mr.vege_id = %(vege_id)s
+    GROUP BY mr.id, mr.recipe, mr.vege_id
+    ORDER BY mr.id
+    LIMIT %(limit)s;
+"""
+
+
+def query_recipes_by_vege_id(cursor, vege_id, limit=None):
+    """
+    以單一查詢取得某蔬菜的食譜與步驟。
+    :param limit: 最多回傳幾道食譜，None 表示不限制。
+    :return: [{"recipe_id", "recipe_name", "vege_id", "steps": [{"step_no", "description"}]}]
+    """
+    cursor.execute(QUERY_RECIPES_BY_VEGE_ID, {"vege_id": vege_id, "limit": limit})
+    recipes = []
+    for recipe_id, recipe_name, recipe_vege_id, step_nos, descriptions in cursor.fetchall():
+        recipes.append({
+            "recipe_id": recipe_id,
+            "recipe_name": recipe_name,
+            "vege_id": recipe_vege_id,
+            "steps": [
+                {"step_no": step_no, "description": description}
+                for step_no, description in zip(step_nos, descriptions)
+            ],
+        })
+    return recipes
+
+
+def get_recipes_by_vege_id(vege_id, limit=None):
+    """從連線池借一條連線查詢食譜；連線或查詢失敗時拋出例外，由呼叫端處理。"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        return query_recipes_by_vege_id(cursor, vege_id, limit=limit)
+
+
+# 網頁食譜頁使用的食譜 CSV（MinIO 上的物件 key）
+RECIPE_CSV_KEY = os.getenv("RECIPE_CSV_KEY", "大白菜_清理後食譜.csv")
+
+
+def parse_recipe_csv(text):
+    """
+    解析食譜 CSV（id, name, url, preview_ingredients, ingredients, steps, ...）。
+    ingredients 與 steps 以「|」分隔；每項食材為「名稱 份量」，沒有份量時記為「適量」。
+    """
+    recipes = []
+    rows = csv.reader(io.StringIO(text))
+    next(rows, None)  # 標題列
+    for index, row in enumerate(rows):
+        if len(row) < 7:
+            continue
+        recipe_id, name, url, preview, ingredients, steps = (col.strip() for col in row[:6])
+        try:
+            recipe_id = int(recipe_id)
+        except ValueError:
+            recipe_id = index + 1000
+        ingredient_list = []
+        for item in ingredients.split("|"):
+            parts = item.strip().split(" ")
+            ingredient_list.append({"name": parts[0], "amount": " ".join(parts[1:]) or "適量"})
+        recipes.append({
+            "id": recipe_id,
+            "name": name,
+            "url": url,
+            "preview": preview,
+            "ingredients": ingredient_list,
+            "steps": [
+                {"step": step_no, "description": step.strip()}
+                for step_no, step in enumerate(steps.split("|"), start=1)
+            ],
+        })
+    return recipes
+
+
+class RecipeCsvIndex:
+    """
+    在伺服器端解析一次食譜 CSV 並保留在記憶體中，瀏覽器不必下載整份 CSV 自行解析。
+    CSV 經由 ObjectCache 取得；物件的 ETag 改變時才重新解析。
+    """
+
+    def __init__(self, key=None, fetch=None):
+        self.key = key or RECIPE_CSV_KEY
+        self._fetch = fetch or _fetch_object_text
+        # (版本, 食譜清單)；更新時整個 tuple 一次替換，讀取端不會拿到不同版本的組合
+        self._snapshot = (None, [])
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """回傳 (版本, 食譜清單)；版本為 CSV 的 ETag，可用來產生 API 的 ETag。"""
+        known_version, recipes = self._snapshot
+        version, text = self._fetch(self.key, known_version)
+        if version == known_version:
+            return known_version, recipes
+        with self._lock:
+            current = self._snapshot
+            if version != current[0]:
+                if text is None:
+                    version, text = self._fetch(self.key, None)
+                recipes = parse_recipe_csv(text)
+                current = (version, recipes)
+                self._snapshot = current
+                print(f"食譜 CSV {self.key} 已載入 {len(recipes)} 道食譜（版本 {version}）")
+            return current
+
+
+def _fetch_object_text(key, known_version):
+    """
+    從 ObjectCache 取得 CSV；版本與 known_version 相同時不讀取內容，回傳 (版本, None)。
+    :raises object_store.ObjectNotFoundError: CSV 不存在。
+    :raises object_store.ObjectStoreError: MinIO 無法連線且沒有可用的快取。
+    """
+    import object_store
+    from object_cache import get_object_cache
+
+    cached, file = get_object_cache().open(key)
+    if cached is None:
+        # 超過快取上限的大檔案直接向 MinIO 讀取；以 If-None-Match 確認版本，沒變（304）時不下載
+        obj = object_store.get_object(key, {"If-None-Match": known_version} if known_version else None)
+        if obj["status"] == 304:
+            return known_version, None
+        body = obj["body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        return obj["headers"].get("ETag"), data.decode("utf-8-sig")
+
+    version = cached.etag or f"{cached.size}-{cached.last_modified}"
+    if file is None:
+        data = cached.data
+    else:
+        # 磁碟上的快取以已開啟的檔案讀取，之後被淘汰刪除也不影響
+        with file:
+            data = None if version == known_version else file.read()
+    if version == known_version:
+        return version, None
+    return version, data.decode("utf-8-sig")
+
+
+_recipe_index = None
+_recipe_index_lock = threading.Lock()
+
+
+def get_recipe_index():
+    """取得行程內共用的 RecipeCsvIndex。"""
+    global _recipe_index
+    if _recipe_index is None:
+        with _recipe_index_lock:
+            if _recipe_index is None:
+                _recipe_index = RecipeCsvIndex()
+    return _recipe_index
@@ -2,6 +2,12 @@
 let vegetables = [];
 let recipes = [];
 let vegNameMapping = {};
+let vegNutrients = {}; // 蔬菜名稱 -> 營養成分（每 100 克）
+let vegSeasons = {}; // 蔬菜名稱 -> 產季，例如「11-3月」
+let vegIds = {}; // 蔬菜名稱 -> 資料庫的 vege_id（價格 API 使用）
+let priceSummaries = {}; // vege_id -> 最近 7 天的價格統計
+let priceUnit = '公斤';
+const priceSeriesCache = {}; // `${vege_id}:${days}` -> 每日價格
 let chartInstances = {}; // 用於存儲圖表實例
 
 // DOM 元素
@@ -75,90 +81,142 @@ function showSection(sectionId) {
     window.scrollTo(0, 0); // 新增滾動到頂部
 }
 
+// 依序取得分頁 JSON API 的所有項目
+async function fetchAllPages(url) {
+    const items = [];
+    for (let page = 1; ; page++) {
+        const response = await fetch(`${url}${url.includes('?') ? '&' : '?'}page=${page}`);
+        if (!response.ok) throw new Error(`${url} 回傳 ${response.status}`);
+        const data = await response.json();
+        items.push(...data.items);
+        if (page >= data.pages) return items;
+    }
+}
+
 // 讀取蔬菜名稱對照表 (修改為 Promise 函式)
 async function loadVegNameMapping() {
     try {
-        const response = await fetch('/api/csv/veg_name.csv');
-        const csvText = await response.text();
-        const lines = csvText.split('\n');
-
-        // 修正重點：移除跳過第一行的條件判斷
-        // 現在程式碼會從 index=0 的第一行開始處理
-        lines.forEach((line, index) => {
-            if (!line.trim()) return; // 只跳過空行
-            const [chinese, english] = line.split(',');
-            if (chinese && english) {
-                vegNameMapping[chinese.trim()] = english.trim();
-            }
+        const names = await fetchAllPages('/api/v1/vegetable-names?fields=name,english_name&per_page=200');
+        names.forEach(({ name, english_name }) => {
+            vegNameMapping[name] = english_name;
         });
-
-        // 這裡可以保留之前的偵錯程式碼，以確認所有資料都已正確載入
-        console.log('--- 開始檢查 vegNameMapping ---');
         console.log('讀取到的蔬菜數量:', Object.keys(vegNameMapping).length);
-        console.log('讀取到的蔬菜名稱對照表:', vegNameMapping);
-        console.log('--- 檢查結束 ---');
-
-        generateVegetablesData();
     } catch (error) {
         console.error('載入蔬菜名稱對照表失敗:', error);
         // 如果載入失敗，使用預設值
         vegNameMapping = { '大白菜': 'Chinese Cabbage', '青江菜': 'Bok Choy', '空心菜': 'Water Spinach', '地瓜葉': 'Sweet Potato Leaves', '番茄': 'Tomato', '黃瓜': 'Cucumber' };
-        generateVegetablesData();
+    }
+    await Promise.all([loadVegetableDetails(), loadPriceSummaries()]);
+    generateVegetablesData();
+}
+
+// 讀取可辨識蔬菜的營養成分與產季（無法連接資料庫時保留預設值）
+async function loadVegetableDetails() {
+    try {
+        const items = await fetchAllPages('/api/v1/vegetables?recognizable=1&fields=id,name,nutrients,season&per_page=200');
+        items.forEach(({ id, name, nutrients, season }) => {
+            vegIds[name] = id;
+            vegNutrients[name] = nutrients;
+            vegSeasons[name] = season;
+        });
+    } catch (error) {
+        console.error('載入蔬菜營養成分與產季失敗:', error);
+    }
+}
+
+// 讀取所有蔬菜最近 7 天的批發價格統計（尚無價格資料時顯示「--」）
+async function loadPriceSummaries() {
+    try {
+        const response = await fetch('/api/prices?days=7');
+        if (!response.ok) throw new Error(`/api/prices 回傳 ${response.status}`);
+        const data = await response.json();
+        priceUnit = data.unit.split('/').pop();
+        data.items.forEach(summary => {
+            priceSummaries[summary.vege_id] = summary;
+        });
+    } catch (error) {
+        console.error('載入價格資料失敗:', error);
     }
 }
-// 讀取食譜資料 (修改為 Promise 函式)
+
+// 讀取某蔬菜最近 days 天的每日價格，同一區間只讀取一次
+async function loadPriceSeries(vegeId, days) {
+    const key = `${vegeId}:${days}`;
+    if (!priceSeriesCache[key]) {
+        priceSeriesCache[key] = fetch(`/api/prices/${vegeId}?days=${days}`).then(response => {
+            if (!response.ok) throw new Error(`/api/prices/${vegeId} 回傳 ${response.status}`);
+            return response.json();
+        }).then(data => data.series).catch(error => {
+            delete priceSeriesCache[key];
+            throw error;
+        });
+    }
+    return priceSeriesCache[key];
+}
+
+// 讀取食譜資料 (修改為 Promise 函式)；步驟在開啟食譜頁時才讀取
 async function loadRecipesData() {
     try {
-        const response = await fetch('/api/csv/大白菜_清理後食譜.csv');
-        const csvText = await response.text();
-        recipes = csvText.split('\n').slice(1).map((line, index) => {
-            if (!line.trim()) return null;
-            const columns = parseCSVLine(line);
-            if (columns.length < 7) return null;
-            const [id, name, url, preview_ingredients, ingredients, steps] = columns;
-            return {
-                id: parseInt(id) || (index + 1000), name,
-                image: `https://source.unsplash.com/400x300/?food,dish,${parseInt(id)}`,
-                ingredients: ingredients.split('|').map(item => ({ name: item.trim().split(' ')[0], amount: item.trim().split(' ').slice(1).join(' ') || '適量' })),
-                description: preview_ingredients.substring(0, 80) + '...', // 增加描述長度
-                cookTime: '30分鐘', difficulty: '簡單', servings: '2-3人份',
-                steps: steps.split('|').map((step, stepIndex) => ({ step: stepIndex + 1, description: step.trim(), image: `https://source.unsplash.com/400x300/?cooking,step,${parseInt(id) + stepIndex}` })),
-            };
-        }).filter(Boolean);
+        const items = await fetchAllPages('/api/v1/recipes?fields=id,name,preview,ingredients&per_page=200');
+        recipes = items.map(({ id, name, preview, ingredients }) => ({
+            id, name,
+            image: `https://source.unsplash.com/400x300/?food,dish,${id}`,
+            ingredients,
+            description: preview.substring(0, 80) + '...', // 增加描述長度
+            cookTime: '30分鐘', difficulty: '簡單', servings: '2-3人份',
+            steps: null,
+        }));
         renderRecipes();
     } catch (error) {
         console.error('載入食譜資料失敗:', error);
     }
 }
 
-// 解析CSV行
-function parseCSVLine(line) {
-    const result = [];
-    let current = '', inQuotes = false;
-    for (const char of line) {
-        if (char === '"') inQuotes = !inQuotes;
-        else if (char === ',' && !inQuotes) { result.push(current.trim()); current = ''; }
-        else current += char;
-    }
-    result.push(current.trim());
-    return result;
+// 讀取單一食譜的步驟
+async function loadRecipeSteps(recipe) {
+    const response = await fetch(`/api/v1/recipes/${recipe.id}?fields=steps`);
+    if (!response.ok) throw new Error(`食譜 ${recipe.id} 回傳 ${response.status}`);
+    const { steps } = await response.json();
+    recipe.steps = steps.map(({ step, description }) => ({
+        step, description, image: `https://source.unsplash.com/400x300/?cooking,step,${recipe.id + step - 1}`,
+    }));
+}
+
+// 將 API 的營養成分欄位轉成畫面使用的名稱；資料庫沒有的項目沿用示意數值
+function buildNutrition(nutrients = {}) {
+    const pick = (column, fallback) => nutrients[column] ?? fallback;
+    return {
+        '熱量': pick('calories_kcal', Math.round(15 + Math.random() * 35)),
+        '纖維': pick('fiber_g', Math.round((1 + Math.random() * 4) * 10) / 10),
+        '維生素C': pick('vitamin_c_mg', Math.round(10 + Math.random() * 90)),
+        '維生素A': pick('vitamin_a_iu', Math.round(Math.random() * 500)),
+        '鐵質': pick('iron_mg', Math.round((0.3 + Math.random() * 2.7) * 10) / 10),
+        '鈣質': pick('calcium_mg', Math.round(10 + Math.random() * 140)),
+    };
 }
 
-// 生成蔬菜假資料
+// 漲跌幅的顯示文字與樣式
+function formatPriceChange(changePct) {
+    if (changePct === null || changePct === undefined) return '--';
+    return `${changePct >= 0 ? '+' : ''}${changePct.toFixed(1)}%`;
+}
+
+function priceChangeClass(priceChange) {
+    if (priceChange.startsWith('+')) return 'increase';
+    return priceChange.startsWith('-') ? 'decrease' : '';
+}
+
+// 生成蔬菜資料
 function generateVegetablesData() {
     const vegNames = Object.keys(vegNameMapping);
-    const seasons = ['春季', '夏季', '秋季', '冬季', '四季'];
     vegetables = vegNames.map((name, index) => {
-        const basePrice = 20 + Math.random() * 40;
-        const priceHistory = Array.from({ length: 30 }, (_, i) => Math.max(10, Math.round(basePrice + (Math.random() - 0.5) * (15 - i * 0.4))));
-        const currentPrice = priceHistory[priceHistory.length - 1];
-        const previousPrice = priceHistory[priceHistory.length - 2];
-        const priceChange = ((currentPrice - previousPrice) / previousPrice * 100).toFixed(1);
+        const vegeId = vegIds[name] ?? null;
+        const summary = vegeId !== null ? priceSummaries[vegeId] : undefined;
 
         return {
-            id: index + 1, name, image: `/api/image/${name}.jpg`, description: `新鮮${name}，營養豐富，是您餐桌上的最佳選擇。`,
-            nutrition: { '熱量': Math.round(15 + Math.random() * 35), '纖維': Math.round((1 + Math.random() * 4) * 10) / 10, '維生素C': Math.round(10 + Math.random() * 90), '維生素A': Math.round(Math.random() * 500), '鐵質': Math.round((0.3 + Math.random() * 2.7) * 10) / 10, '鈣質': Math.round(10 + Math.random() * 140) },
-            priceHistory, currentPrice, priceChange: `${priceChange >= 0 ? '+' : ''}${priceChange}%`, season: seasons[Math.floor(Math.random() * seasons.length)],
+            id: index + 1, vegeId, name, image: `/api/image/${name}.jpg?w=480`, description: `新鮮${name}，營養豐富，是您餐桌上的最佳選擇。`,
+            nutrition: buildNutrition(vegNutrients[name]),
+            currentPrice: summary ? summary.latest_price : '--', priceChange: formatPriceChange(summary?.change_pct), season: vegSeasons[name] || null,
         };
     });
     renderVegetables();
@@ -177,7 +235,7 @@ function renderVegetables() {
                 <p>${veg.description}</p>
                 <div class="price-info">
                     <span class="current-price">NT$ ${veg.currentPrice}</span>
-                    <span class="price-change ${veg.priceChange.includes('+') ? 'increase' : 'decrease'}">
+                    <span class="price-change ${priceChangeClass(veg.priceChange)}">
                         ${veg.priceChange}
                     </span>
                 </div>
@@ -198,7 +256,7 @@ function renderPricePredictions() {
                     <h3>${veg.name}</h3>
                     <div class="price-info">
                         <span>當前價格: NT$ ${veg.currentPrice}</span>
-                        <span class="${veg.priceChange.includes('+') ? 'increase' : 'decrease'}">${veg.priceChange}</span>
+                        <span class="${priceChangeClass(veg.priceChange)}">${veg.priceChange}</span>
                     </div>
                 </div>
             </div>
@@ -223,7 +281,7 @@ function renderPricePredictions() {
 }
 
 // 通用的圖表更新函式
-function updatePriceChart(event, canvasId, vegId, days, btnElement = null) {
+async function updatePriceChart(event, canvasId, vegId, days, btnElement = null) {
     if (event) event.stopPropagation();
     const vegetable = vegetables.find(v => v.id === vegId);
     if (!vegetable) return;
@@ -235,10 +293,19 @@ function updatePriceChart(event, canvasId, vegId, days, btnElement = null) {
         btnElement.classList.add('active');
     }
 
-    const history = vegetable.priceHistory;
-    const data = history.slice(Math.max(0, history.length - days));
-    const labels = Array.from({ length: data.length }, (_, i) => `前${data.length - i}天`);
-    renderLineChart(canvas, labels, data, '價格', false);
+    if (vegetable.vegeId === null) return;
+
+    let series;
+    try {
+        series = await loadPriceSeries(vegetable.vegeId, days);
+    } catch (error) {
+        console.error('載入價格走勢失敗:', error);
+        return;
+    }
+    // 休市日的價格為 null，圖上留空
+    const labels = series.map(point => point.date.slice(5));
+    const data = series.map(point => point.price);
+    renderLineChart(canvas, labels, data, `價格 (元/${priceUnit})`, false);
 }
 
 // Chart.js 渲染線圖
@@ -269,7 +336,7 @@ function renderRecipes() {
     if (!grid) return;
     grid.innerHTML = recipes.map(recipe => `
         <div class="recipe-card" onclick="showRecipeDetail(${recipe.id}, true)" data-name="${recipe.name.toLowerCase()}" data-ingredients="${recipe.ingredients.map(i => i.name).join(',').toLowerCase()}">
-            <img src="/api/image/${recipe.name}.jpg" alt="${recipe.name}" loading="lazy">
+            <img src="/api/image/${recipe.name}.jpg?w=480" alt="${recipe.name}" loading="lazy">
             <div class="card-content">
                 <h3>${recipe.name}</h3>
                 <p>${recipe.description}</p>
@@ -308,17 +375,17 @@ function showVegetableDetail(id, pushState = true) {
                 <button class="btn btn-primary" onclick="goBackToOverview()"><i class="fas fa-arrow-left"></i> 返回蔬菜總覽</button>
             </div>
             <header class="detail-header">
-                <img src="/api/image/${vegetable.name}.jpg" alt="${vegetable.name}" class="detail-header-image">
+                <img src="/api/image/${vegetable.name}.jpg?w=1040" alt="${vegetable.name}" class="detail-header-image">
                 <div class="detail-header-info">
                     <h1>${vegetable.name}</h1>
                     <p class="description">${vegetable.description}</p>
                     <div class="tags">
-                        <span class="tag">${vegetable.season}盛產</span>
-                        <span class="tag price-change-tag ${vegetable.priceChange.includes('+') ? 'increase' : 'decrease'}">
+                        ${vegetable.season ? `<span class="tag">${vegetable.season}盛產</span>` : ''}
+                        <span class="tag price-change-tag ${priceChangeClass(vegetable.priceChange)}">
                             ${vegetable.priceChange}
                         </span>
                     </div>
-                    <div class="current-price">目前價格：NT$ ${vegetable.currentPrice} / 斤</div>
+                    <div class="current-price">目前價格：NT$ ${vegetable.currentPrice} / ${priceUnit}</div>
                 </div>
             </header>
             
@@ -356,7 +423,7 @@ function showVegetableDetail(id, pushState = true) {
                     <div class="recipes-grid">
                         ${relatedRecipes.map(recipe => `
                             <div class="recipe-card" onclick="showRecipeDetail(${recipe.id}, true)">
-                                <img src="/api/image/${recipe.name}.jpg" alt="${recipe.name}" loading="lazy">
+                                <img src="/api/image/${recipe.name}.jpg?w=480" alt="${recipe.name}" loading="lazy">
                                 <div class="card-content">
                                     <h4>${recipe.name}</h4>
                                     <p><strong>主要食材：</strong>${recipe.ingredients.slice(0, 3).map(ing => ing.name).join('、')}</p>
@@ -390,9 +457,16 @@ function showVegetableDetail(id, pushState = true) {
 }
 
 // 顯示食譜詳細頁面
-function showRecipeDetail(id, pushState = true) {
+async function showRecipeDetail(id, pushState = true) {
     const recipe = recipes.find(r => r.id == id);
     if (!recipe) return;
+    if (!recipe.steps) {
+        try {
+            await loadRecipeSteps(recipe);
+        } catch (error) {
+            console.error('載入食譜步驟失敗:', error);
+        }
+    }
 
     if (pushState) {
         history.pushState({ type: 'recipe', id: id }, '', `/?section=recipe&id=${id}`);
@@ -416,7 +490,7 @@ function showRecipeDetail(id, pushState = true) {
                 <button class="btn btn-primary" onclick="goBackToRecipes()"><i class="fas fa-arrow-left"></i> 返回食譜列表</button>
             </div>
             <header class="detail-header recipe-header">
-                <img src="/api/image/${recipe.name}.jpg" alt="${recipe.name}" class="detail-header-image">
+                <img src="/api/image/${recipe.name}.jpg?w=1040" alt="${recipe.name}" class="detail-header-image">
                 <div class="detail-header-info">
                     <h1>${recipe.name}</h1>
                     <p class="description">${recipe.description}</p>
@@ -443,7 +517,7 @@ function showRecipeDetail(id, pushState = true) {
             <section class="detail-section">
                 <h3><i class="fas fa-shoe-prints"></i> 烹飪步驟</h3>
                 <div class="steps-container">
-                    ${recipe.steps.map(step => `
+                    ${(recipe.steps || []).map(step => `
                         <div class="step-item">
                             <div class="step-number">${step.step}</div>
                             <div class="step-content">
@@ -468,7 +542,7 @@ function showRecipeDetail(id, pushState = true) {
                 <div class="recipes-grid">
                     ${relatedRecipes.map(r => `
                         <div class="recipe-card" onclick="showRecipeDetail(${r.id}, true)">
-                            <img src="/api/image/${r.name}.jpg" alt="${r.name}" loading="lazy">
+                            <img src="/api/image/${r.name}.jpg?w=480" alt="${r.name}" loading="lazy">
                             <div class="card-content">
                                 <h4>${r.name}</h4>
                                 <p><strong>主要食材：</strong>${r.ingredients.slice(0, 3).map(i => i.name).join('、')}</p>
@@ -0,0 +1,203 @@
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WebhookQueue:
+    """
+    行程內的 webhook 工作佇列。
+    - /callback 驗證簽章後把 (body, signature) 放進佇列就立即回應 200。
+    - 固定數量的工作執行緒依序呼叫 process_fn(body, signature) 處理事件。
+    - 設定 spool_dir 時，每筆工作會先寫入磁碟，處理完才刪除；
+      重新啟動後會把尚未處理的工作重新放回佇列。
+    """
+
+    def __init__(self, process_fn, workers=None, max_queue=None, spool_dir=None):
+        self.process_fn = process_fn
+        self.workers = int(workers if workers is not None else os.getenv("WEBHOOK_WORKERS", 4))
+        self.max_queue = int(max_queue if max_queue is not None else os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+        self.spool_dir = spool_dir if spool_dir is not None else os.getenv("WEBHOOK_SPOOL_DIR", "")
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "received": 0,
+            "rejected": 0,
+            "replayed": 0,
+            "processed": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "wait_ms_total": 0.0,
+            "process_ms_total": 0.0,
+            "process_ms_max": 0.0,
+            "last_process_ms": 0.0,
+        }
+
+    def start(self):
+        """啟動工作執行緒，並重新排入 spool 中尚未處理的工作。"""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            if self.spool_dir:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._replay_spool()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info(
+            "Webhook queue started: workers=%s max_queue=%s spool_dir=%s",
+            self.workers, self.max_queue, self.spool_dir or "(disabled)",
+        )
+
+    def submit(self, body, signature):
+        """放入一筆 webhook；佇列已滿時回傳 False。"""
+        self.start()
+        job = {
+            "body": body,
+            "signature": signature,
+            "received_at": time.time(),
+            "spool_path": None,
+        }
+        if self.spool_dir:
+            job["spool_path"] = self._write_spool(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._remove_spool(job)
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            logger.warning("Webhook queue full, rejecting event.")
+            return False
+        with self._stats_lock:
+            self._stats["received"] += 1
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            start = time.time()
+            with self._stats_lock:
+                self._stats["in_flight"] += 1
+                self._stats["wait_ms_total"] += (start - job["received_at"]) * 1000
+            try:
+                self.process_fn(job["body"], job["signature"])
+                ok = True
+            except Exception:
+                logger.exception("Webhook processing failed")
+                ok = False
+            elapsed_ms = (time.time() - start) * 1000
+            # 不論成功與否都移除 spool，避免重啟後重複回覆同一個事件
+            self._remove_spool(job)
+            with self._stats_lock:
+                self._stats["in_flight"] -= 1
+                self._stats["processed" if ok else "failed"] += 1
+                self._stats["process_ms_total"] += elapsed_ms
+                self._stats["process_ms_max"] = max(self._stats["process_ms_max"], elapsed_ms)
+                self._stats["last_process_ms"] = elapsed_ms
+            self._queue.task_done()
+
+    # --- spool ---
+
+    def _spool_name(self, pid=None):
+        return f"{pid or os.getpid()}-{time.time_ns()}-{uuid.uuid4().hex}.json"
+
+    def _write_spool(self, job):
+        path = os.path.join(self.spool_dir, self._spool_name())
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"body": job["body"], "signature": job["signature"], "received_at": job["received_at"]},
+                f,
+                ensure_ascii=False,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def _remove_spool(self, job):
+        path = job.get("spool_path")
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _replay_spool(self):
+        """
+        重新排入本行程或已結束行程留下的 spool 檔。
+        檔名開頭是寫入者的 pid；先以 rename 搶下檔案，避免多個 worker 重複處理。
+        """
+        own_pid = os.getpid()
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.json"))):
+            name = os.path.basename(path)
+            try:
+                owner_pid = int(name.split("-", 1)[0])
+            except ValueError:
+                continue
+            if owner_pid != own_pid and _pid_alive(owner_pid):
+                continue
+            claimed_path = os.path.join(self.spool_dir, self._spool_name(own_pid))
+            try:
+                os.rename(path, claimed_path)
+                with open(claimed_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping spool file %s: %s", name, e)
+                continue
+            job = {
+                "body": data["body"],
+                "signature": data["signature"],
+                "received_at": data.get("received_at", time.time()),
+                "spool_path": claimed_path,
+            }
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                # 佇列已滿就留在磁碟上，下次啟動再處理
+                break
+            with self._stats_lock:
+                self._stats["replayed"] += 1
+
+    def stats(self):
+        """回傳佇列深度與處理延遲等指標。"""
+        with self._stats_lock:
+            s = dict(self._stats)
+        done = s["processed"] + s["failed"]
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize(),
+            "in_flight": s["in_flight"],
+            "received": s["received"],
+            "rejected": s["rejected"],
+            "replayed": s["replayed"],
+            "processed": s["processed"],
+            "failed": s["failed"],
+            "avg_wait_ms": round(s["wait_ms_total"] / done, 2) if done else 0.0,
+            "avg_process_ms": round(s["process_ms_total"] / done, 2) if done else 0.0,
+            "max_process_ms": round(s["process_ms_max"], 2),
+            "last_process_ms": round(s["last_process_ms"], 2),
+            "spool_dir": self.spool_dir or None,
+        }